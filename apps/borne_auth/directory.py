@@ -0,0 +1,162 @@
+import logging
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from core.lru import TTLCache
+from core.shared_cache import cache_partage_actif
+from .models import Agent
+
+logger = logging.getLogger(__name__)
+
+# Marqueur "numéro inconnu" : évite de réinterroger la table pour les prospects
+_ABSENT = 'absent'
+
+
+def normalize_phone(phone):
+    """Numéro national à 9 chiffres (061234567) quel que soit le format reçu"""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-9:] if len(digits) >= 9 else digits
+
+
+@lru_cache(maxsize=None)
+def get_agent_directory():
+    """Annuaire partagé par le processus"""
+    return AgentDirectory(
+        maxsize=settings.AGENT_CACHE_MAXSIZE,
+        ttl=settings.AGENT_CACHE_TTL,
+        shared=cache_partage_actif('AGENT_CACHE_SHARED'),
+    )
+
+
+class AgentDirectory:
+    """
+    Cache read-through des agents de la table partagée 'agents'.
+
+    Un même agent est indexé par id, matricule et téléphone. Niveau 1 :
+    LRU en mémoire avec TTL ; niveau 2 optionnel : cache Django partagé
+    entre workers (AGENT_CACHE_SHARED).
+    """
+
+    def __init__(self, maxsize, ttl, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        self._local = TTLCache(maxsize, ttl)
+
+    # ========================================
+    # LECTURE
+    # ========================================
+
+    def get_by_id(self, agent_id):
+        if not agent_id:
+            return None
+        return self._lookup(f'id:{agent_id}', lambda: Agent.objects.filter(pk=agent_id).first())
+
+    def get_by_matricule(self, matricule):
+        if not matricule:
+            return None
+        return self._lookup(f'mat:{matricule}', lambda: Agent.objects.filter(matricule=matricule).first())
+
+    def get_by_telephone(self, phone):
+        national = normalize_phone(phone)
+        if not national:
+            return None
+
+        def load():
+            # Formats possibles en base : 061234567, +242061234567, 242061234567
+            variants = [national, f'+242{national}', f'242{national}', f'00242{national}']
+            return Agent.objects.filter(telephone__in=variants).first()
+
+        return self._lookup(f'tel:{national}', load)
+
+    def get_many(self, agent_ids):
+        """Retourne {id: Agent} en une seule requête pour les absents du cache"""
+        result = {}
+        missing = []
+        for agent_id in set(filter(None, agent_ids)):
+            agent = self._read(f'id:{agent_id}')
+            if agent is None:
+                missing.append(agent_id)
+            elif agent != _ABSENT:
+                result[agent_id] = agent
+
+        if missing:
+            for agent in Agent.objects.filter(pk__in=missing):
+                self._store(agent)
+                result[agent.pk] = agent
+        return result
+
+    # ========================================
+    # ÉCRITURE / INVALIDATION
+    # ========================================
+
+    def invalidate(self, agent_id=None, matricule=None, telephone=None):
+        """Retire un agent du cache (après une connexion, une mise à jour…)"""
+        keys = []
+        if agent_id:
+            keys.append(f'id:{agent_id}')
+        if matricule:
+            keys.append(f'mat:{matricule}')
+        if telephone:
+            keys.append(f'tel:{normalize_phone(telephone)}')
+        for key in keys:
+            self._local.delete(key)
+            if self.shared:
+                try:
+                    shared_cache.delete(self._shared_key(key))
+                except Exception as e:
+                    logger.warning(f"⚠️ Annuaire partagé indisponible: {e}")
+
+    def warm(self, batch_size=1000):
+        """Charge tous les agents en une passe (itération par lots)"""
+        count = 0
+        for agent in Agent.objects.order_by('pk').iterator(chunk_size=batch_size):
+            self._store(agent)
+            count += 1
+        return count
+
+    def stats(self):
+        return self._local.stats()
+
+    # ========================================
+    # INTERNE
+    # ========================================
+
+    def _lookup(self, key, load):
+        agent = self._read(key)
+        if agent is not None:
+            return None if agent == _ABSENT else agent
+
+        agent = load()
+        if agent is None:
+            self._write(key, _ABSENT, ttl=min(self.ttl, 60))
+        else:
+            self._store(agent)
+        return agent
+
+    def _store(self, agent):
+        for key in (f'id:{agent.pk}', f'mat:{agent.matricule}', f'tel:{normalize_phone(agent.telephone)}'):
+            self._write(key, agent)
+
+    def _read(self, key):
+        value = self._local.get(key)
+        if value is None and self.shared:
+            try:
+                value = shared_cache.get(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f"⚠️ Annuaire partagé indisponible: {e}")
+            if value is not None:
+                self._local.set(key, value)
+        return value
+
+    def _write(self, key, value, ttl=None):
+        self._local.set(key, value, ttl=ttl)
+        if self.shared:
+            try:
+                shared_cache.set(self._shared_key(key), value, timeout=ttl or self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Annuaire partagé indisponible: {e}")
+
+    @staticmethod
+    def _shared_key(key):
+        return f'agents:{key}'
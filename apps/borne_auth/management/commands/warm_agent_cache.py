@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.borne_auth.directory import get_agent_directory
+
+
+class Command(BaseCommand):
+    help = "Précharge l'annuaire des agents (id, matricule, téléphone) dans le cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        directory = get_agent_directory()
+        if not directory.shared:
+            self.stdout.write(self.style.WARNING(
+                "⚠️ AGENT_CACHE_SHARED désactivé : seul le cache de ce processus sera chargé."
+            ))
+
+        start = time.monotonic()
+        count = directory.warm(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {count} agent(s) chargé(s) en {time.monotonic() - start:.1f}s"
+        ))
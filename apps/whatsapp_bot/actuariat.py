@@ -0,0 +1,395 @@
+"""
+Moteur tarifaire local du simulateur (retraite, pensions, prévoyance, études).
+
+Les colonnes de commutation (Dx, Nx, Cx, Mx) sont calculées une seule fois
+par processus à partir de la table de mortalité et du taux technique : un
+calcul de prime se réduit ensuite à quelques lectures d'index.
+
+Les résultats reprennent les champs `resultats_simulation` du calculateur
+distant ; l'écart entre les deux est suivi par le mode 'shadow' (paires
+enregistrées en base) et la commande `verify_simulateur`.
+
+La table par défaut (Gompertz-Makeham) n'est pas calibrée sur le tarif NSIA :
+un produit n'est servi en local qu'une fois validé contre des réponses
+enregistrées du calculateur (SIMULATEUR_REFERENCE), voir produits_valides().
+"""
+import csv
+import json
+import logging
+import math
+from functools import lru_cache
+from django.conf import settings
+from .metrics import metrics
+from .models import SimulationShadow
+
+logger = logging.getLogger(__name__)
+
+AGE_MAX = 110
+
+# Durée de service de la rente (années) versée aux bénéficiaires, par formule
+DUREES_SERVICE_PENSION = {
+    'pension_securite': 5,
+    'pension_confort': 10,
+    'pension_renfort': 15,
+}
+
+# Champs numériques comparés en mode shadow, par produit
+CHAMPS_COMPARES = {
+    'retraite': ['capital_garanti', 'prime_totale', 'prime_epargne', 'prime_deces'],
+    'pension': ['prime_totale', 'duree_couverture', 'duree_service'],
+    'prevoyance': ['Prime_Commerciale', 'Frais_Accessoire', 'total_prime_periodique', 'capital_deces'],
+    'etudes': ['prime_annuelle', 'prime_mensuelle', 'montant_rente_annuel', 'duree_paiement', 'duree_service'],
+}
+
+PRODUITS = ('retraite', *DUREES_SERVICE_PENSION, 'prevoyance', 'etudes')
+
+
+class ActuariatError(ValueError):
+    """Paramètres hors du domaine du moteur local (âge, durée, produit…)"""
+
+
+# ========================================
+# TABLES
+# ========================================
+
+class TableMortalite:
+    """Survivants lx indexés par âge (0 → AGE_MAX)"""
+
+    def __init__(self, lx):
+        self.lx = lx
+
+    @classmethod
+    def gompertz_makeham(cls, a, b, c):
+        """Loi μx = a + b·c^x (table théorique par défaut)"""
+        lx = [100000.0]
+        for x in range(AGE_MAX):
+            # Probabilité de survie sur [x, x+1] : exp(-∫μ)
+            survie = math.exp(-a - b * c ** x * (c - 1) / math.log(c))
+            lx.append(lx[-1] * survie)
+        return cls(lx)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Fichier CSV 'age,lx' ou 'age,qx' (en-tête obligatoire)"""
+        with open(path, newline='', encoding='utf-8') as fh:
+            rows = {int(r['age']): r for r in csv.DictReader(fh)}
+
+        if 'lx' in next(iter(rows.values())):
+            lx = [float(rows[x]['lx']) if x in rows else 0.0 for x in range(AGE_MAX + 1)]
+        else:
+            lx = [100000.0]
+            for x in range(AGE_MAX):
+                qx = float(rows[x]['qx']) if x in rows else 1.0
+                lx.append(lx[-1] * (1 - qx))
+        return cls(lx)
+
+
+class Commutations:
+    """Colonnes de commutation au taux technique `taux`"""
+
+    def __init__(self, table, taux):
+        self.taux = taux
+        self.v = 1 / (1 + taux)
+        lx = table.lx
+        n = len(lx)
+
+        self.D = [lx[x] * self.v ** x for x in range(n)]
+        self.C = [(lx[x] - lx[x + 1]) * self.v ** (x + 1) for x in range(n - 1)] + [0.0]
+        # Nx = Σ Dy (y ≥ x), Mx = Σ Cy (y ≥ x) : sommes cumulées depuis la fin
+        self.N = [0.0] * (n + 1)
+        self.M = [0.0] * (n + 1)
+        for x in range(n - 1, -1, -1):
+            self.N[x] = self.N[x + 1] + self.D[x]
+            self.M[x] = self.M[x + 1] + self.C[x]
+
+    def _verifier(self, x, n):
+        if x < 0 or n <= 0 or x + n > AGE_MAX or self.D[x] <= 0:
+            raise ActuariatError(f"Âge {x} / durée {n} hors table")
+
+    def annuite(self, x, n):
+        """ä(x:n) : rente viagère temporaire payable d'avance"""
+        self._verifier(x, n)
+        return (self.N[x] - self.N[x + n]) / self.D[x]
+
+    def assurance_deces(self, x, n):
+        """A¹(x:n) : capital 1 payé en cas de décès avant x+n"""
+        self._verifier(x, n)
+        return (self.M[x] - self.M[x + n]) / self.D[x]
+
+    def annuite_certaine_mensuelle(self, n):
+        """Valeur actuelle de 12 mensualités de 1 par an pendant n ans (d'avance)"""
+        v_mois = self.v ** (1 / 12)
+        if self.taux == 0:
+            return 12 * n
+        return (1 - self.v ** n) / (1 - v_mois)
+
+
+# ========================================
+# MOTEUR
+# ========================================
+
+@lru_cache(maxsize=None)
+def get_moteur():
+    """Moteur chargé une fois par processus (tables + commutations)"""
+    if settings.SIMULATEUR_TABLE_MORTALITE:
+        table = TableMortalite.from_csv(settings.SIMULATEUR_TABLE_MORTALITE)
+    else:
+        table = TableMortalite.gompertz_makeham(*settings.SIMULATEUR_GOMPERTZ_MAKEHAM)
+    moteur = MoteurTarifaire(
+        Commutations(table, settings.SIMULATEUR_TAUX_TECHNIQUE),
+        chargement_gestion=settings.SIMULATEUR_CHARGEMENT_GESTION,
+        chargement_epargne=settings.SIMULATEUR_CHARGEMENT_EPARGNE,
+        frais_accessoires=settings.SIMULATEUR_FRAIS_ACCESSOIRES,
+    )
+    logger.info(f"🧮 Moteur tarifaire local chargé (taux {settings.SIMULATEUR_TAUX_TECHNIQUE:.2%})")
+    return moteur
+
+
+class MoteurTarifaire:
+    """Calcule `resultats_simulation` à partir des `parametres_simulation` du calculateur distant"""
+
+    def __init__(self, commutations, chargement_gestion, chargement_epargne, frais_accessoires):
+        self.com = commutations
+        self.chargement_gestion = chargement_gestion
+        self.chargement_epargne = chargement_epargne
+        self.frais_accessoires = frais_accessoires
+
+    def calculer(self, produit, parametres):
+        try:
+            if produit == 'retraite':
+                res = self.retraite(parametres)
+            elif produit in DUREES_SERVICE_PENSION:
+                res = self.pension(produit, parametres)
+            elif produit == 'prevoyance':
+                res = self.prevoyance(parametres)
+            elif produit == 'etudes':
+                res = self.etudes(parametres)
+            else:
+                raise ActuariatError(f"Produit non supporté : {produit}")
+        except (KeyError, TypeError) as e:
+            raise ActuariatError(f"Paramètre manquant ou invalide : {e}") from e
+
+        return {
+            'resultats_simulation': res,
+            'moteur': 'local',
+            'tarif_version': settings.SIMULATEUR_TARIF_VERSION,
+        }
+
+    def _prime_deces_annuelle(self, age, duree, capital):
+        """Prime annuelle commerciale d'une temporaire décès"""
+        nette = capital * self.com.assurance_deces(age, duree) / self.com.annuite(age, duree)
+        return nette * (1 + self.chargement_gestion)
+
+    def retraite(self, p):
+        age, duree = int(p['age']), int(p['duree'])
+        prime_totale = float(p['prime_periodique_commerciale'])
+
+        prime_deces = self._prime_deces_annuelle(age, duree, float(p['capital_deces'])) / 12
+        prime_epargne = max(prime_totale - prime_deces, 0.0)
+
+        # Capitalisation mensuelle de l'épargne nette de chargements
+        j = (1 + self.com.taux) ** (1 / 12) - 1
+        mois = 12 * duree
+        facteur = ((1 + j) ** mois - 1) / j * (1 + j) if j else mois
+        capital_garanti = prime_epargne * (1 - self.chargement_epargne) * facteur
+
+        return {
+            'capital_garanti': round(capital_garanti),
+            'prime_totale': round(prime_totale),
+            'prime_epargne': round(prime_epargne),
+            'prime_deces': round(prime_deces),
+            'duree': duree,
+            'periodicite': p.get('periodicite', 'Mensuelle'),
+        }
+
+    def pension(self, produit, p):
+        age, duree = int(p['age']), int(p['duree_couverture'])
+        duree_service = DUREES_SERVICE_PENSION[produit]
+
+        # Rente mensuelle versée aux bénéficiaires en cas de décès pendant la couverture
+        capital = float(p['montant_mensuel_pension']) * self.com.annuite_certaine_mensuelle(duree_service)
+        prime = self._prime_deces_annuelle(age, duree, capital) / 12
+
+        return {
+            'prime_totale': round(prime),
+            'duree_couverture': duree,
+            'duree_service': duree_service,
+            'montant_mensuel_pension': round(float(p['montant_mensuel_pension'])),
+            'periodicite': p.get('periodicite', 'Mensuelle'),
+        }
+
+    def prevoyance(self, p):
+        age, duree = int(p['age']), int(p['duree'])
+        capital = float(p['capital_deces'])
+        prime = self._prime_deces_annuelle(age, duree, capital)
+
+        return {
+            'Prime_Commerciale': round(prime),
+            'Frais_Accessoire': round(self.frais_accessoires),
+            'total_prime_periodique': round(prime + self.frais_accessoires),
+            'capital_deces': round(capital),
+            'duree': duree,
+        }
+
+    def etudes(self, p):
+        age_parent = int(p['age_parent'])
+        duree_paiement, duree_service = int(p['duree_paiement']), int(p['duree_service'])
+        rente = float(p['montant_rente'])
+
+        # Rente certaine différée de la durée de paiement, garantie même en cas de décès du parent
+        valeur_rente = sum(rente * self.com.v ** (duree_paiement + k) for k in range(duree_service))
+        prime_annuelle = valeur_rente * (1 + self.chargement_gestion) / self.com.annuite(age_parent, duree_paiement)
+
+        return {
+            'prime_annuelle': round(prime_annuelle),
+            'prime_mensuelle': round(prime_annuelle / 12),
+            'montant_rente_annuel': round(rente),
+            'duree_paiement': duree_paiement,
+            'duree_service': duree_service,
+        }
+
+
+def calculer(produit, parametres):
+    return get_moteur().calculer(produit, parametres)
+
+
+def calculer_lot(produit, cases):
+    """Cases d'une grille calculées d'un seul tenant par le moteur chargé (None si hors domaine)"""
+    moteur = get_moteur()
+    resultats = []
+    for parametres in cases:
+        try:
+            resultats.append(moteur.calculer(produit, parametres))
+        except ActuariatError:
+            resultats.append(None)
+    return resultats
+
+
+# ========================================
+# MODE SHADOW
+# ========================================
+
+def comparer(produit, local, distant, tolerance):
+    """Liste des écarts relatifs (champ, local, distant, écart) au-delà de `tolerance`"""
+    champs = CHAMPS_COMPARES['pension' if produit in DUREES_SERVICE_PENSION else produit]
+    ecarts = []
+    for champ in champs:
+        try:
+            a, b = float(local.get(champ, 0)), float(distant.get(champ, 0))
+        except (TypeError, ValueError):
+            continue
+        ecart = abs(a - b) / max(abs(b), 1.0)
+        if ecart > tolerance:
+            ecarts.append((champ, a, b, ecart))
+    return ecarts
+
+
+def shadow(produit, parametres, resultat_distant):
+    """Calcule en local, compte les divergences et enregistre la paire en base (sans jamais lever)"""
+    try:
+        distant = resultat_distant.get('resultats_simulation', {})
+        local, ecart_max, ecarts = None, None, []
+        try:
+            with metrics.timer('simulateur.local'):
+                local = calculer(produit, parametres)['resultats_simulation']
+        except ActuariatError as e:
+            metrics.incr('simulateur.shadow.unsupported')
+            logger.info(f"ℹ️ Moteur local non applicable ({produit}) : {e}")
+        else:
+            ecarts = comparer(produit, local, distant, settings.SIMULATEUR_SHADOW_TOLERANCE)
+            ecart_max = max((e for _, _, _, e in comparer(produit, local, distant, 0)), default=0.0)
+            if ecarts:
+                metrics.incr('simulateur.shadow.divergence')
+                details = ', '.join(f"{c}: {a:.0f} vs {b:.0f} ({e:.1%})" for c, a, b, e in ecarts)
+                logger.warning(f"⚠️ Divergence moteur local ({produit}) : {details}")
+            else:
+                metrics.incr('simulateur.shadow.match')
+
+        SimulationShadow.objects.create(
+            produit=produit,
+            tarif_version=settings.SIMULATEUR_TARIF_VERSION,
+            requete={'parametres_simulation': parametres},
+            reponse=resultat_distant,
+            local=local,
+            ecart_max=ecart_max,
+            divergent=bool(ecarts),
+        )
+    except Exception as e:
+        logger.error(f"❌ Erreur mode shadow ({produit}): {e}", exc_info=True)
+
+
+# ========================================
+# VALIDATION CONTRE LE CALCULATEUR
+# ========================================
+
+def charger_reference(chemin, tarif_version=None):
+    """
+    Réponses enregistrées du calculateur (export_simulateur_reference).
+
+    Fichier JSON {"cas": [{produit, tarif_version, requete, reponse}, …]} ;
+    seuls les cas du tarif demandé (courant par défaut) sont retenus.
+    """
+    tarif_version = tarif_version or settings.SIMULATEUR_TARIF_VERSION
+    with open(chemin, encoding='utf-8') as fh:
+        cas = json.load(fh).get('cas', [])
+    return [c for c in cas if c.get('tarif_version') == tarif_version]
+
+
+def verifier(cas, tolerance):
+    """
+    Rejoue des réponses enregistrées sur le moteur local.
+
+    Retourne, par produit : total, conformes (ok), hors domaine, divergences
+    (index du cas, écarts au-delà de `tolerance`) et écart max par champ.
+    """
+    rapport = {}
+    for index, c in enumerate(cas):
+        produit = c['produit']
+        stats = rapport.setdefault(produit, {'total': 0, 'ok': 0, 'hors_domaine': 0, 'divergences': [], 'ecart_max': {}})
+        stats['total'] += 1
+        try:
+            local = calculer(produit, c['requete']['parametres_simulation'])['resultats_simulation']
+        except ActuariatError:
+            stats['hors_domaine'] += 1
+            continue
+
+        distant = c['reponse'].get('resultats_simulation', {})
+        for champ, _, _, ecart in comparer(produit, local, distant, 0):
+            stats['ecart_max'][champ] = max(stats['ecart_max'].get(champ, 0), ecart)
+        ecarts = comparer(produit, local, distant, tolerance)
+        if ecarts:
+            stats['divergences'].append((index, ecarts))
+        else:
+            stats['ok'] += 1
+    return rapport
+
+
+@lru_cache(maxsize=None)
+def produits_valides():
+    """
+    Produits que le mode 'local' peut servir (évalué une fois par processus).
+
+    Un produit est validé quand au moins SIMULATEUR_REFERENCE_MIN_CAS
+    réponses enregistrées du calculateur, pour le tarif courant, sont
+    reproduites dans SIMULATEUR_SHADOW_TOLERANCE et qu'aucune ne diverge (les
+    cas hors domaine repassent de toute façon par l'API). Les autres restent
+    servis par l'API en mode shadow, ce qui enregistre de nouvelles références.
+    """
+    try:
+        cas = charger_reference(settings.SIMULATEUR_REFERENCE)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Références du calculateur illisibles ({settings.SIMULATEUR_REFERENCE}): {e}")
+        cas = []
+
+    rapport = verifier(cas, settings.SIMULATEUR_SHADOW_TOLERANCE)
+    valides = frozenset(
+        produit for produit, stats in rapport.items()
+        if stats['ok'] >= settings.SIMULATEUR_REFERENCE_MIN_CAS and not stats['divergences']
+    )
+    refuses = [p for p in PRODUITS if p not in valides]
+    if refuses:
+        logger.warning(
+            f"⚠️ Moteur local non validé (tarif {settings.SIMULATEUR_TARIF_VERSION}) pour "
+            f"{', '.join(refuses)} : servi par l'API en mode shadow"
+        )
+    return valides
@@ -1,9 +1,20 @@
 from django.contrib import admin
-from .models import WhatsAppSession, WhatsAppMessage
+from django.utils.html import format_html
+import json
+from .models import (
+    WhatsAppSession, WhatsAppMessage, ArchivedMessage, ConversationJob, OutboundMessage, GeminiCacheEntry,
+    SimulationShadow,
+)
+from .storage import decompress_payload
+
+def _is_changelist(request):
+    return bool(request.resolver_match) and request.resolver_match.url_name.endswith('_changelist')
+
 
 @admin.register(WhatsAppSession)
 class WhatsAppSessionAdmin(admin.ModelAdmin):
-    list_display = ['phone_number', 'agent', 'current_state', 'is_active', 'last_activity']
+    list_display = ['phone_number', 'agent_display', 'current_state', 'is_active', 'last_activity']
+    list_select_related = ['agent']
     list_filter = ['current_state', 'is_active', 'created_at']
     search_fields = ['phone_number', 'agent__matricule', 'agent__nom', 'agent__prenom']
     readonly_fields = ['created_at', 'last_activity']
@@ -20,13 +31,92 @@ class WhatsAppSessionAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'last_activity')
         }),
     )
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if _is_changelist(request):
+            qs = qs.defer('context')  # contexte JSON inutile pour la liste
+        return qs
+    
+    @admin.display(description='Agent', ordering='agent')
+    def agent_display(self, obj):
+        return obj.agent_from_directory() or '-'
 
 @admin.register(WhatsAppMessage)
 class WhatsAppMessageAdmin(admin.ModelAdmin):
-    list_display = ['session', 'direction', 'message_type', 'timestamp']
-    list_filter = ['direction', 'message_type', 'timestamp']
+    list_display = ['session', 'direction', 'message_type', 'delivery_status', 'timestamp']
+    list_select_related = ['session', 'session__agent']
+    list_filter = ['direction', 'message_type', 'delivery_status', 'timestamp']
     search_fields = ['session__phone_number', 'whatsapp_message_id']
-    readonly_fields = ['timestamp']
+    readonly_fields = ['timestamp', 'payload_brut']
+    exclude = ['raw_payload']
+    
+    def has_add_permission(self, request):
+        return False  # Pas de création manuelle
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if _is_changelist(request):
+            qs = qs.defer('content', 'raw_payload', 'session__context')
+        return qs
     
+    @admin.display(description='Payload brut')
+    def payload_brut(self, obj):
+        data = decompress_payload(obj.raw_payload)
+        if data is None:
+            return '-'
+        return format_html('<pre>{}</pre>', json.dumps(data, indent=2, ensure_ascii=False))
+
+@admin.register(ConversationJob)
+class ConversationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'session', 'status', 'attempts', 'received_at', 'latency_ms']
+    list_select_related = ['session', 'session__agent']
+    list_filter = ['status']
+    search_fields = ['session__phone_number']
+    readonly_fields = ['received_at', 'started_at', 'finished_at', 'latency_ms', 'last_error']
+    raw_id_fields = ['session', 'message']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(OutboundMessage)
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'phone', 'status', 'attempts', 'http_status', 'created_at', 'latency_ms']
+    list_filter = ['status']
+    search_fields = ['phone', 'wassenger_message_id']
+    readonly_fields = ['created_at', 'started_at', 'sent_at', 'latency_ms', 'last_error', 'wassenger_message_id']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(GeminiCacheEntry)
+class GeminiCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['gabarit', 'tokens', 'created_at', 'expires_at']
+    search_fields = ['gabarit']
+    readonly_fields = ['cle', 'gabarit', 'reponse', 'tokens', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(admin.ModelAdmin):
+    list_display = ['mois', 'session_id', 'direction', 'message_type', 'timestamp']
+    list_filter = ['mois', 'direction']
+    search_fields = ['session_id', 'whatsapp_message_id']
+    readonly_fields = [f.name for f in ArchivedMessage._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SimulationShadow)
+class SimulationShadowAdmin(admin.ModelAdmin):
+    list_display = ['produit', 'tarif_version', 'ecart_max', 'divergent', 'created_at']
+    list_filter = ['tarif_version', 'produit', 'divergent']
+    readonly_fields = [f.name for f in SimulationShadow._meta.fields]
+
     def has_add_permission(self, request):
-        return False  # Pas de création manuelle
\ No newline at end of file
+        return False
@@ -1,45 +1,126 @@
-import requests
+import hashlib
 import json
 import logging
+from functools import lru_cache
 from django.conf import settings
+from . import http_client
+from .gemini_batch import get_gemini_batcher
+from .gemini_cache import get_gemini_cache
+from .metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+MODELE = 'gemini-1.5-flash'
+
+PROMPT_INTENTION = """
+    Tu es un assistant expert pour NSIA Vie Assurances. Ton rôle est d'analyser les messages des agents commerciaux sur WhatsApp.
+    Analyse le message et retourne UNQUEMENT un objet JSON avec les clés suivantes :
+    - intent : L'intention détectée parmi [SUBSCRIBE_PASS, CHECK_COMMISSIONS, RUN_SIMULATION, UNKNOWN]
+    - product : Le produit mentionné (ex: BATELA, KIMIA, SALISA, RETRAITE, ETUDES) ou null
+    - client_name : Le nom du client mentionné ou null
+    - amount : Le montant ou la prime mentionnée ou null
+    - confidence : Ton score de confiance (0 à 1)
+
+    Guide de mapping :
+    - "Je veux inscrire", "Souscription", "Pass", "Prendre un contrat" -> SUBSCRIBE_PASS
+    - "Combien j'ai en commission", "Mes gains", "Chiffre d'affaires", "Mon solde" -> CHECK_COMMISSIONS
+    - "Faire une simulation", "Calculer", "Projet retraite", "Simulation étude" -> RUN_SIMULATION
+    """
+
+# Mode lot : plusieurs messages numérotés dans une même requête
+PROMPT_LOT = """
+Tu reçois plusieurs messages numérotés. Retourne UNIQUEMENT un tableau JSON
+contenant un objet par message, dans le même ordre, avec les clés ci-dessus
+et la clé supplémentaire index (le numéro du message).
+"""
+
+# Change avec le prompt ou le modèle : invalide les réponses en cache
+VERSION_PROMPT = hashlib.sha256(f"{MODELE}\n{PROMPT_INTENTION}".encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def get_ai_service():
+    """Instance partagée par le processus"""
+    return AIService()
+
+
 class AIService:
     """Service d'intelligence artificielle pour le chatbot NSIA"""
     
     def __init__(self):
         # On s'attend à ces clés dans settings.py (ou via .env)
         self.api_key = getattr(settings, 'GEMINI_API_KEY', None)
-        self.api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={self.api_key}"
+        self.api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODELE}:generateContent?key={self.api_key}"
     
-    def detect_intent(self, text):
+    def detect_intent(self, text, timeout=None):
         """
         Analyse le texte pour détecter l'intention et les entités.
+
+        En mode lot (GEMINI_BATCH_ENABLED), la demande rejoint les messages
+        concurrents du processus ; `timeout` borne l'attente de cet appelant
+        seul (None retourné au-delà, comme pour une erreur).
         """
         if not self.api_key:
             logger.warning("⚠️ GEMINI_API_KEY non configurée. Détection IA désactivée.")
             return None
-            
-        system_prompt = """
-        Tu es un assistant expert pour NSIA Vie Assurances. Ton rôle est d'analyser les messages des agents commerciaux sur WhatsApp.
-        Analyse le message et retourne UNQUEMENT un objet JSON avec les clés suivantes :
-        - intent : L'intention détectée parmi [SUBSCRIBE_PASS, CHECK_COMMISSIONS, RUN_SIMULATION, UNKNOWN]
-        - product : Le produit mentionné (ex: BATELA, KIMIA, SALISA, RETRAITE, ETUDES) ou null
-        - client_name : Le nom du client mentionné ou null
-        - amount : Le montant ou la prime mentionnée ou null
-        - confidence : Ton score de confiance (0 à 1)
-
-        Guide de mapping :
-        - "Je veux inscrire", "Souscription", "Pass", "Prendre un contrat" -> SUBSCRIBE_PASS
-        - "Combien j'ai en commission", "Mes gains", "Chiffre d'affaires", "Mon solde" -> CHECK_COMMISSIONS
-        - "Faire une simulation", "Calculer", "Projet retraite", "Simulation étude" -> RUN_SIMULATION
+
+        # Message quasi identique déjà analysé : réponse rejouée sans appel
+        cache = get_gemini_cache()
+        cached = cache.get(text, VERSION_PROMPT)
+        if cached is not None:
+            return cached
+
+        if settings.GEMINI_BATCH_ENABLED:
+            return get_gemini_batcher(self).attendre(text, timeout or settings.GEMINI_BATCH_TIMEOUT)
+
+        try:
+            return self.detect_intent_direct(text, timeout)
+        except Exception as e:
+            logger.error(f"❌ Erreur AI Intent Detection: {e}")
+            return None
+
+    def detect_intents(self, texts):
+        """
+        Analyse plusieurs messages en une seule requête Gemini (tableau JSON
+        dans l'ordre des messages). Retourne une liste alignée sur `texts`,
+        None pour un message sans réponse exploitable.
         """
+        if len(texts) == 1:
+            return [self.detect_intent_direct(texts[0])]
+
+        messages = '\n'.join(f'{i}. {json.dumps(t, ensure_ascii=False)}' for i, t in enumerate(texts))
+        data, tokens = self._generer(f"{PROMPT_INTENTION}\n\n{PROMPT_LOT}\n\nMessages des agents :\n{messages}")
+        if isinstance(data, dict):
+            data = data.get('resultats') or data.get('results') or [data]
+        if not isinstance(data, list):
+            raise ValueError("Réponse Gemini sans tableau")
+
+        resultats = [None] * len(texts)
+        for position, item in enumerate(data):
+            if not isinstance(item, dict):
+                continue
+            index = item.pop('index', position)
+            if isinstance(index, int) and 0 <= index < len(texts):
+                resultats[index] = item
+
+        cache = get_gemini_cache()
+        for text, item in zip(texts, resultats):
+            if item is not None:
+                cache.set(text, VERSION_PROMPT, item, tokens // len(texts))
+        return resultats
 
+    def detect_intent_direct(self, text, timeout=None):
+        """Un seul message, sans cache ni regroupement (lève en cas d'erreur)"""
+        data, tokens = self._generer(f"{PROMPT_INTENTION}\n\nMessage de l'agent : \"{text}\"", timeout)
+        get_gemini_cache().set(text, VERSION_PROMPT, data, tokens)
+        return data
+
+    def _generer(self, prompt, timeout=None):
+        """Appel generateContent ; retourne (JSON généré, jetons consommés)"""
         payload = {
             "contents": [{
                 "parts": [{
-                    "text": f"{system_prompt}\n\nMessage de l'agent : \"{text}\""
+                    "text": prompt
                 }]
             }],
             "generationConfig": {
@@ -47,18 +128,20 @@ class AIService:
             }
         }
 
-        try:
-            response = requests.post(self.api_url, json=payload, timeout=10)
-            response.raise_for_status()
-            
-            result = response.json()
-            # Extraction du contenu JSON généré par Gemini
-            content_text = result['candidates'][0]['content']['parts'][0]['text']
-            return json.loads(content_text)
-            
-        except Exception as e:
-            logger.error(f"❌ Erreur AI Intent Detection: {e}")
-            return None
+        metrics.incr('gemini.calls')
+        # Délai de lecture borné par celui de l'appelant (routage spéculatif)
+        lecture = min(10, timeout) if timeout else 10
+        response = http_client.post(self.api_url, json=payload, timeout=(settings.HTTP_CONNECT_TIMEOUT, lecture))
+        response.raise_for_status()
+
+        result = response.json()
+        # Extraction du contenu JSON généré par Gemini
+        content_text = result['candidates'][0]['content']['parts'][0]['text']
+        # Jetons facturés (usageMetadata), sinon estimation ~4 caractères par jeton
+        usage = result.get('usageMetadata') or {}
+        tokens = usage.get('totalTokenCount') or (len(prompt) + len(content_text)) // 4
+        metrics.incr('gemini.tokens', tokens)
+        return json.loads(content_text), tokens
 
     def is_available(self):
         return self.api_key is not None
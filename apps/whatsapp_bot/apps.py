@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class WhatsappBotConfig(AppConfig):
@@ -6,6 +7,23 @@ class WhatsappBotConfig(AppConfig):
     name = 'apps.whatsapp_bot'
     verbose_name = 'Chatbot WhatsApp Commercial'
 
+    def ready(self):
+        # Les modes *_SHARED exigent un cache Django commun aux workers (pas LocMem)
+        from core.shared_cache import verifier_caches_partages
+        verifier_caches_partages()
+
+        # Tables de mortalité et commutations chargées au démarrage plutôt qu'au premier calcul
+        if settings.SIMULATEUR_MODE in ('local', 'shadow'):
+            from .actuariat import get_moteur, produits_valides
+            get_moteur()
+            # Produits que le mode local peut servir (validés contre les réponses enregistrées)
+            if settings.SIMULATEUR_MODE == 'local':
+                produits_valides()
+
+        # Modèle local d'intentions (INTENT_MODEL_PATH) chargé une seule fois
+        from .intents import get_classifieur
+        get_classifieur()
+
 
 
 
@@ -0,0 +1,78 @@
+import logging
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from core.lru import TTLCache
+from core.shared_cache import cache_partage_actif
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_dedup_filter():
+    """Filtre partagé par le processus"""
+    dedup = DedupFilter(
+        window=settings.WHATSAPP_DEDUP_WINDOW,
+        maxsize=settings.WHATSAPP_DEDUP_MAXSIZE,
+        shared=cache_partage_actif('WHATSAPP_DEDUP_SHARED'),
+    )
+    metrics.register_gauge('webhook_dedup', dedup.stats)
+    return dedup
+
+
+class DedupFilter:
+    """
+    Filtre anti-doublons des messages entrants, devant la contrainte unique.
+
+    Les IDs Wassenger vus pendant `window` secondes sont gardés dans un
+    ensemble borné en mémoire et, si `shared`, dans le cache Django
+    (cache.add est atomique : un seul worker réserve un ID donné).
+    Un doublon connu est écarté sans aucune requête SQL ; la contrainte
+    unique en base reste la garantie finale.
+    """
+
+    def __init__(self, window, maxsize, shared=False):
+        self.window = window
+        self.shared = shared
+        self._seen = TTLCache(maxsize, window)
+
+    def claim(self, message_id):
+        """Réserve l'ID ; retourne False si le message est déjà connu"""
+        metrics.incr('webhook.incoming')
+        claimed = self._seen.add(message_id, True)
+        if claimed and self.shared:
+            try:
+                claimed = shared_cache.add(self._shared_key(message_id), True, timeout=self.window)
+            except Exception as e:
+                # Cache partagé indisponible : la contrainte unique prend le relais
+                logger.warning(f"⚠️ Cache de dédoublonnage indisponible: {e}")
+        if not claimed:
+            metrics.incr('webhook.duplicates_fast')
+        return claimed
+
+    def release(self, message_id):
+        """Libère un ID dont le traitement a échoué (la relivraison sera acceptée)"""
+        self._seen.delete(message_id)
+        if self.shared:
+            try:
+                shared_cache.delete(self._shared_key(message_id))
+            except Exception:
+                pass
+
+    def stats(self):
+        incoming = metrics.get_counter('webhook.incoming')
+        fast = metrics.get_counter('webhook.duplicates_fast')
+        db = metrics.get_counter('webhook.duplicates_db')
+        return {
+            'window_s': self.window,
+            'size': len(self._seen),
+            'incoming': incoming,
+            'duplicates_fast': fast,
+            'duplicates_db': db,
+            'duplicate_rate': round((fast + db) / incoming, 4) if incoming else 0,
+        }
+
+    @staticmethod
+    def _shared_key(message_id):
+        return f'wa-dedup:{message_id}'
@@ -0,0 +1,200 @@
+"""
+Extraction des champs de souscription / simulation depuis un message libre.
+
+"Batela mensuel Moukouri Jean 061234567 12/03/1985" → produit, récurrence,
+nom, prénom, téléphone et date de naissance en un seul message : le
+handler saute directement à la première étape manquante.
+
+Grammaire locale (expressions régulières) ; les entités extraites par
+Gemini lors de la détection d'intention (clés ia_* du contexte) ne
+servent qu'à compléter ce que la grammaire n'a pas trouvé.
+"""
+import re
+import unicodedata
+from datetime import datetime
+
+PRODUITS_PASS = ('BATELA', 'KIMIA', 'SALISA')
+
+# Montant : 25000, 25 000, 25.000, 1,5 M, 300k, 2 millions
+_NOMBRE = r'(\d+(?:[ .]\d{3})*(?:,\d+)?)\s*(k|m|millions?|mille)?\b'
+
+_DATE = re.compile(r'(?<!\d)(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})(?!\d)')
+_TELEPHONE = re.compile(r'(?<![\d/])(?:\+?242[\s.-]?)?(0\d(?:[\s.]?\d){7})(?![\d/])')
+_PRODUIT_PASS = re.compile(r'\b(batela|kimia|salisa)\b')
+_RECURRENCES = [
+    (re.compile(r'\b(quotidien(ne)?|journalier|par jour)\b'), 'quotidien'),
+    (re.compile(r'\b(mensuel(le)?|par mois)\b'), 'mensuel'),
+    (re.compile(r'\b(unique|comptant|une fois)\b'), 'unique'),
+]
+_PRODUITS_SIMULATEUR = [
+    (re.compile(r'\bpension\s*(securite|confort|renfort)\b'), None),
+    (re.compile(r'\bretraite\b'), 'retraite'),
+    (re.compile(r'\bprevoyance\b'), 'prevoyance'),
+    (re.compile(r'\betudes?\b(?!\s*(?:de\s*|sur\s*)?\d)'), 'etudes'),
+]
+# Valeurs étiquetées, dans l'ordre d'extraction (les plus spécifiques d'abord)
+_ETIQUETTES = [
+    ('age_enfant', re.compile(r"\benfant\s*(?:de\s*|a\s*)?(\d{1,2})\s*ans?\b")),
+    ('duree_service', re.compile(r'\b(?:etudes?|service)\s*(?:de\s*|sur\s*)?(\d{1,2})\s*ans?\b')),
+    ('duree', re.compile(r'\b(?:duree|sur|pendant|pour|cotisation)\s*(?:de\s*)?(\d{1,2})\s*ans?\b')),
+    ('prime_mensuelle', re.compile(r'\bprime\s*(?:mensuelle\s*)?(?:de\s*)?' + _NOMBRE)),
+    ('capital_deces', re.compile(r'\bcapital\s*(?:deces\s*)?(?:de\s*)?' + _NOMBRE)),
+    ('pension_mensuelle', re.compile(r'\bpension\s*(?:securite\s*|confort\s*|renfort\s*)?(?:mensuelle\s*)?(?:de\s*)?' + _NOMBRE)),
+    ('rente_annuelle', re.compile(r'\brente\s*(?:annuelle\s*)?(?:de\s*)?' + _NOMBRE)),
+    ('age', re.compile(r'\bage\s*(?:de\s*)?(\d{2})\b|\b(\d{2})\s*ans\b')),
+]
+_MONTANTS = ('prime_mensuelle', 'capital_deces', 'pension_mensuelle', 'rente_annuelle')
+
+# Mots qui ne sont jamais un nom de client
+_MOTS_OUTILS = set("""
+je j veux voudrais souhaite aimerais pour le la les l un une de d du des et a au aux en avec sur par
+client cliente parent mon ma mes m mr mme mlle monsieur madame ne nee tel telephone numero num
+souscrire souscription inscrire inscription pass nouveau nouvelle faire simulation simuler simulateur
+calcul calculer nom prenom ans an age fcfa f xaf mois jour pendant duree prime capital deces
+pension rente annuelle mensuelle securite confort renfort enfant etude etudes service stp svp
+merci bonjour bonsoir contrat produit recurrence date naissance paiement primes couverture
+cotisation retraite prevoyance epargne assurance tarif devis prix projet info infos aide
+veut voudrait creer lancer est ce que qui quel quelle il elle son sa ses moi lui vous nous on
+ok oui non aujourd'hui demain maintenant voir donne ca cela ceci fait combien coute
+""".split())
+
+# Champs qui justifient un saut d'étapes (un nom seul reste une réponse ordinaire)
+FORTS = ('produit_pass', 'recurrence', 'telephone', 'date_naissance', 'produit_simulateur',
+         'age', 'age_enfant', 'duree', 'duree_service') + _MONTANTS
+
+
+def _plier(texte):
+    """Minuscules sans accents, même longueur que le texte d'origine (positions conservées)"""
+    return ''.join(unicodedata.normalize('NFKD', c)[0] for c in texte.lower())
+
+
+def _prenom(mot):
+    """'jean-pierre' → 'Jean-Pierre'"""
+    return '-'.join(partie.capitalize() for partie in mot.split('-'))
+
+
+def _montant(chiffres, unite):
+    valeur = float(re.sub(r'[ .]', '', chiffres).replace(',', '.'))
+    unite = (unite or '').lower()
+    if unite == 'k' or unite == 'mille':
+        valeur *= 1000
+    elif unite.startswith('m'):
+        valeur *= 1_000_000
+    return valeur
+
+
+def extraire(texte):
+    """
+    Retourne les champs trouvés, parmi : produit_pass, recurrence, nom,
+    prenom, telephone (9 chiffres nationaux), date_naissance (AAAA-MM-JJ),
+    produit_simulateur, age, age_enfant, duree, duree_service et les montants.
+    """
+    plie = _plier(texte)
+    masque = list(plie)
+    entites = {}
+
+    def consommer(match):
+        for i in range(match.start(), match.end()):
+            masque[i] = ' '
+
+    def chercher(motif):
+        match = motif.search(''.join(masque))
+        if match:
+            consommer(match)
+        return match
+
+    match = chercher(_DATE)
+    if match:
+        try:
+            date = datetime(int(match.group(3)), int(match.group(2)), int(match.group(1)))
+            entites['date_naissance'] = date.strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+
+    match = chercher(_TELEPHONE)
+    if match:
+        entites['telephone'] = re.sub(r'\D', '', match.group(1))
+
+    match = chercher(_PRODUIT_PASS)
+    if match:
+        entites['produit_pass'] = match.group(1).upper()
+
+    for motif, recurrence in _RECURRENCES:
+        if chercher(motif):
+            entites['recurrence'] = recurrence
+            break
+
+    # Produit lu sur le texte complet : 'pension confort 50000' est aussi un montant
+    for motif, produit in _PRODUITS_SIMULATEUR:
+        match = motif.search(''.join(masque))
+        if match:
+            entites['produit_simulateur'] = produit or f"pension_{match.group(1)}"
+            if produit:
+                consommer(match)
+            break
+
+    for champ, motif in _ETIQUETTES:
+        match = chercher(motif)
+        if not match:
+            continue
+        if champ in _MONTANTS:
+            entites[champ] = _montant(match.group(1), match.group(2))
+        else:
+            entites[champ] = int(next(g for g in match.groups() if g))
+
+    # Reste du message : mots alphabétiques hors vocabulaire → nom puis prénom(s)
+    restant = ''.join(
+        original if m != ' ' else ' '
+        for original, m in zip(texte, masque)
+    )
+    mots = [
+        mot for mot in re.findall(r"[^\W\d_][^\W\d_'-]*(?:[-'][^\W\d_]+)*", restant)
+        if len(mot) >= 2 and _plier(mot) not in _MOTS_OUTILS
+    ]
+    if mots:
+        entites['nom'] = mots[0].upper()
+        if len(mots) > 1:
+            entites['prenom'] = ' '.join(_prenom(m) for m in mots[1:3])
+
+    return entites
+
+
+def depuis_ia(contexte):
+    """Entités extraites par Gemini (ia_produit / ia_client / ia_montant) au format d'extraire()"""
+    entites = {}
+    produit = _plier(str(contexte.get('ia_produit') or ''))
+    if produit.upper() in PRODUITS_PASS:
+        entites['produit_pass'] = produit.upper()
+    elif produit:
+        for motif, code in _PRODUITS_SIMULATEUR:
+            match = motif.search(produit)
+            if match:
+                entites['produit_simulateur'] = code or f"pension_{match.group(1)}"
+                break
+
+    client = (contexte.get('ia_client') or '').split()
+    if client:
+        entites['nom'] = client[0].upper()
+        if len(client) > 1:
+            entites['prenom'] = ' '.join(_prenom(m) for m in client[1:3])
+
+    if isinstance(contexte.get('ia_montant'), (int, float)):
+        entites['montant'] = float(contexte['ia_montant'])
+    return entites
+
+
+def completer(entites, secours):
+    """
+    Ajoute les champs de `secours` absents d'`entites`.
+
+    Exception : le nom du client donné par Gemini l'emporte sur celui de la
+    grammaire (simples mots restants du message).
+    """
+    if secours.get('nom'):
+        entites = {k: v for k, v in entites.items() if k not in ('nom', 'prenom')}
+    return {**secours, **entites}
+
+
+def forts(entites):
+    """Vrai si le message apporte plus qu'un nom (saut d'étapes justifié)"""
+    return any(champ in entites for champ in FORTS)
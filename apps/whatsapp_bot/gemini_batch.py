@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+from django.conf import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_gemini_batcher(ai_service):
+    """Collecteur partagé par le processus (créé au premier appel, après le fork gunicorn)"""
+    batcher = GeminiBatcher(
+        envoyer=ai_service.detect_intents,
+        window_ms=settings.GEMINI_BATCH_WINDOW_MS,
+        max_items=settings.GEMINI_BATCH_MAX,
+    )
+    metrics.register_gauge('gemini_batch', batcher.stats)
+    return batcher
+
+
+class GeminiBatcher:
+    """
+    Regroupe les détections d'intention concurrentes en une requête Gemini.
+
+    Le premier message en attente ouvre une fenêtre de `window_ms` ; le lot
+    part à la fin de la fenêtre ou dès `max_items` messages. Le prompt
+    système n'est envoyé qu'une fois par lot et chaque appelant reçoit sa
+    réponse via un Future, qu'il attend avec son propre délai.
+    """
+
+    def __init__(self, envoyer, window_ms, max_items, max_in_flight=4):
+        self.window = window_ms / 1000
+        self.max_items = max(1, max_items)
+        self._envoyer = envoyer
+        self._attente = []
+        self._cond = threading.Condition()
+        self._collecteur = None
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='gemini-batch')
+
+    def soumettre(self, texte):
+        """Ajoute le message au prochain lot ; retourne un Future (réponse dict ou None)"""
+        future = Future()
+        with self._cond:
+            self._attente.append((texte, future))
+            if self._collecteur is None:
+                self._collecteur = threading.Thread(target=self._collecter, name='gemini-collecteur', daemon=True)
+                self._collecteur.start()
+            self._cond.notify()
+        return future
+
+    def attendre(self, texte, timeout):
+        """Réponse pour ce message, ou None (repli de l'appelant) après `timeout` secondes"""
+        future = self.soumettre(texte)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Encore dans la file : retiré du lot ; déjà envoyé : la réponse ira au cache
+            future.cancel()
+            metrics.incr('gemini.batch_timeout')
+            logger.warning(f"⚠️ Détection IA en lot : pas de réponse en {timeout}s")
+        except Exception as e:
+            logger.error(f"❌ Erreur AI Intent Detection (lot): {e}")
+        return None
+
+    def stats(self):
+        lots = metrics.get_counter('gemini.batches')
+        with self._cond:
+            en_attente = len(self._attente)
+        return {
+            'window_ms': int(self.window * 1000),
+            'max_items': self.max_items,
+            'pending': en_attente,
+            'batches': lots,
+            'avg_batch_size': round(metrics.get_counter('gemini.batched_items') / lots, 2) if lots else 0,
+            'timeouts': metrics.get_counter('gemini.batch_timeout'),
+        }
+
+    # ========================================
+    # INTERNE
+    # ========================================
+
+    def _collecter(self):
+        while True:
+            with self._cond:
+                while not self._attente:
+                    self._cond.wait()
+                limite = time.monotonic() + self.window
+                while len(self._attente) < self.max_items:
+                    reste = limite - time.monotonic()
+                    if reste <= 0:
+                        break
+                    self._cond.wait(reste)
+                lot = self._attente[:self.max_items]
+                del self._attente[:self.max_items]
+            self._pool.submit(self._envoyer_lot, lot)
+
+    def _envoyer_lot(self, lot):
+        # Appelants ayant abandonné (délai dépassé) : retirés du lot
+        lot = [(texte, future) for texte, future in lot if future.set_running_or_notify_cancel()]
+        if not lot:
+            return
+
+        metrics.incr('gemini.batches')
+        metrics.incr('gemini.batched_items', len(lot))
+        try:
+            with metrics.timer('gemini.batch'):
+                resultats = self._envoyer([texte for texte, _ in lot])
+        except Exception as e:
+            for _, future in lot:
+                future.set_exception(e)
+            return
+
+        for (_, future), resultat in zip(lot, resultats):
+            future.set_result(resultat)
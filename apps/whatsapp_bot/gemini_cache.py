@@ -0,0 +1,176 @@
+import copy
+import hashlib
+import logging
+import re
+import unicodedata
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from core.lru import TTLCache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Montants : 50000, 50 000, 50.000, 1,5 (espaces insécables compris)
+_NOMBRE = re.compile(r'\d+(?:[ .,  ]\d{3})*(?:[.,]\d+)?')
+
+
+def gabarit(texte):
+    """
+    'Je veux souscrire BATELA à 50 000 F' → ('je veux souscrire batela a # f', [50000])
+
+    Minuscules, accents retirés, ponctuation et espaces réduits, nombres
+    remplacés par '#' (valeurs retournées dans l'ordre).
+    """
+    texte = unicodedata.normalize('NFKD', texte.lower())
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    nombres = []
+
+    def remplacer(match):
+        nombres.append(_valeur(match.group()))
+        return ' # '
+
+    texte = _NOMBRE.sub(remplacer, texte)
+    return ' '.join(re.sub(r'[^a-z0-9#]+', ' ', texte).split()), nombres
+
+
+def _valeur(brut):
+    chiffres = re.sub(r'[ .,  ](?=\d{3}\b)', '', brut).replace(',', '.')
+    try:
+        valeur = float(chiffres)
+    except ValueError:
+        return brut
+    return int(valeur) if valeur.is_integer() else valeur
+
+
+@lru_cache(maxsize=None)
+def get_gemini_cache():
+    """Cache des réponses Gemini partagé par le processus"""
+    cache = GeminiCache(
+        ttl=settings.GEMINI_CACHE_TTL,
+        maxsize=settings.GEMINI_CACHE_MAXSIZE,
+        persist=settings.GEMINI_CACHE_PERSIST,
+    )
+    metrics.register_gauge('gemini_cache', cache.stats)
+    return cache
+
+
+class GeminiCache:
+    """
+    Réponses de détection d'intention par gabarit de message.
+
+    Le montant (amount) extrait par Gemini est mémorisé comme référence au
+    n-ième nombre du message : 'batela 50000' et 'batela 75000' partagent
+    l'entrée, chacun retrouvant son propre montant. Une réponse dont le
+    montant ne vient pas du message n'est pas mise en cache.
+
+    Niveau 1 : LRU en mémoire avec TTL ; niveau 2 optionnel : table
+    whatsapp_gemini_cache (GEMINI_CACHE_PERSIST), qui survit aux redémarrages.
+    """
+
+    def __init__(self, ttl, maxsize, persist=False):
+        self.ttl = ttl
+        self.persist = persist
+        self._local = TTLCache(maxsize, ttl)
+
+    def get(self, texte, version):
+        """Réponse rejouée (confiance d'origine comprise) ou None"""
+        modele, nombres = gabarit(texte)
+        cle = self._cle(modele, version)
+        entree = self._local.get(cle)
+        if entree is None and self.persist:
+            entree = self._lire_base(cle)
+            if entree is not None:
+                metrics.incr('gemini_cache.db_hit')
+                self._local.set(cle, entree)
+
+        if entree is None:
+            metrics.incr('gemini_cache.miss')
+            return None
+
+        reponse = _instancier(entree['reponse'], nombres)
+        if reponse is None:
+            metrics.incr('gemini_cache.miss')
+            return None
+        metrics.incr('gemini_cache.hit')
+        metrics.incr('gemini_cache.tokens_saved', entree['tokens'])
+        return reponse
+
+    def set(self, texte, version, reponse, tokens):
+        modele, nombres = gabarit(texte)
+        generique = _generaliser(reponse, nombres)
+        if generique is None:
+            metrics.incr('gemini_cache.uncacheable')
+            return
+        entree = {'reponse': generique, 'tokens': int(tokens or 0)}
+        cle = self._cle(modele, version)
+        self._local.set(cle, entree)
+        if self.persist:
+            self._ecrire_base(cle, modele, entree)
+
+    def stats(self):
+        hits = metrics.get_counter('gemini_cache.hit')
+        total = hits + metrics.get_counter('gemini_cache.miss')
+        return {
+            'persist': self.persist,
+            'size': len(self._local),
+            'hit_ratio': round(hits / total, 4) if total else 0,
+            'db_hits': metrics.get_counter('gemini_cache.db_hit'),
+            'tokens_saved': metrics.get_counter('gemini_cache.tokens_saved'),
+            'uncacheable': metrics.get_counter('gemini_cache.uncacheable'),
+        }
+
+    # ========================================
+    # INTERNE
+    # ========================================
+
+    @staticmethod
+    def _cle(modele, version):
+        return hashlib.sha256(f"{version}:{modele}".encode()).hexdigest()
+
+    def _lire_base(self, cle):
+        from .models import GeminiCacheEntry
+        try:
+            row = GeminiCacheEntry.objects.filter(cle=cle, expires_at__gt=timezone.now()).first()
+        except Exception as e:
+            logger.warning(f"⚠️ Cache Gemini en base indisponible: {e}")
+            return None
+        return {'reponse': row.reponse, 'tokens': row.tokens} if row else None
+
+    def _ecrire_base(self, cle, modele, entree):
+        from .models import GeminiCacheEntry
+        try:
+            GeminiCacheEntry.objects.update_or_create(cle=cle, defaults={
+                'gabarit': modele,
+                'reponse': entree['reponse'],
+                'tokens': entree['tokens'],
+                'expires_at': timezone.now() + timedelta(seconds=self.ttl),
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Cache Gemini en base non écrit: {e}")
+
+
+def _generaliser(reponse, nombres):
+    """Remplace le montant par sa position dans le message ('#0') ; None si impossible"""
+    reponse = copy.deepcopy(reponse)
+    montant = reponse.get('amount')
+    if montant in (None, ''):
+        return reponse
+    valeur = _valeur(str(montant)) if not isinstance(montant, (int, float)) else montant
+    if valeur in nombres:
+        reponse['amount'] = f"#{nombres.index(valeur)}"
+        return reponse
+    return None
+
+
+def _instancier(reponse, nombres):
+    """Inverse de _generaliser pour les nombres du nouveau message"""
+    reponse = copy.deepcopy(reponse)
+    montant = reponse.get('amount')
+    if isinstance(montant, str) and montant.startswith('#'):
+        index = int(montant[1:])
+        if index >= len(nombres):
+            return None
+        reponse['amount'] = nombres[index]
+    return reponse
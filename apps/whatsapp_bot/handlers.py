@@ -1,22 +1,93 @@
 import re
 import logging
-from .services import WhatsAppService
-from .ai_service import AIService
+from .services import get_whatsapp_service
+from .stats_cache import get_stats_cache
+from . import simulateur
+from . import entites
+from . import intents
+from . import nsia_api
+from . import speculation
+from .nsia_api import SessionAuth, ServiceIndisponibleError, TokenExpiredError, token_expires_at
+from .ai_service import get_ai_service
 from .models import WhatsAppSession
 from apps.borne_auth.models import Agent
+from apps.borne_auth.directory import get_agent_directory
 import requests
 from django.conf import settings
+from django.db import connection, transaction
+from .metrics import metrics
+from .outgoing import capture_outgoing
 
 logger = logging.getLogger(__name__)
 
+PRODUITS_PASS_IDS = {'BATELA': 1, 'KIMIA': 2, 'SALISA': 3}
+
+# Étapes du flux PASS, dans l'ordre : (état, clé du contexte)
+ETAPES_PASS = [
+    ('PASS_CHOIX_PRODUIT', 'produit_pass_id'),
+    ('PASS_CHOIX_RECURRENCE', 'type_recurrence'),
+    ('PASS_COLLECTE_NOM', 'client_nom'),
+    ('PASS_COLLECTE_PRENOM', 'client_prenom'),
+    ('PASS_COLLECTE_TELEPHONE', 'client_telephone'),
+    ('PASS_COLLECTE_NAISSANCE', 'client_date_naissance'),
+]
+
+# Étapes de collecte du simulateur par famille de produit
+ETAPES_SIMULATEUR = {
+    'retraite': ['nom', 'prenom', 'telephone', 'age', 'prime_mensuelle', 'capital_deces', 'duree'],
+    'pension': ['nom', 'prenom', 'telephone', 'age', 'pension_mensuelle', 'duree_couverture'],
+    'prevoyance': ['nom', 'prenom', 'telephone', 'age', 'capital_deces', 'duree_couverture'],
+    'etudes': ['nom', 'prenom', 'telephone', 'age_parent', 'age_enfant', 'rente_annuelle', 'duree_paiement', 'duree_service'],
+}
+
+QUESTIONS_SIMULATEUR = {
+    'nom': "📝 Nom du client ?",
+    'prenom': "📝 Prénom du client ?",
+    'telephone': "📞 Téléphone ?\nFormat: +242061234567 ou 061234567",
+    'age': "🎂 Âge du client ?",
+    'age_parent': "🎂 Âge du parent ?",
+    'age_enfant': "👶 Âge de l'enfant ?",
+    'prime_mensuelle': "💰 Prime mensuelle souhaitée (FCFA) ?",
+    'pension_mensuelle': "💰 Pension mensuelle souhaitée (FCFA) ?",
+    'capital_deces': "💰 Capital décès (FCFA) ?",
+    'rente_annuelle': "💰 Rente annuelle études (FCFA) ?",
+    'duree': "⏱️ Durée cotisation (années) ?",
+    'duree_couverture': "⏱️ Durée couverture (années) ?",
+    'duree_paiement': "⏱️ Durée paiement primes (années) ?",
+    'duree_service': "⏱️ Durée études/service (années) ?",
+}
+
+
+def etapes_simulateur(produit):
+    """Étapes de collecte du produit ('pension_confort' → famille pension)"""
+    if produit and produit.startswith('pension'):
+        return ETAPES_SIMULATEUR['pension']
+    return ETAPES_SIMULATEUR.get(produit, [])
+
+
+class _QueryCounter:
+    """Compte les requêtes SQL émises (connection.execute_wrapper)"""
+    
+    def __init__(self):
+        self.count = 0
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
 class ConversationHandler:
     """Gestionnaire principal de conversation"""
     
     def __init__(self, session: WhatsAppSession, message_text: str):
         self.session = session
         self.message_text = message_text.strip()
-        self.wa_service = WhatsAppService()
-        self.ai_service = AIService()
+        self.wa_service = get_whatsapp_service()
+        self.ai_service = get_ai_service()
+        self.auth = SessionAuth(session)
+        self.query_count = 0
+        # Actions à lancer une fois les écritures du tour validées
+        self._apres_commit = []
 
     def _normalize_choice(self, text=None):
         """
@@ -46,13 +117,60 @@ class ConversationHandler:
 
     def _clear_flow_context(self):
         """Nettoie les données de flux (souscription/simulation) en gardant les données agent."""
-        keep_prefixes = ('agent_', 'access_', 'refresh_', 'stats_', 'token_', 'session_')
+        keep_prefixes = ('agent_', 'access_', 'refresh_', 'stats_', 'token_', 'session_', 'grille_')
         self.session.context = {
             k: v for k, v in self.session.context.items()
             if k.startswith(keep_prefixes)
         }
 
-    def handle(self):
+    def handle(self, action=None):
+        """
+        Traite le message entrant (ou `action` à la place du routage par état).
+
+        Le traitement (appels NSIA / Gemini compris) tourne hors
+        transaction. Ses écritures sont validées ensemble à la fin, dans une
+        transaction courte : un seul UPDATE de session, les messages
+        sortants historisés en bulk. Rien n'est écrit si le traitement lève.
+        Le nombre de requêtes SQL émises est compté.
+        """
+        compteur = _QueryCounter()
+        with connection.execute_wrapper(compteur):
+            with capture_outgoing(self.session, differe=True) as buffer, \
+                    self.session.unit_of_work(differe=True), \
+                    nsia_api.slow_call_notice(lambda: self._annoncer_attente(buffer)):
+                # Session désactivée par l'archivage : elle reprend vie
+                self.session.is_active = True
+                (action or self._dispatch)()
+
+            with transaction.atomic():
+                self.session.flush()
+                buffer.flush()
+        for action_differee in self._apres_commit:
+            transaction.on_commit(action_differee)
+        
+        self.query_count = compteur.count
+        metrics.incr('handler.messages')
+        metrics.incr('handler.sql_queries', compteur.count)
+        logger.debug(f"🧮 {compteur.count} requête(s) SQL pour {self.session.phone_number}")
+    
+    def _annoncer_attente(self, buffer):
+        """
+        Appel API lent (réveil du serveur) : prévient l'agent sans attendre la fin du tour.
+
+        Exécuté par le thread minuteur de nsia_api pendant que le tour attend
+        la réponse NSIA. Envoi direct, hors boîte d'envoi : le message part
+        avant le commit du tour, donc avant ses réponses suivantes (confiées
+        à la boîte d'envoi au commit, ou envoyées directement après l'appel
+        NSIA si elle est désactivée). Il est historisé dans le buffer du tour,
+        qui est verrouillé, avant que l'appel NSIA ne rende la main.
+        """
+        payload, result = self.wa_service.send_text_now(
+            self.session.phone_number,
+            "⏳ Un instant… le serveur NSIA se réveille, votre demande est en cours."
+        )
+        buffer.record(payload, result)
+    
+    def _dispatch(self):
         """Route vers le bon handler selon l'état"""
         state = self.session.current_state
         
@@ -107,38 +225,228 @@ class ConversationHandler:
         else:
             self.send_error("État inconnu. Tapez 0 pour revenir au menu.")"""
     
-    """def handle_ai_intent(self):
-        #Détecte l'intention via l'IA et route vers le bon flux
-        if not self.ai_service.is_available():
-            return False
-            
-        intent_data = self.ai_service.detect_intent(self.message_text)
-        if not intent_data or intent_data.get('confidence', 0) < 0.7:
-            return False
-            
-        intent = intent_data.get('intent')
-        logger.info(f"🤖 IA Intent détectée : {intent} ({intent_data.get('confidence')})")
-        
+    def handle_ai_intent(self):
+        """
+        Texte libre au menu principal.
+
+        Règles et modèle local (instantanés) routent tout de suite. Sinon la
+        réponse déterministe part sans attendre et Gemini est lancé en
+        spéculatif après le commit du tour : une intention sûre obtenue
+        dans le délai fait entrer l'agent dans le flux (speculation.py).
+        """
+        resultat = intents.detecter(self.message_text, gemini=False)
+        if intents.confiant(resultat):
+            return self.router_intention(resultat)
+
+        if intents.gemini_utile(resultat):
+            session, texte = self.session, self.message_text
+            # Version lue au commit, après l'UPDATE de fin de tour
+            self._apres_commit.append(lambda: speculation.lancer(session.pk, session.version, texte))
+        return False
+
+    def router_intention(self, resultat):
+        """Entre dans le flux de l'intention, entités extraites pré-remplies"""
+        intent = resultat['intent']
+        logger.info(f"🤖 Intention détectée ({resultat['niveau']}) : {intent} ({resultat.get('confidence')})")
+
         if intent == 'SUBSCRIBE_PASS':
-            self.session.current_state = 'PASS_CHOIX_PRODUIT'
-            self.session.reset_context()
-            self.session.save()
-            self.show_pass_produits()
+            self._clear_flow_context()
+            self._prefill(resultat)
+            self.demarrer_pass(self._entites_message())
             return True
-            
+
         elif intent == 'CHECK_COMMISSIONS':
             self.session.current_state = 'COMMISSIONS_MENU'
             self.session.save()
             self.show_commissions()
             return True
-            
+
         elif intent == 'RUN_SIMULATION':
-            self.session.current_state = 'SIMULATEUR_CHOIX'
-            self.session.save()
-            self.show_simulateur_produits()
+            self._clear_flow_context()
+            self._prefill(resultat)
+            self.demarrer_simulateur(self._entites_message())
             return True
-            
-        return False"""
+
+        return False
+
+    def _prefill(self, resultat):
+        """Produit / client / montant extraits par l'IA, gardés pour le flux (clés ia_*)"""
+        for cle, champ in (('ia_produit', 'product'), ('ia_client', 'client_name'), ('ia_montant', 'amount')):
+            if resultat.get(champ) not in (None, ''):
+                self.session.context[cle] = resultat[champ]
+
+    # ========================================
+    # PRÉ-REMPLISSAGE (plusieurs champs en un message)
+    # ========================================
+
+    def _entites_message(self):
+        """Champs du message (grammaire locale), complétés par les entités Gemini (ia_*)"""
+        return entites.completer(entites.extraire(self.message_text), entites.depuis_ia(self.session.context))
+
+    def demarrer_pass(self, trouvees):
+        """
+        Entre dans le flux PASS. Sans produit reconnu, les champs trouvés
+        attendent le choix du produit (pass_prefill) ; sinon saut direct à
+        la première étape manquante.
+        """
+        self.session.context.pop('pass_prefill', None)
+        if 'produit_pass' in trouvees:
+            self.prefill_pass(trouvees)
+            return
+
+        if entites.forts(trouvees):
+            self.session.update_context('pass_prefill', trouvees)
+        self.session.current_state = 'PASS_CHOIX_PRODUIT'
+        self.session.save()
+        self.show_pass_produits()
+
+    def prefill_pass(self, trouvees):
+        """Reporte les champs PASS trouvés dans le contexte et saute à la première étape manquante"""
+        repris = []
+        produit = trouvees.get('produit_pass')
+        if produit:
+            self.session.update_context('produit_pass_id', PRODUITS_PASS_IDS[produit])
+            self.session.update_context('produit_nom', produit)
+            repris.append(f"PASS {produit}")
+        if trouvees.get('recurrence'):
+            self.session.update_context('type_recurrence', trouvees['recurrence'])
+            repris.append(trouvees['recurrence'])
+        if trouvees.get('nom'):
+            self.session.update_context('client_nom', trouvees['nom'])
+            repris.append(trouvees['nom'])
+        if trouvees.get('prenom'):
+            self.session.update_context('client_prenom', trouvees['prenom'])
+            repris.append(trouvees['prenom'])
+        if trouvees.get('telephone'):
+            phone = '+2420' + trouvees['telephone'].lstrip('0')
+            self.session.update_context('client_telephone', phone)
+            repris.append(phone)
+        if trouvees.get('date_naissance'):
+            self.session.update_context('client_date_naissance', trouvees['date_naissance'])
+            repris.append(f"né(e) le {trouvees['date_naissance']}")
+
+        metrics.incr('prefill.pass')
+        metrics.incr('prefill.champs', len(repris))
+        self.pass_etape_suivante(repris)
+
+    def pass_etape_suivante(self, repris=()):
+        """Pose la première question PASS sans réponse, ou affiche le récapitulatif"""
+        ctx = self.session.context
+        prefix = f"✅ Reçu : {', '.join(repris)}\n\n" if repris else ""
+
+        etape = next((etat for etat, cle in ETAPES_PASS if not ctx.get(cle)), 'PASS_CONFIRMATION')
+        self.session.current_state = etape
+        self.session.save()
+
+        if etape == 'PASS_CHOIX_PRODUIT':
+            self.show_pass_produits()
+            return
+        if etape == 'PASS_CONFIRMATION':
+            self.show_pass_recapitulatif()
+            return
+
+        questions = {
+            'PASS_CHOIX_RECURRENCE': self._message_recurrences(ctx.get('produit_nom', '')),
+            'PASS_COLLECTE_NOM': "📝 Nom du client ?\n\n0️⃣ Retour",
+            'PASS_COLLECTE_PRENOM': "📝 Prénom du client ?\n\n0️⃣ Retour",
+            'PASS_COLLECTE_TELEPHONE': "📞 Téléphone du client ?\nFormat: +242061234567 ou 061234567\n\n0️⃣ Retour",
+            'PASS_COLLECTE_NAISSANCE': "🎂 Date de naissance ?\nFormat: JJ/MM/AAAA\nExemple: 15/05/1990\n\n0️⃣ Retour",
+        }
+        self.wa_service.send_text_message(self.session.phone_number, prefix + questions[etape])
+
+    def demarrer_simulateur(self, trouvees):
+        """Entre dans le simulateur ; même logique que demarrer_pass (simulateur_prefill)"""
+        self.session.context.pop('simulateur_prefill', None)
+        produit = trouvees.pop('produit_simulateur', None)
+        if produit:
+            self.lancer_simulation(produit, trouvees)
+            return
+
+        if entites.forts(trouvees):
+            self.session.update_context('simulateur_prefill', trouvees)
+        self.session.current_state = 'SIMULATEUR_CHOIX'
+        self.session.save()
+        self.show_simulateur_produits()
+
+    def lancer_simulation(self, produit, trouvees=None):
+        """Produit choisi : formulaire complet, ou saut d'étapes si des champs sont déjà connus"""
+        self.session.update_context('simulateur_produit', produit)
+        self.session.current_state = 'SIMULATEUR_COLLECTE'
+        if not trouvees:
+            self.session.save()
+            self.afficher_formulaire_simulation(produit)
+            return
+        self.session.update_context('simulateur_data', {})
+        self.prefill_simulateur(produit, trouvees)
+
+    def prefill_simulateur(self, produit, trouvees):
+        """Reporte les champs valides dans simulateur_data et saute à la première étape manquante"""
+        etapes = etapes_simulateur(produit)
+        data = self.session.get_context('simulateur_data', {})
+        repris = {}
+
+        for champ in ('nom', 'prenom'):
+            if trouvees.get(champ):
+                repris[champ] = trouvees[champ]
+        if trouvees.get('telephone'):
+            repris['telephone'] = '+242' + trouvees['telephone'].lstrip('0')
+
+        age = trouvees.get('age')
+        if age is not None and 18 <= age <= 65:
+            repris['age_parent' if 'age_parent' in etapes else 'age'] = age
+        if trouvees.get('age_enfant') is not None and 0 <= trouvees['age_enfant'] <= 18:
+            repris['age_enfant'] = trouvees['age_enfant']
+
+        # 'duree' générique : durée de cotisation, de couverture ou de paiement selon le produit
+        duree = trouvees.get('duree')
+        if duree is not None and 1 <= duree <= 50:
+            champ = next((e for e in etapes if e in ('duree', 'duree_couverture', 'duree_paiement')), None)
+            if champ:
+                repris[champ] = duree
+        if trouvees.get('duree_service') is not None and 1 <= trouvees['duree_service'] <= 20:
+            repris['duree_service'] = trouvees['duree_service']
+
+        for champ in ('prime_mensuelle', 'pension_mensuelle', 'capital_deces', 'rente_annuelle'):
+            if trouvees.get(champ):
+                repris[champ] = trouvees[champ]
+        # Montant sans étiquette (Gemini) : montant principal du produit
+        if trouvees.get('montant'):
+            champ = next((e for e in etapes if e in ('prime_mensuelle', 'pension_mensuelle', 'capital_deces', 'rente_annuelle')), None)
+            if champ:
+                repris.setdefault(champ, trouvees['montant'])
+
+        repris = {c: v for c, v in repris.items() if c in etapes}
+        data.update(repris)
+        self.session.update_context('simulateur_data', data)
+
+        metrics.incr('prefill.simulateur')
+        metrics.incr('prefill.champs', len(repris))
+        self.simulateur_etape_suivante(repris)
+
+    def simulateur_etape_suivante(self, repris=None):
+        """Pose la première question du simulateur sans réponse, ou affiche le récapitulatif"""
+        produit = self.session.get_context('simulateur_produit')
+        data = self.session.get_context('simulateur_data', {})
+
+        etape = next((e for e in etapes_simulateur(produit) if e not in data), None)
+        if etape is None:
+            self.session.save()
+            self.afficher_recapitulatif_simulation()
+            return
+
+        self.session.update_context('simulateur_etape', etape)
+        self.session.save()
+        prefix = ""
+        if repris:
+            valeurs = [
+                f"{int(v):,} FCFA" if isinstance(v, float) else f"{v} ans" if isinstance(v, int) else v
+                for v in repris.values()
+            ]
+            prefix = f"✅ Reçu : {', '.join(valeurs)}\n\n"
+        self.wa_service.send_text_message(
+            self.session.phone_number,
+            f"{prefix}{QUESTIONS_SIMULATEUR[etape]}\n\n0️⃣ Retour"
+        )
 
     # ========================================
     # LOGIN AGENT
@@ -152,6 +460,14 @@ class ConversationHandler:
     
         # Vérifier format: matricule:motdepasse
         if ":" not in self.message_text:
+            # Numéro WhatsApp reconnu : le matricule est déduit, le message est le mot de passe
+            if settings.WHATSAPP_PHONE_AUTO_LOGIN:
+                agent = get_agent_directory().get_by_telephone(self.session.phone_number)
+                if agent:
+                    logger.info(f"📱 Matricule {agent.matricule} déduit du numéro WhatsApp")
+                    self._connexion_api(agent.matricule, self.message_text.strip())
+                    return
+            
             self.wa_service.send_text_message(
                 self.session.phone_number,
                 "❌ Format incorrect.\n\nUtilisez: MATRICULE:MOTDEPASSE\n\nExemple: AG-2025-001:monmotdepasse\n\n0 - Aide"
@@ -167,12 +483,15 @@ class ConversationHandler:
             return
     
         matricule, password = parts[0].strip(), parts[1].strip()
+        self._connexion_api(matricule, password)
     
+    def _connexion_api(self, matricule, password):
+        """Authentifie l'agent auprès de l'API et ouvre le menu principal"""
         try:
-            response = requests.post(
+            response = nsia_api.post(
                 f"{settings.API_BASE_URL}/api/v1/auth/agent/login/",
                 json={"matricule": matricule, "telephone": password},
-                timeout=10
+                timeout=(settings.HTTP_CONNECT_TIMEOUT, 10)
             )
     
             if response.status_code == 200:
@@ -187,6 +506,7 @@ class ConversationHandler:
                     'access_token': tokens.get('access'),
                     'refresh_token': tokens.get('refresh'),
                     'token_expires_in': session_info.get('expires_in', 86400),
+                    'token_expires_at': token_expires_at(tokens.get('access'), session_info.get('expires_in')),
                     'session_type': session_info.get('type'),
                     'agent_id': agent_data.get('id'),
                     'agent_name': agent_data.get('nom_complet'),
@@ -199,8 +519,27 @@ class ConversationHandler:
                     'stats_souscriptions_actives': stats.get('souscriptions_actives', 0),
                     'stats_souscriptions_ce_mois': stats.get('souscriptions_ce_mois', 0),
                 })
+                self.session.agent_id = agent_data.get('id')
                 self.session.current_state = 'MENU_PRINCIPAL'
+                
+                # Les statistiques du login amorcent le cache des commissions
+                get_stats_cache().seed(agent_data.get('id'), {
+                    'nom_complet': agent_data.get('nom_complet'),
+                    'matricule': agent_data.get('matricule'),
+                    'agence': agent_data.get('agence'),
+                    'taux_commission': agent_data.get('taux_commission'),
+                    'nombre_souscriptions': stats.get('total_souscriptions', 0),
+                    'souscriptions_actives': stats.get('souscriptions_actives', 0),
+                    'souscriptions_ce_mois': stats.get('souscriptions_ce_mois', 0),
+                })
                 self.session.save()
+                
+                # Données agent potentiellement modifiées côté API
+                get_agent_directory().invalidate(
+                    agent_id=agent_data.get('id'),
+                    matricule=agent_data.get('matricule'),
+                    telephone=agent_data.get('telephone'),
+                )
 
                 self.show_menu_principal(
                     prefix=(
@@ -225,19 +564,16 @@ class ConversationHandler:
                     "❌ Connexion impossible. Réessayez plus tard.\n\n0 - Aide"
                 )
     
-        except requests.exceptions.Timeout:
-            logger.error("❌ Timeout lors du login API")
-            self.wa_service.send_text_message(
-                self.session.phone_number,
-                "❌ Le serveur met trop de temps à répondre. Réessayez dans quelques instants."
-            )
-    
-        except requests.exceptions.ConnectionError:
-            logger.error("❌ Impossible de joindre l'API de connexion")
-            self.wa_service.send_text_message(
-                self.session.phone_number,
-                "❌ Service temporairement indisponible. Réessayez plus tard."
-            )
+        except ServiceIndisponibleError as e:
+            # nsia_api enveloppe les erreurs réseau : la cause distingue le timeout
+            if isinstance(e.__cause__, requests.exceptions.Timeout):
+                logger.error("❌ Timeout lors du login API")
+                self.wa_service.send_text_message(
+                    self.session.phone_number,
+                    "❌ Le serveur met trop de temps à répondre. Réessayez dans quelques instants."
+                )
+            else:
+                self.service_indisponible(e)
     
         except Exception as e:
             logger.error(f"❌ Erreur inattendue lors du login: {e}", exc_info=True)
@@ -254,15 +590,17 @@ class ConversationHandler:
         """Gère le menu principal"""
         choix = self._normalize_choice()
 
-        if choix == "1" or "souscrire" in choix or choix == "menu_1":
+        if choix.startswith("grille"):
+            self.handle_grille()
+
+        elif choix == "1" or "souscrire" in choix or choix == "menu_1":
             # Souscription PASS
             self.session.current_state = 'PASS_CHOIX_PRODUIT'
             self.session.context = {
                 k: v for k, v in self.session.context.items()
                 if k.startswith('agent_') or k.startswith('access_') or k.startswith('refresh_') or k.startswith('stats_') or k.startswith('token_') or k.startswith('session_')
             }
-            self.session.save()
-            self.show_pass_produits()
+            self.demarrer_pass(entites.extraire(self.message_text))
 
         elif choix == "2" or "commission" in choix or choix == "menu_2":
             # Commissions
@@ -272,14 +610,12 @@ class ConversationHandler:
 
         elif choix == "3" or "simulateur" in choix or "simulation" in choix or choix == "menu_3":
             # Simulateur
-            self.session.current_state = 'SIMULATEUR_CHOIX'
-            self.session.save()
-            self.show_simulateur_produits()
+            self.demarrer_simulateur(entites.extraire(self.message_text))
 
         elif choix == "0":
             self.show_menu_principal()
 
-        else:
+        elif not self.handle_ai_intent():
             self.send_error("Option invalide. Choisissez 1, 2, 3 ou 0.")
     
     def show_menu_principal(self, prefix=""):
@@ -355,20 +691,39 @@ class ConversationHandler:
             self.show_menu_principal()
             return
         
+        prefill = self.session.context.pop('pass_prefill', None) or {}
+
         if choix not in produits:
+            # Message libre ("Batela mensuel Moukouri Jean 061234567 ...")
+            trouvees = entites.extraire(self.message_text)
+            if 'produit_pass' in trouvees:
+                self.prefill_pass({**prefill, **trouvees})
+                return
+            if prefill:
+                self.session.update_context('pass_prefill', prefill)
             self.send_error("Produit invalide. Choisissez 1, 2, 3 ou 0.")
             return
         
         produit = produits[choix]
+        if prefill:
+            self.prefill_pass({**prefill, 'produit_pass': produit['nom']})
+            return
+
         self.session.update_context('produit_pass_id', produit['id'])
         self.session.update_context('produit_nom', produit['nom'])
         self.session.current_state = 'PASS_CHOIX_RECURRENCE'
         self.session.save()
         
         # Afficher récurrences
-        if produit['code'] == 'batela':
-            message = (
-                f"✅ PASS {produit['nom']} sélectionné\n\n"
+        self.wa_service.send_text_message(
+            self.session.phone_number,
+            f"✅ PASS {produit['nom']} sélectionné\n\n{self._message_recurrences(produit['nom'])}"
+        )
+
+    def _message_recurrences(self, produit_nom):
+        """Choix de récurrence avec les montants du produit"""
+        if produit_nom == 'BATELA':
+            return (
                 f"📅 Choisissez la récurrence :\n\n"
                 f"1️⃣ Quotidien - 200 FCFA/jour\n"
                 f"2️⃣ Mensuel - 6 000 FCFA/mois\n"
@@ -376,18 +731,15 @@ class ConversationHandler:
                 f"Plafond total : 72 200 FCFA\n\n"
                 f"0️⃣ Retour"
             )
-        else:  # KIMIA ou SALISA
-            message = (
-                f"✅ PASS {produit['nom']} sélectionné\n\n"
-                f"📅 Choisissez la récurrence :\n\n"
-                f"1️⃣ Quotidien - 100 FCFA/jour\n"
-                f"2️⃣ Mensuel - 3 000 FCFA/mois\n"
-                f"3️⃣ Unique - 22 205 FCFA\n\n"
-                f"Plafond total : 22 205 FCFA\n\n"
-                f"0️⃣ Retour"
-            )
-        
-        self.wa_service.send_text_message(self.session.phone_number, message)
+        # KIMIA ou SALISA
+        return (
+            f"📅 Choisissez la récurrence :\n\n"
+            f"1️⃣ Quotidien - 100 FCFA/jour\n"
+            f"2️⃣ Mensuel - 3 000 FCFA/mois\n"
+            f"3️⃣ Unique - 22 205 FCFA\n\n"
+            f"Plafond total : 22 205 FCFA\n\n"
+            f"0️⃣ Retour"
+        )
     
     def handle_pass_choix_recurrence(self):
         """Gère le choix de récurrence"""
@@ -445,6 +797,12 @@ class ConversationHandler:
                 )
             self.wa_service.send_text_message(self.session.phone_number, msg)
             return
+
+        # Nom, prénom, téléphone, naissance en un seul message
+        trouvees = entites.extraire(self.message_text)
+        if entites.forts(trouvees):
+            self.prefill_pass(trouvees)
+            return
         
         self.session.update_context('client_nom', self.message_text.upper())
         self.session.current_state = 'PASS_COLLECTE_PRENOM'
@@ -597,7 +955,6 @@ class ConversationHandler:
         """Appelle l'API pour créer la souscription"""
         try:
             ctx = self.session.context
-            token = ctx.get('access_token')
             
             payload = {
                 "produit_pass_id": ctx['produit_pass_id'],
@@ -611,10 +968,9 @@ class ConversationHandler:
                 }
             }
             
-            response = requests.post(
+            response = self.auth.post(
                 f"{settings.API_BASE_URL}/api/v1/paiements/nouvelle-souscription/",
                 json=payload,
-                headers={"Authorization": f"Bearer {token}"}
             )
             
             if response.status_code in [200, 201]:
@@ -646,6 +1002,10 @@ class ConversationHandler:
                     prefix=f"❌ Erreur lors de la création :\n{error}"
                 )
         
+        except TokenExpiredError:
+            self.session_expiree()
+        except ServiceIndisponibleError as e:
+            self.service_indisponible(e)
         except Exception as e:
             logger.error(f"❌ Erreur création souscription: {e}")
             self.wa_service.send_text_message(
@@ -658,27 +1018,30 @@ class ConversationHandler:
     # ========================================
     
     def show_commissions(self):
-        """Affiche les commissions de l'agent"""
+        """Affiche les commissions de l'agent (cache stale-while-revalidate)"""
         try:
-            token = self.session.get_context('access_token')
+            data = get_stats_cache().get(self.session.get_context('agent_id'), self.auth)
+            
+            if data is None:
+                self.send_error("Impossible de récupérer vos commissions.")
+                return
             
-            response = requests.get(
-                f"{settings.API_BASE_URL}/api/v1/agents/{self.session.get_context('agent_id')}/stats/",
-                headers={"Authorization": f"Bearer {token}"}
+            message = (
+                f"💰 VOS COMMISSIONS\n\n"
+                f"👤 {data['nom_complet']}\n"
+                f"🆔 {data['matricule']}\n"
+                f"📍 {data['agence']}\n\n"
+                f"📊 STATISTIQUES :\n"
+                f"• Souscriptions totales : {data['nombre_souscriptions']}\n"
+                f"• Souscriptions actives : {data['souscriptions_actives']}\n"
+                f"• Ce mois : {data['souscriptions_ce_mois']}\n\n"
             )
             
-            if response.status_code == 200:
-                data = response.json()['data']
-                
-                message = (
-                    f"💰 VOS COMMISSIONS\n\n"
-                    f"👤 {data['nom_complet']}\n"
-                    f"🆔 {data['matricule']}\n"
-                    f"📍 {data['agence']}\n\n"
-                    f"📊 STATISTIQUES :\n"
-                    f"• Souscriptions totales : {data['nombre_souscriptions']}\n"
-                    f"• Souscriptions actives : {data['souscriptions_actives']}\n"
-                    f"• Ce mois : {data['souscriptions_ce_mois']}\n\n"
+            if data.get('partiel'):
+                # Statistiques du login : le détail arrive au prochain affichage
+                message += "⏳ Chiffre d'affaires et commissions en cours de mise à jour…\n\n"
+            else:
+                message += (
                     f"💵 CHIFFRE D'AFFAIRES :\n"
                     f"• Total : {int(data['chiffre_affaires'])} FCFA\n"
                     f"• BATELA : {int(data['chiffre_affaires_par_produit']['ca_batela'])} FCFA\n"
@@ -686,14 +1049,15 @@ class ConversationHandler:
                     f"• SALISA : {int(data['chiffre_affaires_par_produit']['ca_salisa'])} FCFA\n\n"
                     f"💰 COMMISSIONS ({data['taux_commission']}%) :\n"
                     f"• Solde : {data['solde_commissions']} FCFA\n\n"
-                    f"0️⃣ Retour menu"
                 )
-                
-                self.wa_service.send_text_message(self.session.phone_number, message)
             
-            else:
-                self.send_error("Impossible de récupérer vos commissions.")
+            message += "0️⃣ Retour menu"
+            self.wa_service.send_text_message(self.session.phone_number, message)
         
+        except TokenExpiredError:
+            self.session_expiree()
+        except ServiceIndisponibleError as e:
+            self.service_indisponible(e)
         except Exception as e:
             logger.error(f"❌ Erreur commissions: {e}")
             self.send_error("Erreur technique.")
@@ -782,19 +1146,22 @@ class ConversationHandler:
             self.show_menu_principal()
             return
         
+        prefill = self.session.context.pop('simulateur_prefill', None) or {}
+
         if choix not in produits_map:
+            # Message libre ("retraite 35 ans prime 25 000 sur 15 ans")
+            trouvees = entites.extraire(self.message_text)
+            produit = trouvees.pop('produit_simulateur', None)
+            if produit:
+                self.lancer_simulation(produit, {**prefill, **trouvees})
+                return
+            if prefill:
+                self.session.update_context('simulateur_prefill', prefill)
             self.send_error("Produit invalide. Choisissez 1-6 ou 0.")
             return
         
-        produit_code = produits_map[choix]
-        
-        # Sauvegarder le produit choisi
-        self.session.update_context('simulateur_produit', produit_code)
-        self.session.current_state = 'SIMULATEUR_COLLECTE'
-        self.session.save()
-        
-        # Afficher le formulaire selon le produit
-        self.afficher_formulaire_simulation(produit_code)
+        # Sauvegarder le produit choisi, formulaire ou saut d'étapes selon le pré-remplissage
+        self.lancer_simulation(produits_map[choix], prefill)
     
     def afficher_formulaire_simulation(self, produit_code):
         """Affiche le formulaire de collecte selon le produit"""
@@ -909,25 +1276,14 @@ class ConversationHandler:
             return
         produit = self.session.get_context('simulateur_produit')
         data = self.session.get_context('simulateur_data', {})
-        
-        # Mapping des étapes selon le produit
-        etapes_retraite = ['nom', 'prenom', 'telephone', 'age', 'prime_mensuelle', 'capital_deces', 'duree']
-        etapes_pension = ['nom', 'prenom', 'telephone', 'age', 'pension_mensuelle', 'duree_couverture']
-        etapes_prevoyance = ['nom', 'prenom', 'telephone', 'age', 'capital_deces', 'duree_couverture']
-        etapes_etudes = ['nom', 'prenom', 'telephone', 'age_parent', 'age_enfant', 'rente_annuelle', 'duree_paiement', 'duree_service']
-        
-        # Déterminer les étapes selon le produit
-        if produit == 'retraite':
-            etapes = etapes_retraite
-        elif 'pension' in produit:
-            etapes = etapes_pension
-        elif produit == 'prevoyance':
-            etapes = etapes_prevoyance
-        elif produit == 'etudes':
-            etapes = etapes_etudes
-        else:
-            etapes = []
-        
+
+        # Plusieurs champs dans un seul message : saut à la première étape manquante
+        if etape == 'nom':
+            trouvees = entites.extraire(self.message_text)
+            if entites.forts(trouvees):
+                self.prefill_simulateur(produit, trouvees)
+                return
+
         # Sauvegarder la donnée actuelle
         if etape == 'nom':
             data['nom'] = self.message_text.upper()
@@ -1231,11 +1587,9 @@ class ConversationHandler:
         try:
             produit = self.session.get_context('simulateur_produit')
             data = self.session.get_context('simulateur_data', {})
-            token = self.session.get_context('access_token')
             
             # Préparer le payload selon le produit
             if produit == 'retraite':
-                endpoint = '/calculateur/retraite/calculer/'
                 parametres = {
                     'prime_periodique_commerciale': data['prime_mensuelle'],
                     'capital_deces': data['capital_deces'],
@@ -1245,7 +1599,6 @@ class ConversationHandler:
                 }
             
             elif 'pension' in produit:
-                endpoint = '/calculateur/pensions/calculer/'
                 type_pension_map = {
                     'pension_securite': 'pension_securite',
                     'pension_confort': 'pension_confort',
@@ -1260,7 +1613,6 @@ class ConversationHandler:
                 }
             
             elif produit == 'prevoyance':
-                endpoint = '/calculateur/prevoyance/calculer/'
                 parametres = {
                     'age': data['age'],
                     'capital_deces': data['capital_deces'],
@@ -1268,7 +1620,6 @@ class ConversationHandler:
                 }
             
             elif produit == 'etudes':
-                endpoint = '/calculateur/etudes/calculer/'
                 parametres = {
                     'age_parent': data['age_parent'],
                     'age_enfant': data.get('age_enfant', 0),
@@ -1281,30 +1632,29 @@ class ConversationHandler:
                 self.send_error("Produit non supporté.")
                 return
             
-            # Appeler l'API
-            response = requests.post(
-                f"{settings.API_BASE_URL}/api/v1/simulateur{endpoint}",
-                json={'parametres_simulation': parametres},
-                headers={'Authorization': f'Bearer {token}'}
-            )
-            
-            if response.status_code == 200:
-                resultat = response.json()
-                
-                # Sauvegarder la simulation
-                self.sauvegarder_simulation(resultat, parametres)
-                
-                # Afficher résultats
-                self.afficher_resultats_simulation(resultat)
-            
-            else:
-                error = response.json().get('error', 'Erreur calcul')
+            # Cache → moteur local ou API selon SIMULATEUR_MODE
+            resultat, erreur = simulateur.calculer(produit, parametres, self.auth)
+            if resultat is None:
                 self.session.current_state = 'MENU_PRINCIPAL'
                 self.session.save()
                 self.show_menu_principal(
-                    prefix=f"❌ Erreur lors du calcul :\n{error}"
+                    prefix=f"❌ Erreur lors du calcul :\n{erreur}"
                 )
+                return
+            
+            # Sauvegarder la simulation
+            self.sauvegarder_simulation(resultat, parametres)
+            
+            # Afficher résultats
+            self.afficher_resultats_simulation(resultat)
+            
+            # Base de la commande 'grille' (variantes de cette simulation)
+            self.session.update_context('grille_base', {'produit': produit, 'parametres': parametres})
         
+        except TokenExpiredError:
+            self.session_expiree()
+        except ServiceIndisponibleError as e:
+            self.service_indisponible(e)
         except Exception as e:
             logger.error(f"❌ Erreur calcul simulation: {e}")
             self.wa_service.send_text_message(
@@ -1317,7 +1667,6 @@ class ConversationHandler:
         try:
             produit = self.session.get_context('simulateur_produit')
             data = self.session.get_context('simulateur_data', {})
-            token = self.session.get_context('access_token')
             
             payload = {
                 'produit_type': produit,
@@ -1328,10 +1677,9 @@ class ConversationHandler:
                 'resultats_simulation': resultat.get('resultats_simulation', {})
             }
             
-            response = requests.post(
+            response = self.auth.post(
                 f"{settings.API_BASE_URL}/api/v1/simulateur/simulations/",
                 json=payload,
-                headers={'Authorization': f'Bearer {token}'}
             )
             
             if response.status_code == 201:
@@ -1401,6 +1749,66 @@ class ConversationHandler:
         self.session.save()
         self.show_menu_principal(prefix=message)
     
+    # ========================================
+    # GRILLE DE SIMULATIONS
+    # ========================================
+    
+    PRODUITS_GRILLE = {
+        'retraite': 'retraite',
+        'securite': 'pension_securite',
+        'confort': 'pension_confort',
+        'renfort': 'pension_renfort',
+        'prevoyance': 'prevoyance',
+        'etudes': 'etudes',
+    }
+    
+    AIDE_GRILLE = (
+        "📊 GRILLE DE SIMULATIONS\n\n"
+        "grille <produit> param=valeurs …\n\n"
+        "Produits : retraite, securite, confort, renfort, prevoyance, etudes\n"
+        "Paramètres : age, duree, prime, capital, pension, rente, service\n"
+        "Valeurs : 30,35,40 ou 30-40:5\n\n"
+        "Exemple :\ngrille retraite age=30-40:5 duree=10,15,20 prime=50000 capital=1000000\n\n"
+        "Après une simulation, seuls les paramètres à faire varier sont nécessaires :\n"
+        "grille duree=10,15,20"
+    )
+    
+    def handle_grille(self):
+        """Commande 'grille' : compare plusieurs variantes d'une simulation en une réponse"""
+        morceaux = self.message_text.split()[1:]
+        derniere = self.session.get_context('grille_base') or {}
+        
+        produit = derniere.get('produit')
+        if morceaux and '=' not in morceaux[0]:
+            nom = morceaux.pop(0).lower().replace('é', 'e').replace('pension_', '')
+            produit = self.PRODUITS_GRILLE.get(nom)
+        
+        if not produit or not morceaux:
+            self.wa_service.send_text_message(self.session.phone_number, self.AIDE_GRILLE)
+            return
+        
+        base = dict(derniere.get('parametres', {})) if derniere.get('produit') == produit else {}
+        try:
+            variations = {}
+            for morceau in morceaux:
+                cle, _, valeurs = morceau.partition('=')
+                variations[cle.lower()] = simulateur.parse_valeurs(valeurs)
+            grille = simulateur.calculer_grille(produit, base, variations, self.auth)
+        except simulateur.GrilleError as e:
+            self.send_error(f"{e}\n\nTapez 'grille' pour l'aide.")
+            return
+        except TokenExpiredError:
+            self.session_expiree()
+            return
+        except ServiceIndisponibleError as e:
+            self.service_indisponible(e)
+            return
+        
+        self.wa_service.send_text_message(
+            self.session.phone_number,
+            f"{simulateur.formater_grille(grille)}\n\n0️⃣ Menu principal"
+        )
+    
     # ========================================
     # HELPERS
     # ========================================
@@ -1412,10 +1820,32 @@ class ConversationHandler:
             f"❌ {message}"
         )
     
+    def session_expiree(self):
+        """Jeton non renouvelable : retour à l'écran de connexion"""
+        self.session.current_state = 'ATTENTE_LOGIN'
+        self.session.reset_context()
+        self.session.save()
+        self.wa_service.send_text_message(
+            self.session.phone_number,
+            "🔒 Votre session a expiré.\n\nReconnectez-vous : MATRICULE:MOTDEPASSE"
+        )
+    
+    def service_indisponible(self, erreur):
+        """API NSIA rejetée ou injoignable : message d'attente, état conservé"""
+        logger.warning(f"⚠️ API NSIA indisponible : {erreur}")
+        retour = "0 - Aide" if self.session.current_state == 'ATTENTE_LOGIN' else "0️⃣ Menu principal"
+        self.wa_service.send_text_message(
+            self.session.phone_number,
+            f"{ServiceIndisponibleError.message}\n\n{retour}"
+        )
+    
     def send_welcome(self):
         """Message de bienvenue"""
+        agent = get_agent_directory().get_by_telephone(self.session.phone_number)
+        salutation = f"👋 Bonjour {agent.prenom} !\n\n" if agent else ""
         self.wa_service.send_text_message(
             self.session.phone_number,
+            f"{salutation}"
             "🏦 NSIA VIE ASSURANCES\n"
             "Chatbot Commercial WhatsApp\n\n"
             "📱 Pour vous connecter :\n"
@@ -0,0 +1,74 @@
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from .metrics import metrics
+
+_lock = threading.Lock()
+_session = None
+
+
+def get_session():
+    """
+    Session HTTP partagée par tout le processus.
+
+    urllib3 maintient un pool de connexions keep-alive par hôte
+    (api.wassenger.com, API NSIA, Gemini) : les poignées de main TCP/TLS
+    ne sont payées qu'une fois par connexion et non plus à chaque requête.
+    La session est créée au premier appel, donc après le fork gunicorn.
+
+    Aucun cookie n'est conservé : la session sert tous les agents, un
+    Set-Cookie reçu pour l'un serait renvoyé dans les appels des autres.
+    L'authentification passe par les en-têtes de chaque requête.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(
+                    pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Envoie une requête via le pool partagé avec des timeouts uniformes.
+
+    Sans `timeout` explicite, (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    est appliqué. Latence et erreurs sont comptabilisées par hôte.
+    """
+    if timeout is None:
+        timeout = (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+    host = urlsplit(url).hostname or 'inconnu'
+    start = time.monotonic()
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.RequestException:
+        metrics.incr(f'http.{host}.errors')
+        raise
+    finally:
+        metrics.observe(f'http.{host}', (time.monotonic() - start) * 1000)
+
+    metrics.incr(f'http.{host}.status_{response.status_code // 100}xx')
+    if response.status_code >= 500:
+        metrics.incr(f'http.{host}.errors')
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -0,0 +1,285 @@
+"""
+Détection d'intention des messages libres du menu principal, par niveaux :
+
+1. règles : réponses exactes et mots-clés (aucun coût) ;
+2. classifieur local : n-grammes de caractères + régression logistique,
+   entraîné hors ligne (manage.py train_intents) et chargé une fois ;
+3. Gemini (AIService.detect_intent), seulement si la confiance locale
+   est sous INTENT_LOCAL_THRESHOLD.
+
+Les intentions restent celles du prompt Gemini : SUBSCRIBE_PASS,
+CHECK_COMMISSIONS, RUN_SIMULATION, UNKNOWN.
+"""
+import json
+import logging
+import math
+import random
+import re
+import threading
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from .ai_service import get_ai_service
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ('SUBSCRIBE_PASS', 'CHECK_COMMISSIONS', 'RUN_SIMULATION', 'UNKNOWN')
+NIVEAUX = ('regle', 'local', 'gemini', 'aucun')
+
+# Identifiants de boutons / listes et réponses courtes sans ambiguïté
+EXACTS = {
+    'menu_1': 'SUBSCRIBE_PASS',
+    'menu_2': 'CHECK_COMMISSIONS',
+    'menu_3': 'RUN_SIMULATION',
+    'pass': 'SUBSCRIBE_PASS',
+    'commissions': 'CHECK_COMMISSIONS',
+    'simulateur': 'RUN_SIMULATION',
+}
+
+# Mots-clés sur le texte normalisé (minuscules, sans accents)
+MOTS_CLES = [
+    (re.compile(r'\b(souscri|inscri|adhe|adhes|enrol|pass\b|contrat|batela|kimia|salisa)'), 'SUBSCRIBE_PASS'),
+    (re.compile(r'\b(commission|gain|solde|chiffre d ?affaire|remuneration|combien j ?ai)'), 'CHECK_COMMISSIONS'),
+    (re.compile(r'\b(simul|calcul|devis|cotation|tarif|projet (de )?retraite|etudes?\b)'), 'RUN_SIMULATION'),
+]
+
+_journal_lock = threading.Lock()
+
+
+def normaliser(texte):
+    """'Mes Commissions ?!' → 'mes commissions'"""
+    texte = unicodedata.normalize('NFKD', texte.lower())
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', texte).split())
+
+
+def par_regles(texte):
+    """Intention certaine d'après les règles, ou None (aucune ou plusieurs correspondances)"""
+    if texte in EXACTS:
+        return EXACTS[texte]
+    trouvees = {intent for motif, intent in MOTS_CLES if motif.search(texte)}
+    return trouvees.pop() if len(trouvees) == 1 else None
+
+
+# ========================================
+# CLASSIFIEUR LOCAL
+# ========================================
+
+class ClassifieurIntentions:
+    """
+    Régression logistique multinomiale sur n-grammes de caractères.
+
+    Poids creux (n-gramme → un poids par classe) : le modèle sérialisé en
+    JSON pèse quelques centaines de Ko et se charge sans dépendance.
+    """
+
+    def __init__(self, classes, poids=None, biais=None, n_min=2, n_max=4):
+        self.classes = list(classes)
+        self.poids = poids or {}
+        self.biais = biais or [0.0] * len(self.classes)
+        self.n_min = n_min
+        self.n_max = n_max
+
+    def caracteristiques(self, texte):
+        """n-grammes de caractères (mots bornés par des espaces), normalisés L2"""
+        texte = f" {normaliser(texte)} "
+        compte = Counter(
+            texte[i:i + n]
+            for n in range(self.n_min, self.n_max + 1)
+            for i in range(len(texte) - n + 1)
+        )
+        norme = math.sqrt(sum(v * v for v in compte.values())) or 1.0
+        return {g: v / norme for g, v in compte.items()}
+
+    def probabilites(self, texte, x=None):
+        x = x if x is not None else self.caracteristiques(texte)
+        scores = list(self.biais)
+        for g, v in x.items():
+            w = self.poids.get(g)
+            if w:
+                for k, wk in enumerate(w):
+                    scores[k] += wk * v
+        m = max(scores)
+        exps = [math.exp(s - m) for s in scores]
+        total = sum(exps)
+        return {c: e / total for c, e in zip(self.classes, exps)}
+
+    def predire(self, texte):
+        """Retourne (intention, probabilité)"""
+        probas = self.probabilites(texte)
+        intent = max(probas, key=probas.get)
+        return intent, probas[intent]
+
+    @classmethod
+    def entrainer(cls, exemples, epochs=30, pas=0.5, l2=1e-4, n_min=2, n_max=4, graine=0):
+        """Descente de gradient stochastique sur [(texte, intention), ...]"""
+        modele = cls(sorted({intent for _, intent in exemples}), n_min=n_min, n_max=n_max)
+        index = {c: k for k, c in enumerate(modele.classes)}
+        donnees = [(modele.caracteristiques(t), index[i]) for t, i in exemples]
+        rng = random.Random(graine)
+        nb = len(modele.classes)
+
+        for epoch in range(epochs):
+            rng.shuffle(donnees)
+            taux = pas / (1 + epoch * 0.1)
+            for x, y in donnees:
+                probas = list(modele.probabilites(None, x).values())
+                for k in range(nb):
+                    erreur = probas[k] - (1.0 if k == y else 0.0)
+                    modele.biais[k] -= taux * erreur
+                    for g, v in x.items():
+                        w = modele.poids.setdefault(g, [0.0] * nb)
+                        w[k] -= taux * (erreur * v + l2 * w[k])
+        return modele
+
+    def to_dict(self, seuil=1e-4):
+        poids = {
+            g: [round(v, 5) for v in w]
+            for g, w in self.poids.items()
+            if max(abs(v) for v in w) > seuil
+        }
+        return {
+            'classes': self.classes, 'biais': self.biais, 'poids': poids,
+            'n_min': self.n_min, 'n_max': self.n_max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['classes'], data['poids'], data['biais'], data['n_min'], data['n_max'])
+
+    def sauver(self, chemin):
+        with open(chemin, 'w', encoding='utf-8') as fh:
+            json.dump(self.to_dict(), fh, ensure_ascii=False)
+
+    @classmethod
+    def charger(cls, chemin):
+        with open(chemin, encoding='utf-8') as fh:
+            return cls.from_dict(json.load(fh))
+
+
+@lru_cache(maxsize=None)
+def get_classifieur():
+    """Modèle local chargé une fois par processus (None si absent)"""
+    metrics.register_gauge('intents', stats)
+    chemin = settings.INTENT_MODEL_PATH
+    if not chemin:
+        return None
+    try:
+        modele = ClassifieurIntentions.charger(chemin)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"⚠️ Modèle d'intentions non chargé ({chemin}) : {e}")
+        return None
+    logger.info(f"🧠 Modèle d'intentions chargé : {len(modele.poids)} n-grammes, classes {modele.classes}")
+    return modele
+
+
+# ========================================
+# PIPELINE
+# ========================================
+
+def detecter(texte, gemini=True):
+    """
+    Retourne {'intent', 'confidence', 'niveau', ...} ; les entités
+    (product, client_name, amount) ne sont fournies que par Gemini.
+
+    gemini=False : niveaux instantanés seulement (le handler lance Gemini
+    en spéculatif, voir speculation.py).
+    """
+    normalise = normaliser(texte)
+    with metrics.timer('intents.regle'):
+        intent = par_regles(normalise)
+    if intent:
+        journaliser(texte, intent, 'regle', 1.0)
+        return _resultat({'intent': intent, 'confidence': 1.0}, 'regle')
+
+    local = None
+    modele = get_classifieur()
+    if modele is not None:
+        with metrics.timer('intents.local'):
+            intent, confiance = modele.predire(texte)
+        local = {'intent': intent, 'confidence': round(confiance, 3)}
+        if confiance >= settings.INTENT_LOCAL_THRESHOLD:
+            return _resultat(local, 'local')
+
+    if gemini:
+        data = par_gemini(texte)
+        if data is not None:
+            return data
+
+    # Gemini indisponible : le modèle local reste le meilleur avis
+    if local is not None:
+        return _resultat(local, 'local')
+    return _resultat({'intent': 'UNKNOWN', 'confidence': 0.0}, 'aucun')
+
+
+def gemini_utile(resultat):
+    """Vrai si les niveaux locaux n'ont pas tranché et que Gemini est configuré"""
+    if resultat['niveau'] == 'regle':
+        return False
+    if resultat['niveau'] == 'local' and resultat['confidence'] >= settings.INTENT_LOCAL_THRESHOLD:
+        return False
+    return get_ai_service().is_available()
+
+
+def par_gemini(texte, timeout=None):
+    """Niveau 3 : Gemini (réponse en cache comprise) ; None si indisponible ou en erreur"""
+    ai_service = get_ai_service()
+    if not ai_service.is_available():
+        return None
+    with metrics.timer('intents.gemini'):
+        data = ai_service.detect_intent(texte, timeout=timeout)
+    if data and data.get('intent') in INTENTS:
+        journaliser(texte, data['intent'], 'gemini', data.get('confidence'))
+        return _resultat(data, 'gemini')
+    return None
+
+
+def confiant(resultat):
+    """Intention exploitable pour router (hors UNKNOWN, au-dessus d'INTENT_MIN_CONFIDENCE)"""
+    return (
+        resultat is not None
+        and resultat['intent'] in INTENTS
+        and resultat['intent'] != 'UNKNOWN'
+        and (resultat.get('confidence') or 0) >= settings.INTENT_MIN_CONFIDENCE
+    )
+
+
+def _resultat(data, niveau):
+    metrics.incr(f'intents.{niveau}')
+    return {**data, 'niveau': niveau}
+
+
+def journaliser(texte, intent, niveau, confiance):
+    """Ajoute l'exemple étiqueté au JSONL d'entraînement (INTENT_LOG), sans jamais lever"""
+    if not settings.INTENT_LOG:
+        return
+    ligne = json.dumps({
+        'date': timezone.now().isoformat(),
+        'texte': texte,
+        'intent': intent,
+        'niveau': niveau,
+        'confidence': confiance,
+    }, ensure_ascii=False)
+    try:
+        with _journal_lock, open(settings.INTENT_LOG, 'a', encoding='utf-8') as fh:
+            fh.write(ligne + '\n')
+    except OSError as e:
+        logger.warning(f"⚠️ Journal d'intentions non écrit : {e}")
+
+
+def stats():
+    total = sum(metrics.get_counter(f'intents.{n}') for n in NIVEAUX)
+    return {
+        'total': total,
+        **{
+            f'{n}_rate': round(metrics.get_counter(f'intents.{n}') / total, 4) if total else 0
+            for n in NIVEAUX
+        },
+        'speculation': {
+            etape: metrics.get_counter(f'intents.speculation.{etape}')
+            for etape in ('launched', 'applied', 'dropped', 'late', 'stale')
+        },
+    }
@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Exists, F, Max, Min, OuterRef, Q
+from django.utils import timezone
+from .models import ConversationJob
+from .metrics import metrics
+from .session_cache import get_session_cache
+
+logger = logging.getLogger(__name__)
+
+# Verrous de session hors PostgreSQL (développement SQLite) : un par session, par processus
+_verrous_locaux = weakref.WeakValueDictionary()
+_verrous_locaux_lock = threading.Lock()
+
+
+class SessionLockTimeout(Exception):
+    """Verrou de session non obtenu dans WHATSAPP_SESSION_LOCK_TIMEOUT"""
+
+
+def enqueue(session_id, message, text):
+    """Ajoute un message entrant dans la file de traitement"""
+    job = ConversationJob.objects.create(
+        session_id=session_id,
+        message=message,
+        text=text,
+        received_at=message.timestamp if message else timezone.now(),
+    )
+    metrics.incr('jobs.enqueued')
+    return job
+
+
+def requeue_stale():
+    """
+    Remet en file les jobs 'running' abandonnés (worker arrêté en cours de traitement).
+
+    Un job est abandonné quand son worker n'a plus donné signe de vie
+    (heartbeat) depuis WHATSAPP_JOB_STALE_AFTER : un tour long (démarrage à
+    froid de l'API, grille de simulations) n'est jamais rejoué tant que son
+    worker tourne.
+    """
+    limite = timezone.now() - timedelta(seconds=settings.WHATSAPP_JOB_STALE_AFTER)
+    abandonne = Q(heartbeat_at__lt=limite) | Q(heartbeat_at__isnull=True, started_at__lt=limite)
+    count = ConversationJob.objects.filter(abandonne, status='running').update(
+        status='pending',
+        available_at=timezone.now(),
+        last_error='Job abandonné par le worker',
+    )
+    if count:
+        logger.warning(f"⚠️ {count} job(s) abandonné(s) remis en file")
+    return count
+
+
+def claim(limit):
+    """
+    Réserve jusqu'à `limit` jobs prêts à être traités.
+
+    SKIP LOCKED permet à plusieurs workers de dépiler la même file sans
+    se bloquer ; le passage à 'running' est validé dans la même transaction.
+
+    Un job n'est éligible que s'il est le plus ancien job non terminé de sa
+    session : les messages d'un même agent sont traités strictement dans
+    l'ordre d'arrivée, ceux d'agents différents en parallèle.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    precedent = ConversationJob.objects.filter(
+        session_id=OuterRef('session_id'),
+        id__lt=OuterRef('id'),
+        status__in=('pending', 'running'),
+    )
+    with transaction.atomic():
+        ids = list(
+            ConversationJob.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .exclude(Exists(precedent))
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        ConversationJob.objects.filter(id__in=ids).update(
+            status='running',
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+
+    return list(ConversationJob.objects.filter(id__in=ids).order_by('id'))
+
+
+def heartbeat(job_ids):
+    """Signe de vie des jobs en cours du worker (voir requeue_stale)"""
+    if not job_ids:
+        return 0
+    return ConversationJob.objects.filter(id__in=job_ids, status='running').update(heartbeat_at=timezone.now())
+
+
+def set_lock_timeout():
+    """Borne l'attente des verrous dans la transaction courante (PostgreSQL)"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL lock_timeout = %s", [f"{settings.WHATSAPP_SESSION_LOCK_TIMEOUT}ms"])
+
+
+def _cle_verrou(session_id):
+    """Clé bigint de l'advisory lock : 64 premiers bits de l'UUID de session"""
+    return int.from_bytes(uuid.UUID(str(session_id)).bytes[:8], 'big', signed=True)
+
+
+@contextmanager
+def verrou_session(session_id):
+    """
+    Exclusion mutuelle des tours d'une même session, sans transaction ouverte.
+
+    PostgreSQL : advisory lock de niveau connexion (pg_advisory_lock), pris
+    dans une transaction éphémère pour borner l'attente (lock_timeout) puis
+    conservé après son commit ; il ne retient ni ligne ni snapshot et tombe
+    avec la connexion si le worker meurt. Ailleurs : verrou par processus.
+    """
+    if connection.vendor != 'postgresql':
+        with _verrous_locaux_lock:
+            verrou = _verrous_locaux.get(session_id)
+            if verrou is None:
+                verrou = _verrous_locaux[session_id] = threading.Lock()
+        if not verrou.acquire(timeout=settings.WHATSAPP_SESSION_LOCK_TIMEOUT / 1000):
+            raise SessionLockTimeout(f"Session {session_id} verrouillée")
+        try:
+            yield
+        finally:
+            verrou.release()
+        return
+
+    cle = _cle_verrou(session_id)
+    with transaction.atomic():
+        set_lock_timeout()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [cle])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [cle])
+
+
+def run_locked(session_id, text):
+    """
+    Exécute le ConversationHandler sous verrou de session.
+
+    Le verrou sérialise les traitements d'un même numéro (double tap,
+    webhook inline sur plusieurs workers gunicorn, routage spéculatif)
+    sans garder de transaction ouverte : les appels NSIA / Gemini du
+    handler (jusqu'à NSIA_COLD_START_TIMEOUT) ne retiennent ni verrou de
+    ligne ni transaction. Les écritures du tour (session, messages
+    sortants, boîte d'envoi) sont validées ensemble en fin de tour, dans
+    une transaction courte (ConversationHandler.handle).
+
+    Une écriture hors chatbot pendant le tour (admin, archivage) est
+    détectée par la version de session : SessionConflictError, le job est
+    rejoué.
+
+    La session est servie par le cache de sessions si son instantané est à
+    la version en base ; elle y est remise après le tour.
+    Retourne le temps d'attente du verrou en millisecondes.
+    """
+    from .handlers import ConversationHandler
+
+    sessions = get_session_cache()
+    start = time.monotonic()
+    with verrou_session(session_id):
+        lock_wait_ms = int((time.monotonic() - start) * 1000)
+        metrics.observe('sessions.lock_wait', lock_wait_ms)
+
+        session = sessions.load(session_id)
+        with metrics.timer('jobs.handler'):
+            ConversationHandler(session, text).handle()
+        sessions.remember(session)
+    return lock_wait_ms
+
+
+def execute(job):
+    """Exécute le ConversationHandler pour un job réservé"""
+    try:
+        lock_wait_ms = run_locked(job.session_id, job.text)
+    except Exception as e:
+        logger.error(f"❌ Job {job.id} en erreur (essai {job.attempts}): {e}", exc_info=True)
+        _mark_failed(job, e)
+        return False
+
+    finished_at = timezone.now()
+    latency_ms = int((finished_at - job.received_at).total_seconds() * 1000)
+    ConversationJob.objects.filter(pk=job.pk).update(
+        status='done',
+        finished_at=finished_at,
+        latency_ms=latency_ms,
+        lock_wait_ms=lock_wait_ms,
+        last_error='',
+    )
+    metrics.incr('jobs.done')
+    metrics.observe('jobs.end_to_end', latency_ms)
+    return True
+
+
+def _mark_failed(job, error):
+    """Replanifie le job avec backoff exponentiel ou l'abandonne définitivement"""
+    if job.attempts >= settings.WHATSAPP_JOB_MAX_ATTEMPTS:
+        ConversationJob.objects.filter(pk=job.pk).update(
+            status='failed',
+            finished_at=timezone.now(),
+            last_error=str(error)[:2000],
+        )
+        metrics.incr('jobs.failed')
+        return
+
+    delay = settings.WHATSAPP_JOB_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+    ConversationJob.objects.filter(pk=job.pk).update(
+        status='pending',
+        available_at=timezone.now() + timedelta(seconds=delay),
+        last_error=str(error)[:2000],
+    )
+    metrics.incr('jobs.retried')
+
+
+def queue_stats():
+    """Profondeur de file et latences de bout en bout (calculées en base)"""
+    now = timezone.now()
+    par_statut = dict(
+        ConversationJob.objects.order_by().values_list('status').annotate(n=Count('id'))
+    )
+    oldest = ConversationJob.objects.filter(status='pending').aggregate(oldest=Min('received_at'))['oldest']
+    recent = ConversationJob.objects.filter(
+        status='done',
+        finished_at__gte=now - timedelta(minutes=15),
+    ).aggregate(
+        avg=Avg('latency_ms'),
+        max=Max('latency_ms'),
+        count=Count('id'),
+        lock_wait_avg=Avg('lock_wait_ms'),
+        lock_wait_max=Max('lock_wait_ms'),
+    )
+
+    return {
+        'depth': par_statut.get('pending', 0),
+        'running': par_statut.get('running', 0),
+        'failed': par_statut.get('failed', 0),
+        'oldest_pending_age_s': round((now - oldest).total_seconds(), 1) if oldest else 0,
+        'latency_15min': {
+            'count': recent['count'],
+            'avg_ms': round(recent['avg'] or 0, 1),
+            'max_ms': recent['max'] or 0,
+        },
+        'lock_wait_15min': {
+            'avg_ms': round(recent['lock_wait_avg'] or 0, 1),
+            'max_ms': recent['lock_wait_max'] or 0,
+        },
+    }
@@ -0,0 +1,197 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from apps.whatsapp_bot.models import (
+    ArchivedMessage, WhatsAppMessage, WhatsAppSession, ConversationJob, OutboundMessage, GeminiCacheEntry,
+    PendingDeliveryStatus, SimulationShadow,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive les anciens messages WhatsApp dans la table whatsapp_messages_archive (par mois), "
+        "purge les payloads bruts, les jobs/envois terminés, les paires shadow du simulateur, "
+        "les réponses Gemini expirées "
+        "et désactive les sessions inactives. "
+        "Traitement par lots courts pour ne pas bloquer les insertions du webhook."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.WHATSAPP_MESSAGE_RETENTION_DAYS,
+                            help="Archive les messages plus anciens que N jours")
+        parser.add_argument('--raw-days', type=int, default=settings.WHATSAPP_RAW_PAYLOAD_RETENTION_DAYS,
+                            help="Supprime les payloads bruts plus anciens que N jours")
+        parser.add_argument('--session-idle-days', type=int, default=settings.WHATSAPP_SESSION_IDLE_DAYS,
+                            help="Désactive les sessions inactives depuis N jours")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Pause (secondes) entre deux lots")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        self.dry_run = options['dry_run']
+        now = timezone.now()
+
+        self._run_step("Messages archivés", self.archive_messages,
+                       now - timedelta(days=options['days']))
+        self._run_step("Payloads bruts purgés", self.purge_raw_payloads,
+                       now - timedelta(days=options['raw_days']))
+        self._run_step("Jobs / envois terminés / paires shadow purgés", self.purge_finished_queues,
+                       now - timedelta(days=options['days']))
+        self._run_step("Sessions inactives désactivées", self.deactivate_sessions,
+                       now - timedelta(days=options['session_idle_days']))
+        self._run_step("Réponses Gemini expirées purgées", self.purge_gemini_cache, now)
+
+    def _run_step(self, label, func, *args):
+        start = time.monotonic()
+        count = func(*args)
+        elapsed = time.monotonic() - start
+        rate = count / elapsed if elapsed > 0 else 0
+        suffix = " (dry-run)" if self.dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {label} : {count} ligne(s) en {elapsed:.1f}s ({rate:.0f} lignes/s){suffix}"
+        ))
+
+    def _sleep(self):
+        if self.pause:
+            time.sleep(self.pause)
+
+    # ========================================
+    # MESSAGES
+    # ========================================
+
+    def archive_messages(self, cutoff):
+        """
+        Déplace les messages antérieurs à `cutoff` vers whatsapp_messages_archive.
+
+        Copie et suppression d'un lot sont validées dans la même transaction :
+        un message n'est supprimé que si son archive est écrite en base.
+        """
+        total = 0
+        last = None
+        while True:
+            # Pagination par clé (timestamp, id) : pas d'OFFSET, pas de gros DELETE
+            qs = WhatsAppMessage.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id')
+            if last is not None:
+                qs = qs.filter(Q(timestamp__gt=last[0]) | Q(timestamp=last[0], id__gt=last[1]))
+            batch = list(qs[:self.batch_size])
+            if not batch:
+                break
+
+            if not self.dry_run:
+                with transaction.atomic():
+                    ArchivedMessage.objects.bulk_create([self._archive(m) for m in batch])
+                    WhatsAppMessage.objects.filter(pk__in=[m.pk for m in batch]).delete()
+
+            total += len(batch)
+            last = (batch[-1].timestamp, batch[-1].id)
+            self._sleep()
+
+        return total
+
+    def _archive(self, message):
+        return ArchivedMessage(
+            id=message.id,
+            mois=message.timestamp.strftime('%Y-%m'),
+            session_id=message.session_id,
+            whatsapp_message_id=message.whatsapp_message_id,
+            direction=message.direction,
+            message_type=message.message_type,
+            content=message.content,
+            timestamp=message.timestamp,
+            raw_payload=message.raw_payload,
+            delivery_status=message.delivery_status,
+        )
+
+    def purge_raw_payloads(self, cutoff):
+        """Supprime les payloads bruts compressés plus anciens que `cutoff`"""
+        qs = WhatsAppMessage.objects.filter(timestamp__lt=cutoff, raw_payload__isnull=False)
+        if self.dry_run:
+            return qs.count()
+
+        total = 0
+        while True:
+            ids = list(qs.order_by('timestamp').values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                break
+            total += WhatsAppMessage.objects.filter(pk__in=ids).update(raw_payload=None)
+            self._sleep()
+        return total
+
+    # ========================================
+    # FILES DE TRAITEMENT
+    # ========================================
+
+    def purge_finished_queues(self, cutoff):
+        """Supprime les jobs et envois terminés, les paires shadow et les accusés orphelins antérieurs à `cutoff`"""
+        total = 0
+        for model, statuts, champ in (
+            (ConversationJob, ('done', 'failed'), 'received_at'),
+            (OutboundMessage, ('sent', 'failed'), 'created_at'),
+            # Paires shadow : à exporter (export_simulateur_reference) avant expiration
+            (SimulationShadow, None, 'created_at'),
+            # Accusés jamais rattachés (messages envoyés hors chatbot)
+            (PendingDeliveryStatus, None, 'received_at'),
+        ):
+            qs = model.objects.filter(**{f'{champ}__lt': cutoff})
+            if statuts:
+                qs = qs.filter(status__in=statuts)
+            if self.dry_run:
+                total += qs.count()
+                continue
+            while True:
+                ids = list(qs.order_by('id').values_list('id', flat=True)[:self.batch_size])
+                if not ids:
+                    break
+                deleted, _ = model.objects.filter(pk__in=ids).delete()
+                total += deleted
+                self._sleep()
+        return total
+
+    def purge_gemini_cache(self, now):
+        """Supprime les réponses Gemini expirées (GEMINI_CACHE_PERSIST)"""
+        qs = GeminiCacheEntry.objects.filter(expires_at__lt=now)
+        if self.dry_run:
+            return qs.count()
+
+        total = 0
+        while True:
+            cles = list(qs.values_list('cle', flat=True)[:self.batch_size])
+            if not cles:
+                break
+            deleted, _ = GeminiCacheEntry.objects.filter(pk__in=cles).delete()
+            total += deleted
+            self._sleep()
+        return total
+
+    # ========================================
+    # SESSIONS
+    # ========================================
+
+    def deactivate_sessions(self, cutoff):
+        """Désactive les sessions inactives et efface leur contexte (jetons compris)"""
+        qs = WhatsAppSession.objects.filter(is_active=True, last_activity__lt=cutoff)
+        if self.dry_run:
+            return qs.count()
+
+        total = 0
+        while True:
+            ids = list(qs.order_by('last_activity').values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                break
+            # update() ne touche pas last_activity (auto_now) : la date d'inactivité est conservée
+            total += WhatsAppSession.objects.filter(pk__in=ids).update(
+                is_active=False,
+                context={},
+                current_state='ATTENTE_LOGIN',
+                agent=None,
+                version=F('version') + 1,
+            )
+            self._sleep()
+        return total
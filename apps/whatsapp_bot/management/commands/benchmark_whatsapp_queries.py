@@ -0,0 +1,175 @@
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from apps.whatsapp_bot.models import WhatsAppSession, WhatsAppMessage
+
+# Préfixe des numéros générés : permet de retrouver / nettoyer les données de test
+BENCH_PREFIX = '+999'
+
+
+@contextmanager
+def _dates_explicites(*fields):
+    """Désactive auto_now/auto_now_add le temps du seed pour étaler les dates"""
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données local (sessions + messages) et compare plans "
+        "d'exécution et temps des requêtes courantes sans puis avec les index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=50_000)
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--runs', type=int, default=20, help="Exécutions par requête")
+        parser.add_argument('--no-seed', action='store_true', help="Réutilise les données déjà générées")
+        parser.add_argument('--cleanup', action='store_true', help="Supprime les données générées puis quitte")
+        parser.add_argument('--force', action='store_true', help="Autorise l'exécution avec DEBUG=False")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Benchmark réservé à une base locale (DEBUG=True ou --force).")
+
+        if options['cleanup']:
+            deleted, _ = WhatsAppSession.objects.filter(phone_number__startswith=BENCH_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f"🧹 {deleted} ligne(s) supprimée(s)"))
+            return
+
+        if not options['no_seed']:
+            self.seed(options['sessions'], options['messages'])
+
+        self.runs = options['runs']
+        queries = self.build_queries()
+        indexes = (
+            [(WhatsAppSession, idx) for idx in WhatsAppSession._meta.indexes]
+            + [(WhatsAppMessage, idx) for idx in WhatsAppMessage._meta.indexes]
+        )
+
+        self.stdout.write(f"\n===== SANS INDEX ({connection.vendor}) =====")
+        with connection.schema_editor() as editor:
+            for model, idx in indexes:
+                editor.remove_index(model, idx)
+        try:
+            self.analyze()
+            before = self.measure(queries)
+        finally:
+            with connection.schema_editor() as editor:
+                for model, idx in indexes:
+                    editor.add_index(model, idx)
+
+        self.stdout.write(f"\n===== AVEC INDEX ({connection.vendor}) =====")
+        self.analyze()
+        after = self.measure(queries)
+
+        self.stdout.write("\n===== RÉSUMÉ (médiane) =====")
+        for name in queries:
+            gain = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f"• {name:<28} {before[name]:>9.2f} ms → {after[name]:>8.2f} ms  (x{gain:.1f})")
+
+    # ========================================
+    # SEED
+    # ========================================
+
+    def seed(self, nb_sessions, nb_messages, batch_size=5000):
+        self.stdout.write(f"🌱 Génération de {nb_sessions} sessions et {nb_messages} messages…")
+        start = time.monotonic()
+        now = timezone.now()
+        etats = [code for code, _ in WhatsAppSession.ETATS]
+
+        session_fields = [WhatsAppSession._meta.get_field(n) for n in ('last_activity', 'created_at')]
+        message_fields = [WhatsAppMessage._meta.get_field('timestamp')]
+
+        with _dates_explicites(*session_fields, *message_fields):
+            session_ids = []
+            for offset in range(0, nb_sessions, batch_size):
+                batch = []
+                for i in range(offset, min(offset + batch_size, nb_sessions)):
+                    activity = now - timedelta(minutes=random.randint(0, 60 * 24 * 180))
+                    batch.append(WhatsAppSession(
+                        id=uuid.uuid4(),
+                        phone_number=f"{BENCH_PREFIX}{i:011d}",
+                        current_state=random.choice(etats),
+                        context={'agent_name': f"Agent {i}"},
+                        is_active=random.random() < 0.2,
+                        last_activity=activity,
+                        created_at=activity,
+                    ))
+                with transaction.atomic():
+                    WhatsAppSession.objects.bulk_create(batch)
+                session_ids.extend(s.id for s in batch)
+
+            for offset in range(0, nb_messages, batch_size):
+                batch = [
+                    WhatsAppMessage(
+                        session_id=random.choice(session_ids),
+                        direction=random.choice(('incoming', 'outgoing')),
+                        message_type='chat',
+                        content={'text': 'benchmark'},
+                        timestamp=now - timedelta(seconds=random.randint(0, 86400 * 180)),
+                    )
+                    for _ in range(offset, min(offset + batch_size, nb_messages))
+                ]
+                with transaction.atomic():
+                    WhatsAppMessage.objects.bulk_create(batch)
+
+        self.stdout.write(f"   terminé en {time.monotonic() - start:.1f}s")
+
+    # ========================================
+    # MESURES
+    # ========================================
+
+    def build_queries(self):
+        session = (
+            WhatsAppSession.objects.filter(phone_number__startswith=BENCH_PREFIX)
+            .only('id').order_by('phone_number').first()
+        )
+        if session is None:
+            raise CommandError("Aucune donnée de benchmark : lancez sans --no-seed.")
+        cutoff = timezone.now() - timedelta(days=90)
+
+        return {
+            'sessions_actives': lambda: WhatsAppSession.objects.filter(is_active=True).order_by('-last_activity')[:20],
+            'admin_sessions': lambda: WhatsAppSession.objects.order_by('-last_activity')[:100],
+            'historique_session': lambda: WhatsAppMessage.objects.filter(session_id=session.id).order_by('-timestamp')[:50],
+            'admin_messages': lambda: WhatsAppMessage.objects.order_by('-timestamp')[:100],
+            'archivage_keyset': lambda: WhatsAppMessage.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id')[:1000],
+        }
+
+    def measure(self, queries):
+        results = {}
+        for name, build in queries.items():
+            self.stdout.write(f"\n--- {name}")
+            self.stdout.write(build().explain())
+
+            durations = []
+            for _ in range(self.runs):
+                start = time.perf_counter()
+                list(build())
+                durations.append((time.perf_counter() - start) * 1000)
+            results[name] = statistics.median(durations)
+            self.stdout.write(f"médiane {results[name]:.2f} ms / max {max(durations):.2f} ms ({self.runs} exécutions)")
+        return results
+
+    def analyze(self):
+        """Met à jour les statistiques de l'optimiseur"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("ANALYZE whatsapp_sessions")
+                cursor.execute("ANALYZE whatsapp_messages")
+            elif connection.vendor == 'sqlite':
+                cursor.execute("ANALYZE")
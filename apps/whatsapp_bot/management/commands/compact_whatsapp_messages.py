@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.whatsapp_bot.models import WhatsAppMessage
+from apps.whatsapp_bot.storage import compact_content, compress_payload
+
+
+class Command(BaseCommand):
+    help = "Compacte les messages entrants stockés avec le payload Wassenger complet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--keep-raw', action='store_true',
+            help="Conserve le payload brut dans raw_payload (compressé)",
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        start = time.monotonic()
+        total = 0
+        last_id = None
+
+        while True:
+            # Pagination par clé (id) : chaque lot est une requête indexée bornée
+            qs = WhatsAppMessage.objects.filter(direction='incoming', content__has_key='raw').order_by('id')
+            if last_id is not None:
+                qs = qs.filter(id__gt=last_id)
+            batch = list(qs.only('id', 'content')[:batch_size])
+            if not batch:
+                break
+
+            for message in batch:
+                raw = message.content.get('raw') or {}
+                message.content = compact_content(message.content.get('text', ''), raw.get('data') or {})
+                message.raw_payload = compress_payload(raw) if options['keep_raw'] else None
+
+            if not options['dry_run']:
+                with transaction.atomic():
+                    WhatsAppMessage.objects.bulk_update(batch, ['content', 'raw_payload'])
+
+            total += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"  … {total} message(s) compacté(s)")
+
+        elapsed = time.monotonic() - start
+        suffix = " (dry-run)" if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total} message(s) compacté(s) en {elapsed:.1f}s{suffix}"
+        ))
@@ -0,0 +1,62 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.whatsapp_bot.actuariat import PRODUITS
+from apps.whatsapp_bot.models import SimulationShadow
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte les réponses du calculateur NSIA enregistrées par le mode shadow (tarif courant) "
+        "vers le fichier de références qui valide le mode local (SIMULATEUR_REFERENCE). "
+        "Les cas des autres versions de tarif déjà présents sont conservés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', nargs='?', default=settings.SIMULATEUR_REFERENCE,
+                            help="Fichier de références (défaut : SIMULATEUR_REFERENCE)")
+        parser.add_argument('--par-produit', type=int, default=20,
+                            help="Réponses distinctes conservées par produit (plus récentes)")
+
+    def handle(self, *args, **options):
+        tarif = settings.SIMULATEUR_TARIF_VERSION
+        try:
+            with open(options['fichier'], encoding='utf-8') as fh:
+                reference = json.load(fh)
+        except FileNotFoundError:
+            reference = {'cas': []}
+        except ValueError as e:
+            raise CommandError(f"Références illisibles ({options['fichier']}) : {e}")
+
+        cas = [c for c in reference.get('cas', []) if c.get('tarif_version') != tarif]
+        for produit in PRODUITS:
+            vus = set()
+            paires = (
+                SimulationShadow.objects
+                .filter(tarif_version=tarif, produit=produit)
+                .order_by('-created_at')
+                .iterator()
+            )
+            for paire in paires:
+                cle = json.dumps(paire.requete, sort_keys=True)
+                if cle in vus or 'resultats_simulation' not in paire.reponse:
+                    continue
+                vus.add(cle)
+                cas.append({
+                    'produit': produit,
+                    'tarif_version': tarif,
+                    'requete': paire.requete,
+                    'reponse': paire.reponse,
+                    'enregistre_le': paire.created_at.isoformat(),
+                })
+                if len(vus) >= options['par_produit']:
+                    break
+            self.stdout.write(f"• {produit:<17} {len(vus)} réponse(s)")
+
+        reference['cas'] = cas
+        with open(options['fichier'], 'w', encoding='utf-8') as fh:
+            json.dump(reference, fh, ensure_ascii=False, indent=2)
+            fh.write('\n')
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {options['fichier']} : vérifier avec `manage.py verify_simulateur` avant de passer en mode local"
+        ))
@@ -0,0 +1,74 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.whatsapp_bot import http_client
+from apps.whatsapp_bot.metrics import metrics
+
+
+def _plage(texte):
+    """'7-20' → range(7, 21) ; '0-5' → range(0, 6)"""
+    debut, _, fin = texte.partition('-')
+    return range(int(debut), int(fin or debut) + 1)
+
+
+def heures_ouvrees(now=None):
+    """Vrai pendant les jours / heures d'activité des agents (heure locale)"""
+    now = timezone.localtime(now)
+    return now.weekday() in _plage(settings.NSIA_WARMUP_DAYS) and now.hour in _plage(settings.NSIA_WARMUP_HOURS)
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintient l'API NSIA (Render) éveillée pendant les heures ouvrées : "
+        "un appel léger suffit à éviter la mise en veille et le démarrage à froid "
+        "du premier login. À lancer en cron (*/10 * * * *) ou en continu avec --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Tourne en continu (NSIA_WARMUP_INTERVAL)")
+        parser.add_argument('--interval', type=int, default=settings.NSIA_WARMUP_INTERVAL)
+        parser.add_argument('--force', action='store_true', help="Ignore les heures ouvrées")
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            self.ping(options['force'])
+            return
+
+        self._stop = False
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        self.stdout.write(f"🔥 Maintien à chaud de {settings.NSIA_WARMUP_URL} toutes les {options['interval']}s")
+
+        while not self._stop:
+            self.ping(options['force'])
+            # Sommeil interruptible pour un arrêt rapide
+            reveil = time.monotonic() + options['interval']
+            while not self._stop and time.monotonic() < reveil:
+                time.sleep(1)
+
+    def _handle_signal(self, signum, frame):
+        self._stop = True
+
+    def ping(self, force=False):
+        if not force and not heures_ouvrees():
+            self.stdout.write("💤 Hors heures ouvrées : pas de ping")
+            return
+
+        start = time.monotonic()
+        try:
+            response = http_client.get(
+                settings.NSIA_WARMUP_URL,
+                timeout=(settings.HTTP_CONNECT_TIMEOUT, settings.NSIA_COLD_START_TIMEOUT),
+            )
+        except Exception as e:
+            metrics.incr('nsia.warmup_failed')
+            self.stderr.write(f"❌ Ping API NSIA échoué après {time.monotonic() - start:.1f}s : {e}")
+            return
+
+        elapsed = time.monotonic() - start
+        metrics.observe('nsia.warmup', elapsed * 1000)
+        # Un démarrage à froid se voit à la durée, quel que soit le code retourné
+        froid = " (démarrage à froid)" if elapsed > settings.NSIA_SLOW_CALL_THRESHOLD else ""
+        self.stdout.write(f"✅ API NSIA : HTTP {response.status_code} en {elapsed:.1f}s{froid}")
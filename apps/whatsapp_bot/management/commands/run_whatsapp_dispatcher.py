@@ -0,0 +1,45 @@
+import logging
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.whatsapp_bot import outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Envoie les messages de la boîte d'envoi Wassenger (débit limité, retry)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.WHATSAPP_DISPATCHER_CONCURRENCY,
+            help="Nombre d'envois simultanés (destinataires différents)",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.WHATSAPP_WORKER_POLL_INTERVAL,
+            help="Pause (secondes) quand la boîte d'envoi est vide",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Vide la boîte d'envoi puis s'arrête",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        self._stop = False
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        self.stdout.write(f"📤 Dispatcher WhatsApp démarré (concurrence={concurrency})")
+        outbox.run_dispatcher(
+            concurrency,
+            options['poll_interval'],
+            should_stop=lambda: self._stop,
+            once=options['once'],
+        )
+        self.stdout.write("🛑 Dispatcher WhatsApp arrêté")
+
+    def _request_stop(self, signum, frame):
+        logger.info(f"Signal {signum} reçu, arrêt après les envois en cours")
+        self._stop = True
@@ -0,0 +1,103 @@
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.whatsapp_bot import jobs, outbox
+
+logger = logging.getLogger(__name__)
+
+
+def _run(job):
+    """Exécute un job dans un thread du pool en recyclant la connexion DB"""
+    close_old_connections()
+    try:
+        return jobs.execute(job)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Traite la file des messages WhatsApp entrants (ConversationHandler)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.WHATSAPP_WORKER_CONCURRENCY,
+            help="Nombre de jobs traités en parallèle",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.WHATSAPP_WORKER_POLL_INTERVAL,
+            help="Pause (secondes) quand la file est vide",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Vide la file puis s'arrête",
+        )
+        parser.add_argument(
+            '--with-dispatcher', action='store_true',
+            help="Lance aussi le dispatcher de la boîte d'envoi dans ce processus",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        self._stop = False
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        self.stdout.write(f"🚀 Worker WhatsApp démarré (concurrence={concurrency})")
+
+        dispatcher = None
+        if options['with_dispatcher'] and not options['once']:
+            dispatcher = threading.Thread(
+                target=outbox.run_dispatcher,
+                args=(settings.WHATSAPP_DISPATCHER_CONCURRENCY, poll_interval),
+                kwargs={'should_stop': lambda: self._stop},
+                name='wa-dispatcher',
+            )
+            dispatcher.start()
+
+        in_flight = {}  # future → id du job
+        last_stale_check = 0
+        last_heartbeat = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='wa-worker') as pool:
+            while not self._stop:
+                in_flight = {f: job_id for f, job_id in in_flight.items() if not f.done()}
+
+                if time.monotonic() - last_heartbeat > settings.WHATSAPP_JOB_HEARTBEAT:
+                    jobs.heartbeat(list(in_flight.values()))
+                    last_heartbeat = time.monotonic()
+
+                if time.monotonic() - last_stale_check > 60:
+                    jobs.requeue_stale()
+                    last_stale_check = time.monotonic()
+
+                claimed = jobs.claim(concurrency - len(in_flight))
+                for job in claimed:
+                    in_flight[pool.submit(_run, job)] = job.id
+
+                if not claimed:
+                    if options['once'] and not in_flight:
+                        break
+                    time.sleep(poll_interval)
+
+        if dispatcher:
+            self._stop = True
+            dispatcher.join()
+        elif options['with_dispatcher']:
+            # --once : la boîte d'envoi est vidée une fois la file traitée
+            outbox.run_dispatcher(
+                settings.WHATSAPP_DISPATCHER_CONCURRENCY, poll_interval,
+                should_stop=lambda: self._stop, once=True,
+            )
+
+        self.stdout.write("🛑 Worker WhatsApp arrêté")
+
+    def _request_stop(self, signum, frame):
+        logger.info(f"Signal {signum} reçu, arrêt après les jobs en cours")
+        self._stop = True
@@ -0,0 +1,103 @@
+import json
+import random
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.whatsapp_bot.intents import INTENTS, ClassifieurIntentions
+
+
+class Command(BaseCommand):
+    help = (
+        "Entraîne le classifieur local d'intentions (n-grammes de caractères + régression "
+        "logistique) à partir d'un JSONL {texte, intent[, niveau, confidence]} : journal "
+        "INTENT_LOG (règles / Gemini) ou messages étiquetés à la main."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichiers', nargs='*', help="JSONL d'exemples (défaut : INTENT_LOG)")
+        parser.add_argument('--sortie', default=settings.INTENT_MODEL_PATH,
+                            help="Modèle JSON produit (défaut : INTENT_MODEL_PATH)")
+        parser.add_argument('--min-confiance', type=float, default=0.8,
+                            help="Confiance minimale des exemples étiquetés par Gemini")
+        parser.add_argument('--validation', type=float, default=0.2, help="Part des exemples gardée pour l'évaluation")
+        parser.add_argument('--epochs', type=int, default=30)
+        parser.add_argument('--ngrammes', default='2-4', help="Tailles des n-grammes de caractères (min-max)")
+
+    def handle(self, *args, **options):
+        fichiers = options['fichiers'] or ([settings.INTENT_LOG] if settings.INTENT_LOG else [])
+        if not fichiers:
+            raise CommandError("Aucun fichier : passez un chemin ou définissez INTENT_LOG.")
+        if not options['sortie']:
+            raise CommandError("Aucune sortie : passez --sortie ou définissez INTENT_MODEL_PATH.")
+
+        exemples = self.lire(fichiers, options['min_confiance'])
+        if len({i for _, i in exemples}) < 2:
+            raise CommandError("Il faut des exemples d'au moins deux intentions.")
+
+        rng = random.Random(0)
+        rng.shuffle(exemples)
+        coupure = int(len(exemples) * (1 - options['validation']))
+        apprentissage, validation = exemples[:coupure], exemples[coupure:]
+
+        n_min, _, n_max = options['ngrammes'].partition('-')
+        self.stdout.write(f"🧠 Entraînement sur {len(apprentissage)} exemple(s) : {dict(Counter(i for _, i in apprentissage))}")
+        modele = ClassifieurIntentions.entrainer(
+            apprentissage, epochs=options['epochs'], n_min=int(n_min), n_max=int(n_max or n_min),
+        )
+
+        if validation:
+            self.evaluer(modele, validation)
+
+        # Modèle final entraîné sur tous les exemples
+        modele = ClassifieurIntentions.entrainer(
+            exemples, epochs=options['epochs'], n_min=modele.n_min, n_max=modele.n_max,
+        )
+        modele.sauver(options['sortie'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Modèle écrit dans {options['sortie']} ({len(modele.to_dict()['poids'])} n-grammes). "
+            f"Redémarrez les workers pour le charger."
+        ))
+
+    def lire(self, fichiers, min_confiance):
+        exemples = []
+        ignores = 0
+        for fichier in fichiers:
+            with open(fichier, encoding='utf-8') as fh:
+                for ligne in fh:
+                    if not ligne.strip():
+                        continue
+                    cas = json.loads(ligne)
+                    texte = cas.get('texte') or cas.get('text')
+                    intent = cas.get('intent')
+                    if not texte or intent not in INTENTS:
+                        ignores += 1
+                        continue
+                    if cas.get('niveau') == 'gemini' and (cas.get('confidence') or 0) < min_confiance:
+                        ignores += 1
+                        continue
+                    exemples.append((texte, intent))
+        if ignores:
+            self.stdout.write(f"ℹ️ {ignores} ligne(s) ignorée(s) (intention inconnue ou confiance insuffisante)")
+        return exemples
+
+    def evaluer(self, modele, validation):
+        seuil = settings.INTENT_LOCAL_THRESHOLD
+        justes = 0
+        confiants = 0
+        justes_confiants = 0
+        for texte, attendu in validation:
+            intent, proba = modele.predire(texte)
+            justes += intent == attendu
+            if proba >= seuil:
+                confiants += 1
+                justes_confiants += intent == attendu
+
+        total = len(validation)
+        self.stdout.write(f"• Précision validation : {justes / total:.1%} ({justes}/{total})")
+        if confiants:
+            self.stdout.write(
+                f"• Au-dessus du seuil {seuil:.2f} : {confiants / total:.1%} des messages "
+                f"(sans Gemini), précision {justes_confiants / confiants:.1%}"
+            )
+        else:
+            self.stdout.write(f"• Aucun message au-dessus du seuil {seuil:.2f} : Gemini resterait sollicité")
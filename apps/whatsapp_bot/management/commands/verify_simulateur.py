@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.whatsapp_bot import actuariat
+from apps.whatsapp_bot.models import SimulationShadow
+
+
+class Command(BaseCommand):
+    help = (
+        "Rejoue des réponses enregistrées du calculateur distant sur le moteur tarifaire local "
+        "et rapporte les écarts par produit et par champ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', nargs='?', default=settings.SIMULATEUR_REFERENCE,
+                            help="Références exportées (défaut : SIMULATEUR_REFERENCE)")
+        parser.add_argument('--shadow', action='store_true',
+                            help="Rejoue les paires enregistrées en base par le mode shadow (tarif courant)")
+        parser.add_argument('--limite', type=int, default=1000, help="Paires shadow rejouées (plus récentes)")
+        parser.add_argument('--tolerance', type=float, default=settings.SIMULATEUR_SHADOW_TOLERANCE,
+                            help="Écart relatif toléré")
+        parser.add_argument('--verbose-ecarts', action='store_true', help="Affiche chaque divergence")
+        parser.add_argument('--strict', action='store_true', help="Échoue si une divergence est trouvée")
+
+    def handle(self, *args, **options):
+        if options['shadow']:
+            cas = list(
+                SimulationShadow.objects
+                .filter(tarif_version=settings.SIMULATEUR_TARIF_VERSION)
+                .values('produit', 'requete', 'reponse')[:options['limite']]
+            )
+        else:
+            try:
+                cas = actuariat.charger_reference(options['fichier'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Références illisibles ({options['fichier']}) : {e}")
+        if not cas:
+            raise CommandError(f"Aucune réponse enregistrée pour le tarif {settings.SIMULATEUR_TARIF_VERSION}.")
+
+        rapport = actuariat.verifier(cas, options['tolerance'])
+        divergences = 0
+        for produit, stats in sorted(rapport.items()):
+            divergences += len(stats['divergences'])
+            self.stdout.write(
+                f"• {produit:<17} {stats['ok']}/{stats['total']} conformes, "
+                f"{stats['hors_domaine']} hors domaine"
+            )
+            for champ, ecart in sorted(stats['ecart_max'].items()):
+                self.stdout.write(f"    {champ:<24} écart max {ecart:.2%}")
+            if options['verbose_ecarts']:
+                for index, ecarts in stats['divergences']:
+                    details = ', '.join(f"{c}: {a:.0f} vs {b:.0f} ({e:.1%})" for c, a, b, e in ecarts)
+                    self.stdout.write(f"    cas {index} : {details}")
+
+        if divergences:
+            message = f"⚠️ {divergences} simulation(s) hors tolérance ({options['tolerance']:.2%})"
+            if options['strict']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Moteur local conforme aux réponses enregistrées"))
@@ -0,0 +1,73 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class MetricsRegistry:
+    """
+    Compteurs et mesures de latence en mémoire (par processus).
+
+    Les valeurs sont propres au processus courant (worker gunicorn ou
+    commande manage.py) ; les indicateurs qui doivent être globaux
+    (profondeur de file, latences de bout en bout) sont calculés en base.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+        self._gauges = {}
+
+    def incr(self, name, value=1):
+        """Incrémente un compteur"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, duration_ms):
+        """Enregistre une durée (en millisecondes)"""
+        with self._lock:
+            timing = self._timings.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            timing['count'] += 1
+            timing['total_ms'] += duration_ms
+            timing['max_ms'] = max(timing['max_ms'], duration_ms)
+
+    @contextmanager
+    def timer(self, name):
+        """Mesure la durée du bloc et l'enregistre sous `name`"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.monotonic() - start) * 1000)
+
+    def register_gauge(self, name, func):
+        """Enregistre une fonction évaluée à chaque lecture des métriques"""
+        with self._lock:
+            self._gauges[name] = func
+
+    def get_counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Retourne une copie sérialisable des métriques"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: {
+                    'count': t['count'],
+                    'avg_ms': round(t['total_ms'] / t['count'], 2) if t['count'] else 0,
+                    'max_ms': round(t['max_ms'], 2),
+                }
+                for name, t in self._timings.items()
+            }
+            gauges = dict(self._gauges)
+
+        return {
+            'counters': counters,
+            'timings': timings,
+            'gauges': {name: func() for name, func in gauges.items()},
+        }
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borne_auth', '0001_initial'),
+        ('whatsapp_bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='whatsappsession',
+            name='agent',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='whatsapp_sessions', to='borne_auth.agent'),
+        ),
+        migrations.CreateModel(
+            name='ConversationJob',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Traité'), ('failed', 'Échec')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, help_text='Réception webhook → fin de traitement', null=True)),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='whatsapp_bot.whatsappmessage')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='whatsapp_bot.whatsappsession')),
+            ],
+            options={
+                'db_table': 'whatsapp_jobs',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='wa_job_status_avail_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0002_conversation_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationjob',
+            name='lock_wait_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Attente du verrou de session', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='conversationjob',
+            index=models.Index(fields=['session', 'status'], name='wa_job_session_status_idx'),
+        ),
+    ]
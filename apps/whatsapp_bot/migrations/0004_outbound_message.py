@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0003_job_session_lane'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('phone', models.CharField(max_length=20)),
+                ('device', models.CharField(blank=True, default='', max_length=50)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('sending', 'Envoi en cours'), ('sent', 'Envoyé'), ('failed', 'Échec')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('http_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('wassenger_message_id', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, help_text='Mise en file → livraison à Wassenger', null=True)),
+            ],
+            options={
+                'db_table': 'whatsapp_outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='wa_outbox_status_avail_idx'), models.Index(fields=['phone', 'status'], name='wa_outbox_phone_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0004_outbound_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='envois', to='whatsapp_bot.whatsappmessage'),
+        ),
+        migrations.AddField(
+            model_name='whatsappmessage',
+            name='delivery_status',
+            field=models.CharField(blank=True, default='', help_text='Statut de livraison (messages sortants)', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='whatsappmessage',
+            name='status_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
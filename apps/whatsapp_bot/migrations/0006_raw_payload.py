@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0005_outgoing_delivery_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whatsappmessage',
+            name='raw_payload',
+            field=models.BinaryField(blank=True, help_text='Payload webhook brut compressé (zlib)', null=True),
+        ),
+    ]
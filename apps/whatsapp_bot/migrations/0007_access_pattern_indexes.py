@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borne_auth', '0001_initial'),
+        ('whatsapp_bot', '0006_raw_payload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='whatsappmessage',
+            index=models.Index(fields=['session', '-timestamp'], name='wa_msg_session_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='whatsappmessage',
+            index=models.Index(fields=['timestamp', 'id'], name='wa_msg_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='whatsappsession',
+            index=models.Index(fields=['is_active', '-last_activity'], name='wa_sess_active_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='whatsappsession',
+            index=models.Index(fields=['-last_activity'], name='wa_sess_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0007_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whatsappsession',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0008_session_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeminiCacheEntry',
+            fields=[
+                ('cle', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('gabarit', models.TextField(help_text='Message normalisé, nombres remplacés par #')),
+                ('reponse', models.JSONField()),
+                ('tokens', models.PositiveIntegerField(default=0, help_text="Jetons Gemini consommés par l'appel d'origine")),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'db_table': 'whatsapp_gemini_cache',
+            },
+        ),
+    ]
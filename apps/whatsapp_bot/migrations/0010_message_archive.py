@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0009_gemini_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('mois', models.CharField(max_length=7)),
+                ('session_id', models.UUIDField()),
+                ('whatsapp_message_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('direction', models.CharField(choices=[('incoming', 'Reçu'), ('outgoing', 'Envoyé')], max_length=10)),
+                ('message_type', models.CharField(max_length=20)),
+                ('content', models.JSONField()),
+                ('timestamp', models.DateTimeField()),
+                ('raw_payload', models.BinaryField(blank=True, help_text='Payload webhook brut compressé (zlib)', null=True)),
+                ('delivery_status', models.CharField(blank=True, default='', max_length=20)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'whatsapp_messages_archive',
+                'ordering': ['timestamp'],
+                'indexes': [models.Index(fields=['mois', 'timestamp'], name='wa_archive_mois_ts_idx'), models.Index(fields=['session_id', 'timestamp'], name='wa_archive_session_ts_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0010_message_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimulationShadow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('produit', models.CharField(max_length=30)),
+                ('tarif_version', models.CharField(max_length=20)),
+                ('requete', models.JSONField()),
+                ('reponse', models.JSONField()),
+                ('local', models.JSONField(blank=True, null=True)),
+                ('ecart_max', models.FloatField(blank=True, help_text='Plus grand écart relatif sur les champs comparés', null=True)),
+                ('divergent', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'whatsapp_simulations_shadow',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['tarif_version', 'produit', '-created_at'], name='wa_shadow_tarif_produit_idx')],
+            },
+        ),
+    ]
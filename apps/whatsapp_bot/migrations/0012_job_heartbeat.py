@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0011_simulation_shadow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Dernier signe de vie du worker qui traite le job', null=True),
+        ),
+    ]
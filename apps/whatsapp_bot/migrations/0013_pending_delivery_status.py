@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_bot', '0012_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingDeliveryStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('whatsapp_message_id', models.CharField(db_index=True, max_length=100)),
+                ('status', models.CharField(max_length=20)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'whatsapp_pending_statuses',
+                'ordering': ['id'],
+            },
+        ),
+    ]
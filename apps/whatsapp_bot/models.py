@@ -1,7 +1,16 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 from apps.borne_auth.models import Agent
+from contextlib import contextmanager
+import copy
 import uuid
 
+
+class SessionConflictError(Exception):
+    """La session a été modifiée en base depuis son chargement (version dépassée)"""
+
+
 class WhatsAppSession(models.Model):
     """Session conversationnelle agent WhatsApp"""
     
@@ -36,15 +45,123 @@ class WhatsAppSession(models.Model):
     is_active = models.BooleanField(default=True)
     last_activity = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Incrémentée à chaque écriture : valide les instantanés du cache de sessions
+    version = models.PositiveIntegerField(default=0)
     
     class Meta:
         db_table = 'whatsapp_sessions'
         ordering = ['-last_activity']
+        indexes = [
+            # sessions_actives : is_active=True ORDER BY last_activity DESC
+            models.Index(fields=['is_active', '-last_activity'], name='wa_sess_active_activity_idx'),
+            # tri par défaut (admin, listes sans filtre)
+            models.Index(fields=['-last_activity'], name='wa_sess_activity_idx'),
+        ]
+    
+    # Champs suivis par le mode unit-of-work (attribut → nom pour update_fields)
+    CHAMPS_SUIVIS = {
+        'agent_id': 'agent',
+        'current_state': 'current_state',
+        'context': 'context',
+        'is_active': 'is_active',
+    }
     
     def __str__(self):
-        agent_info = f"Agent {self.agent.matricule}" if self.agent else "Non connecté"
+        agent = self.agent_from_directory()
+        agent_info = f"Agent {agent.matricule}" if agent else "Non connecté"
         return f"{self.phone_number} - {agent_info} - {self.current_state}"
     
+    def agent_from_directory(self):
+        """Agent de la session via l'annuaire en cache (évite une requête par ligne)"""
+        from apps.borne_auth.directory import get_agent_directory
+        if not self.agent_id:
+            return None
+        if WhatsAppSession.agent.is_cached(self):
+            return self.agent
+        return get_agent_directory().get_by_id(self.agent_id)
+    
+    def save(self, *args, **kwargs):
+        # En mode unit-of-work, les sauvegardes sont différées jusqu'au flush
+        if getattr(self, '_uow_actif', False):
+            self._uow_save_demande = True
+            return
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        # Incrément atomique : deux écritures concurrentes ne partagent jamais une version
+        self.version = F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'version']
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+    
+    @contextmanager
+    def unit_of_work(self, differe=False):
+        """
+        Regroupe toutes les modifications du bloc en un seul UPDATE.
+
+        update_context()/reset_context()/save() ne font qu'enregistrer les
+        changements ; à la sortie du bloc, seules les colonnes modifiées
+        sont écrites (update_fields).
+
+        differe=True : l'appelant écrit lui-même via flush(), par exemple
+        dans une transaction courte après les appels distants ; rien n'est
+        écrit si le bloc lève.
+        """
+        self._uow_actif = True
+        self._uow_save_demande = False
+        self._uow_snapshot = self._capture_champs()
+        try:
+            yield self
+        except BaseException:
+            if differe:
+                self._uow_snapshot = None
+            raise
+        finally:
+            self._uow_actif = False
+            if not differe:
+                self.flush()
+    
+    def flush(self):
+        """Écrit les colonnes modifiées depuis le début du unit-of-work"""
+        snapshot = getattr(self, '_uow_snapshot', None)
+        if snapshot is None:
+            return
+        
+        modifies = [
+            self.CHAMPS_SUIVIS[attr]
+            for attr, valeur in self._capture_champs().items()
+            if valeur != snapshot[attr]
+        ]
+        if modifies or self._uow_save_demande:
+            self._ecrire(modifies)
+        
+        self._uow_snapshot = None
+        self._uow_save_demande = False
+    
+    def _ecrire(self, modifies):
+        """
+        UPDATE conditionnel sur la version chargée (concurrence optimiste).
+
+        Sous le verrou de session, aucun autre tour de conversation ne peut
+        passer ; une écriture hors chatbot (admin, archivage) est détectée
+        au lieu d'être écrasée.
+        """
+        now = timezone.now()
+        valeurs = {champ: getattr(self, self._meta.get_field(champ).attname) for champ in modifies}
+        lignes = WhatsAppSession.objects.filter(pk=self.pk, version=self.version).update(
+            **valeurs,
+            last_activity=now,
+            version=F('version') + 1,
+        )
+        if not lignes:
+            raise SessionConflictError(f"Session {self.phone_number} modifiée depuis la version {self.version}")
+        self.version += 1
+        self.last_activity = now
+    
+    def _capture_champs(self):
+        return {attr: copy.deepcopy(getattr(self, attr)) for attr in self.CHAMPS_SUIVIS}
+    
     def reset_context(self):
         """Réinitialise le contexte"""
         self.context = {}
@@ -75,10 +192,198 @@ class WhatsAppMessage(models.Model):
     message_type = models.CharField(max_length=20)  # text, interactive, button, etc.
     content = models.JSONField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    raw_payload = models.BinaryField(null=True, blank=True, help_text="Payload webhook brut compressé (zlib)")
+    delivery_status = models.CharField(max_length=20, blank=True, default='', help_text="Statut de livraison (messages sortants)")
+    status_updated_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         db_table = 'whatsapp_messages'
         ordering = ['-timestamp']
+        indexes = [
+            # historique d'une session : session_id = X ORDER BY timestamp DESC
+            models.Index(fields=['session', '-timestamp'], name='wa_msg_session_ts_idx'),
+            # tri par défaut et pagination par clé (timestamp, id) de l'archivage
+            models.Index(fields=['timestamp', 'id'], name='wa_msg_ts_id_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.direction} - {self.message_type} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.direction} - {self.message_type} - {self.timestamp}"
+
+class ArchivedMessage(models.Model):
+    """
+    Messages WhatsApp archivés (archive_whatsapp_data), indexés par mois.
+
+    Copie écrite dans la même transaction que la suppression dans
+    whatsapp_messages : un message n'est jamais supprimé sans archive.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    # Mois du message (AAAA-MM) : consultation et purge par mois
+    mois = models.CharField(max_length=7)
+    # Sans clé étrangère : l'archive survit à la suppression de la session
+    session_id = models.UUIDField()
+    whatsapp_message_id = models.CharField(max_length=100, null=True, blank=True)
+    direction = models.CharField(max_length=10, choices=WhatsAppMessage.DIRECTIONS)
+    message_type = models.CharField(max_length=20)
+    content = models.JSONField()
+    timestamp = models.DateTimeField()
+    raw_payload = models.BinaryField(null=True, blank=True, help_text="Payload webhook brut compressé (zlib)")
+    delivery_status = models.CharField(max_length=20, blank=True, default='')
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'whatsapp_messages_archive'
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['mois', 'timestamp'], name='wa_archive_mois_ts_idx'),
+            models.Index(fields=['session_id', 'timestamp'], name='wa_archive_session_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.mois} - {self.direction} - {self.message_type} - {self.timestamp}"
+
+
+class ConversationJob(models.Model):
+    """File d'attente des messages entrants à traiter par le worker"""
+
+    STATUTS = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Traité'),
+        ('failed', 'Échec'),
+    ]
+
+    # Clé auto-incrémentée : l'ordre des IDs reflète l'ordre d'arrivée
+    id = models.BigAutoField(primary_key=True)
+    session = models.ForeignKey(WhatsAppSession, on_delete=models.CASCADE, related_name='jobs')
+    message = models.ForeignKey(WhatsAppMessage, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUTS, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Dernier signe de vie du worker qui traite le job")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Réception webhook → fin de traitement")
+    lock_wait_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Attente du verrou de session")
+
+    class Meta:
+        db_table = 'whatsapp_jobs'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='wa_job_status_avail_idx'),
+            models.Index(fields=['session', 'status'], name='wa_job_session_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - {self.session_id} - {self.status}"
+
+
+class OutboundMessage(models.Model):
+    """Boîte d'envoi des messages sortants Wassenger (traitée par le dispatcher)"""
+
+    STATUTS = [
+        ('pending', 'En attente'),
+        ('sending', 'Envoi en cours'),
+        ('sent', 'Envoyé'),
+        ('failed', 'Échec'),
+    ]
+
+    # Clé auto-incrémentée : l'ordre des IDs reflète l'ordre d'envoi demandé
+    id = models.BigAutoField(primary_key=True)
+    message = models.ForeignKey(
+        WhatsAppMessage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='envois',
+    )
+    phone = models.CharField(max_length=20)
+    device = models.CharField(max_length=50, blank=True, default='')
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUTS, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    http_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    wassenger_message_id = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Mise en file → livraison à Wassenger")
+
+    class Meta:
+        db_table = 'whatsapp_outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='wa_outbox_status_avail_idx'),
+            models.Index(fields=['phone', 'status'], name='wa_outbox_phone_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} - {self.phone} - {self.status}"
+
+
+class PendingDeliveryStatus(models.Model):
+    """Statut Wassenger reçu avant que deliver() n'ait enregistré l'identifiant du message"""
+
+    whatsapp_message_id = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(max_length=20)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'whatsapp_pending_statuses'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.whatsapp_message_id} - {self.status}"
+
+
+class GeminiCacheEntry(models.Model):
+    """Réponses Gemini conservées entre redémarrages (clé : message normalisé)"""
+
+    # sha256(version du prompt + gabarit du message)
+    cle = models.CharField(max_length=64, primary_key=True)
+    gabarit = models.TextField(help_text="Message normalisé, nombres remplacés par #")
+    reponse = models.JSONField()
+    tokens = models.PositiveIntegerField(default=0, help_text="Jetons Gemini consommés par l'appel d'origine")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'whatsapp_gemini_cache'
+
+    def __str__(self):
+        return f"{self.gabarit} → {self.reponse.get('intent')}"
+
+
+class SimulationShadow(models.Model):
+    """
+    Réponse du calculateur NSIA enregistrée en mode shadow, avec le calcul local.
+
+    Source des références de validation du moteur local
+    (export_simulateur_reference, verify_simulateur --shadow).
+    """
+
+    produit = models.CharField(max_length=30)
+    tarif_version = models.CharField(max_length=20)
+    # Corps envoyé au calculateur ({'parametres_simulation': …}) et réponse complète
+    requete = models.JSONField()
+    reponse = models.JSONField()
+    # resultats_simulation du moteur local (None : hors domaine du moteur)
+    local = models.JSONField(null=True, blank=True)
+    ecart_max = models.FloatField(null=True, blank=True, help_text="Plus grand écart relatif sur les champs comparés")
+    divergent = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'whatsapp_simulations_shadow'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tarif_version', 'produit', '-created_at'], name='wa_shadow_tarif_produit_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.produit} ({self.tarif_version}) - {'divergent' if self.divergent else 'conforme'}"
@@ -0,0 +1,411 @@
+"""
+Accès à l'API NSIA : protection du backend et jetons JWT des agents.
+
+Chaque endpoint (chemin normalisé) a son disjoncteur (closed / open /
+half-open) et un nombre borné d'appels simultanés : quand l'API démarre à
+froid ou se dégrade, les appels échouent vite au lieu de bloquer tous les
+workers, et les parcours qui n'en dépendent pas continuent de fonctionner.
+
+L'expiration absolue du jeton d'accès est suivie dans le contexte de session
+(`token_expires_at`) ; le jeton est renouvelé via le refresh token avant
+l'échéance, une seule fois même si plusieurs threads le demandent, et une
+réponse 401 déclenche un renouvellement puis un unique nouvel essai.
+"""
+import base64
+import json
+import logging
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlsplit
+import requests
+from django.conf import settings
+from core.lru import TTLCache
+from . import http_client
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenExpiredError(Exception):
+    """Jeton expiré et non renouvelable : l'agent doit se reconnecter"""
+
+
+class ServiceIndisponibleError(Exception):
+    """API NSIA indisponible (disjoncteur ouvert, saturation, erreur réseau)"""
+
+    message = (
+        "⏳ Le service NSIA est momentanément indisponible.\n\n"
+        "Réessayez dans quelques minutes."
+    )
+
+
+# ========================================
+# DISJONCTEUR + CLOISONNEMENT
+# ========================================
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'un endpoint.
+
+    closed : les appels passent ; après `failure_threshold` échecs consécutifs
+    (erreur réseau, timeout, 5xx) → open : rejet immédiat pendant
+    `reset_timeout` secondes → half-open : un seul appel d'essai, qui referme
+    (succès) ou rouvre (échec) le disjoncteur.
+
+    Le nombre d'appels simultanés est borné (`max_concurrent`) : au-delà,
+    l'appelant attend au plus `max_wait` secondes puis est rejeté.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout, max_concurrent, max_wait):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.in_flight = 0
+        self.rejected = 0
+        self._probe = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self):
+        """
+        Réserve une place pour un appel.
+
+        Retourne le jeton d'essai si cet appel est l'essai half-open (None
+        sinon) : il est à rendre à release(), seul cet appel libère l'essai.
+        """
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probe = None
+            if self.state == 'open' or (self.state == 'half_open' and self._probe is not None):
+                self.rejected += 1
+                metrics.incr('nsia.rejected_open')
+                raise ServiceIndisponibleError(f"Disjoncteur ouvert : {self.name}")
+            probe = None
+            if self.state == 'half_open':
+                probe = self._probe = object()
+
+        if not self._slots.acquire(timeout=self.max_wait):
+            with self._lock:
+                self.rejected += 1
+                if probe is not None and self._probe is probe:
+                    self._probe = None
+            metrics.incr('nsia.rejected_bulkhead')
+            raise ServiceIndisponibleError(f"Trop d'appels simultanés : {self.name}")
+        with self._lock:
+            self.in_flight += 1
+        return probe
+
+    def release(self, success, probe=None):
+        with self._lock:
+            self.in_flight -= 1
+            if success:
+                if self.state != 'closed':
+                    logger.info(f"✅ Disjoncteur refermé : {self.name}")
+                self.state = 'closed'
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                    if self.state != 'open':
+                        logger.warning(f"⚡ Disjoncteur ouvert : {self.name} ({self.failures} échec(s))")
+                        metrics.incr('nsia.breaker_opened')
+                    self.state = 'open'
+                    self.opened_at = time.monotonic()
+            # Un appel entré avant l'ouverture ne libère pas l'essai en cours
+            if probe is not None and self._probe is probe:
+                self._probe = None
+        self._slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_ID_SEGMENT = re.compile(r'/(\d+|[0-9a-f]{8}-[0-9a-f-]{27,})(?=/|$)', re.IGNORECASE)
+
+
+def endpoint_key(url):
+    """'https://…/api/v1/agents/42/stats/' → '/api/v1/agents/{id}/stats/'"""
+    return _ID_SEGMENT.sub('/{id}', urlsplit(url).path)
+
+
+def _breaker(key):
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(
+                key,
+                failure_threshold=settings.NSIA_BREAKER_FAILURES,
+                reset_timeout=settings.NSIA_BREAKER_RESET_TIMEOUT,
+                max_concurrent=settings.NSIA_BULKHEAD_SIZE,
+                max_wait=settings.NSIA_BULKHEAD_WAIT,
+            )
+        return _breakers[key]
+
+
+def breakers_state():
+    """État des disjoncteurs par endpoint (exposé sur /metrics/)"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
+
+
+metrics.register_gauge('nsia_breakers', breakers_state)
+
+
+# ========================================
+# APPELS LENTS (DÉMARRAGE À FROID)
+# ========================================
+
+_local = threading.local()
+
+
+@contextmanager
+def slow_call_notice(callback):
+    """
+    Pendant le bloc, un appel plus long que NSIA_SLOW_CALL_THRESHOLD déclenche
+    `callback()` (une seule fois) depuis un thread minuteur. Tant que le
+    message n'est pas parti, le délai de lecture est porté à
+    NSIA_COLD_START_TIMEOUT : l'utilisateur est prévenu et l'appel va à son
+    terme au lieu d'expirer pendant le réveil de l'API. Les appels suivants
+    du bloc reprennent les délais courts (HTTP_READ_TIMEOUT).
+
+    L'appel NSIA ne rend la main qu'une fois `callback()` terminé : le thread
+    du tour ne reprend (et n'écrit son buffer de sortie) qu'après l'envoi
+    du message d'attente.
+    """
+    previous = getattr(_local, 'notice', None)
+    _local.notice = {'callback': callback, 'sent': False, 'lock': threading.Lock()}
+    try:
+        yield
+    finally:
+        _local.notice = previous
+
+
+def _notify(notice):
+    with notice['lock']:
+        if notice['sent']:
+            return
+        notice['sent'] = True
+    metrics.incr('nsia.slow_notice')
+    try:
+        notice['callback']()
+    except Exception as e:
+        logger.error(f"❌ Envoi du message d'attente impossible: {e}")
+
+
+def _cold_start_timeout(timeout):
+    connect = timeout[0] if isinstance(timeout, tuple) else settings.HTTP_CONNECT_TIMEOUT
+    return (connect, max(settings.NSIA_COLD_START_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+
+
+def request(method, url, **kwargs):
+    """
+    Appel à l'API NSIA protégé par le disjoncteur de l'endpoint.
+
+    Lève ServiceIndisponibleError si l'appel est rejeté ou échoue au niveau
+    réseau ; une réponse 5xx est retournée mais comptée comme un échec.
+    """
+    breaker = _breaker(endpoint_key(url))
+    probe = breaker.acquire()
+
+    notice = getattr(_local, 'notice', None)
+    timer = None
+    if notice is not None and not notice['sent']:
+        # Seul l'appel qui peut encore déclencher le message d'attente a droit au délai long :
+        # une fois l'utilisateur prévenu, les appels suivants gardent HTTP_READ_TIMEOUT
+        kwargs['timeout'] = _cold_start_timeout(kwargs.get('timeout'))
+        timer = threading.Timer(settings.NSIA_SLOW_CALL_THRESHOLD, _notify, [notice])
+        timer.daemon = True
+        timer.start()
+
+    success = False
+    try:
+        response = http_client.request(method, url, **kwargs)
+        success = response.status_code < 500
+        return response
+    except requests.exceptions.RequestException as e:
+        raise ServiceIndisponibleError(f"{breaker.name} : {e}") from e
+    finally:
+        if timer is not None:
+            timer.cancel()
+            # Message d'attente en cours d'envoi : on attend qu'il soit parti et historisé
+            timer.join()
+        breaker.release(success, probe)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+# ========================================
+# JETONS
+# ========================================
+
+
+def jwt_expiry(token):
+    """Claim 'exp' d'un JWT (sans vérification de signature) ou None"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def token_expires_at(access, expires_in=None):
+    """Échéance absolue (timestamp) : claim 'exp' du JWT, sinon now + expires_in"""
+    return jwt_expiry(access) or time.time() + int(expires_in or settings.NSIA_TOKEN_DEFAULT_TTL)
+
+
+@lru_cache(maxsize=None)
+def get_token_manager():
+    return TokenManager(margin=settings.NSIA_TOKEN_REFRESH_MARGIN)
+
+
+class TokenManager:
+    """Renouvellement des jetons d'accès, dédoublonné par refresh token"""
+
+    def __init__(self, margin):
+        self.margin = margin
+        # Un verrou par refresh token, tant qu'un thread le détient ou l'attend
+        self._locks = weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
+        # Résultat d'un renouvellement récent, partagé avec les appelants qui attendaient
+        self._recent = TTLCache(maxsize=1000, ttl=60)
+
+    def access_token(self, session, force=False):
+        """Jeton d'accès valide pour la session (renouvelé si proche de l'expiration)"""
+        ctx = session.context
+        access = ctx.get('access_token')
+        # Sessions ouvertes avant le suivi de l'échéance : claim 'exp' du JWT
+        expires_at = ctx.get('token_expires_at') or jwt_expiry(access) or 0
+
+        if access and not force and expires_at - time.time() > self.margin:
+            metrics.incr('tokens.hit')
+            return access
+
+        metrics.incr('tokens.miss')
+        return self._refresh(session, rejected=access if force else None)
+
+    def _lock_for(self, key):
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _refresh(self, session, rejected=None):
+        refresh = session.context.get('refresh_token')
+        if not refresh:
+            raise TokenExpiredError("Aucun refresh token")
+
+        with self._lock_for(refresh):
+            # Un autre thread vient peut-être de renouveler ce jeton
+            recent = self._recent.get(refresh)
+            if (recent is not None and recent['access_token'] != rejected
+                    and recent['token_expires_at'] - time.time() > self.margin):
+                metrics.incr('tokens.refresh_shared')
+                session.context.update(recent)
+                return recent['access_token']
+
+            with metrics.timer('tokens.refresh'):
+                response = post(
+                    f"{settings.API_BASE_URL}{settings.NSIA_TOKEN_REFRESH_PATH}",
+                    json={'refresh': refresh},
+                )
+
+            if response.status_code != 200:
+                metrics.incr('tokens.refresh_failed')
+                logger.warning(f"⚠️ Renouvellement du jeton refusé (HTTP {response.status_code})")
+                raise TokenExpiredError(f"Refresh refusé : HTTP {response.status_code}")
+
+            data = response.json()
+            data = data.get('data', data)
+            tokens = data.get('tokens', data)
+            access = tokens.get('access')
+            if not access:
+                metrics.incr('tokens.refresh_failed')
+                raise TokenExpiredError("Réponse de renouvellement sans jeton d'accès")
+
+            valeurs = {
+                'access_token': access,
+                # Rotation éventuelle du refresh token
+                'refresh_token': tokens.get('refresh') or refresh,
+                'token_expires_at': token_expires_at(access, data.get('expires_in')),
+            }
+            self._recent.set(refresh, valeurs)
+            session.context.update(valeurs)
+            metrics.incr('tokens.refresh')
+            logger.info(f"🔑 Jeton renouvelé pour {session.phone_number}")
+            return access
+
+
+class SessionAuth:
+    """Authentification d'un agent connecté via sa session WhatsApp"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def token(self, force=False):
+        return get_token_manager().access_token(self.session, force=force)
+
+    def request(self, method, url, headers=None, **kwargs):
+        """Requête authentifiée ; sur 401, renouvelle le jeton et réessaie une fois"""
+        headers = dict(headers or {})
+        headers['Authorization'] = f"Bearer {self.token()}"
+        response = request(method, url, headers=headers, **kwargs)
+
+        if response.status_code == 401 and self.session.context.get('refresh_token'):
+            metrics.incr('tokens.retry_401')
+            headers['Authorization'] = f"Bearer {self.token(force=True)}"
+            response = request(method, url, headers=headers, **kwargs)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def frozen(self):
+        """Jeton courant figé, utilisable hors du thread de la conversation"""
+        return StaticAuth(self.token())
+
+
+class StaticAuth(SessionAuth):
+    """Jeton fourni tel quel (API, tâches de fond) : pas de renouvellement"""
+
+    def __init__(self, token):
+        self._token = token
+
+    def token(self, force=False):
+        return self._token
+
+    def request(self, method, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if self._token:
+            headers['Authorization'] = f"Bearer {self._token}"
+        return request(method, url, headers=headers, **kwargs)
+
+    def frozen(self):
+        return self
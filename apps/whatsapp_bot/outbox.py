@@ -0,0 +1,242 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, Exists, F, Max, OuterRef
+from django.utils import timezone
+from .models import OutboundMessage, WhatsAppMessage
+from .metrics import metrics
+from .outgoing import apply_pending_statuses
+from .services import get_whatsapp_service
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Limiteur de débit à jetons (thread-safe, propre au processus)"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloque jusqu'à obtenir un jeton ; retourne le temps attendu (secondes)"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(device):
+    with _buckets_lock:
+        if device not in _buckets:
+            _buckets[device] = TokenBucket(settings.WASSENGER_RATE_LIMIT, settings.WASSENGER_RATE_BURST)
+        return _buckets[device]
+
+
+def enqueue(payload):
+    """Ajoute un message dans la boîte d'envoi et rend la main immédiatement"""
+    message = OutboundMessage.objects.create(
+        phone=payload.get('phone', ''),
+        device=payload.get('device') or '',
+        payload=payload,
+    )
+    metrics.incr('outbox.enqueued')
+    return {
+        'success': True,
+        'queued': True,
+        'outbox_id': message.id,
+    }
+
+
+def requeue_stale():
+    """Remet en file les envois restés 'sending' (dispatcher arrêté en plein envoi)"""
+    limite = timezone.now() - timedelta(seconds=settings.WHATSAPP_OUTBOX_STALE_AFTER)
+    return OutboundMessage.objects.filter(status='sending', started_at__lt=limite).update(
+        status='pending',
+        available_at=timezone.now(),
+    )
+
+
+def claim(limit):
+    """
+    Réserve jusqu'à `limit` messages à envoyer.
+
+    Seul le plus ancien message non terminé de chaque destinataire est
+    éligible : l'ordre est conservé par numéro, les numéros différents
+    partent en parallèle.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    precedent = OutboundMessage.objects.filter(
+        phone=OuterRef('phone'),
+        id__lt=OuterRef('id'),
+        status__in=('pending', 'sending'),
+    )
+    with transaction.atomic():
+        ids = list(
+            OutboundMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .exclude(Exists(precedent))
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        OutboundMessage.objects.filter(id__in=ids).update(
+            status='sending',
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+
+    return list(OutboundMessage.objects.filter(id__in=ids).order_by('id'))
+
+
+def deliver(message):
+    """Envoie un message réservé à Wassenger en respectant le débit du device"""
+    waited = _bucket(message.device).acquire()
+    if waited:
+        metrics.observe('outbox.rate_limit_wait', waited * 1000)
+
+    result = get_whatsapp_service()._send_request(message.payload)
+
+    if result['success']:
+        sent_at = timezone.now()
+        latency_ms = int((sent_at - message.created_at).total_seconds() * 1000)
+        OutboundMessage.objects.filter(pk=message.pk).update(
+            status='sent',
+            sent_at=sent_at,
+            latency_ms=latency_ms,
+            http_status=None,
+            last_error='',
+            wassenger_message_id=result.get('message_id') or '',
+        )
+        if message.message_id:
+            WhatsAppMessage.objects.filter(pk=message.message_id).update(
+                whatsapp_message_id=result.get('message_id'),
+                delivery_status='sent',
+                status_updated_at=sent_at,
+            )
+            if result.get('message_id'):
+                apply_pending_statuses([result['message_id']])
+        metrics.incr('outbox.sent')
+        metrics.observe('outbox.delivery', latency_ms)
+        return True
+
+    _mark_failed(message, result)
+    return False
+
+
+def _mark_failed(message, result):
+    """Replanifie sur 429/5xx/erreur réseau, abandonne sur les autres erreurs"""
+    status_code = result.get('status_code')
+    retryable = status_code is None or status_code == 429 or status_code >= 500
+
+    if not retryable or message.attempts >= settings.WHATSAPP_OUTBOX_MAX_ATTEMPTS:
+        OutboundMessage.objects.filter(pk=message.pk).update(
+            status='failed',
+            http_status=status_code,
+            last_error=str(result.get('error', ''))[:2000],
+        )
+        if message.message_id:
+            WhatsAppMessage.objects.filter(pk=message.message_id).update(
+                delivery_status='failed',
+                status_updated_at=timezone.now(),
+            )
+        metrics.incr('outbox.failed')
+        logger.error(f"❌ Envoi abandonné vers {message.phone} après {message.attempts} essai(s)")
+        return
+
+    delay = settings.WHATSAPP_OUTBOX_RETRY_BACKOFF * (2 ** (message.attempts - 1))
+    retry_after = result.get('retry_after')
+    if retry_after and str(retry_after).isdigit():
+        delay = max(delay, int(retry_after))
+
+    OutboundMessage.objects.filter(pk=message.pk).update(
+        status='pending',
+        http_status=status_code,
+        available_at=timezone.now() + timedelta(seconds=delay),
+        last_error=str(result.get('error', ''))[:2000],
+    )
+    metrics.incr('outbox.retried')
+
+
+def _run(message):
+    close_old_connections()
+    try:
+        return deliver(message)
+    except Exception as e:
+        logger.error(f"❌ Erreur dispatcher pour l'envoi {message.id}: {e}", exc_info=True)
+        _mark_failed(message, {'error': str(e)})
+    finally:
+        close_old_connections()
+
+
+def run_dispatcher(concurrency, poll_interval, should_stop, once=False):
+    """
+    Boucle du dispatcher : pool borné de threads d'envoi.
+
+    `should_stop` est un callable consulté à chaque tour de boucle.
+    """
+    in_flight = set()
+    last_stale_check = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='wa-dispatch') as pool:
+        while not should_stop():
+            in_flight = {f for f in in_flight if not f.done()}
+
+            if time.monotonic() - last_stale_check > 60:
+                requeue_stale()
+                last_stale_check = time.monotonic()
+
+            claimed = claim(concurrency - len(in_flight))
+            for message in claimed:
+                in_flight.add(pool.submit(_run, message))
+
+            if not claimed:
+                if once and not in_flight:
+                    break
+                time.sleep(poll_interval)
+
+
+def outbox_stats():
+    """Profondeur de la boîte d'envoi et latences de livraison (calculées en base)"""
+    now = timezone.now()
+    par_statut = dict(
+        OutboundMessage.objects.order_by().values_list('status').annotate(n=Count('id'))
+    )
+    recent = OutboundMessage.objects.filter(
+        status='sent',
+        sent_at__gte=now - timedelta(minutes=15),
+    ).aggregate(avg=Avg('latency_ms'), max=Max('latency_ms'), count=Count('id'))
+
+    return {
+        'depth': par_statut.get('pending', 0),
+        'sending': par_statut.get('sending', 0),
+        'failed': par_statut.get('failed', 0),
+        'delivery_15min': {
+            'count': recent['count'],
+            'avg_ms': round(recent['avg'] or 0, 1),
+            'max_ms': recent['max'] or 0,
+        },
+    }
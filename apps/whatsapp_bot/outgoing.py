@@ -0,0 +1,193 @@
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from django.db import transaction
+from django.utils import timezone
+from .models import WhatsAppMessage, OutboundMessage, PendingDeliveryStatus
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Progression des statuts de livraison : un statut ne régresse jamais
+# (un accusé 'delivered' arrivé après 'read' est ignoré).
+STATUTS_LIVRAISON = ['queued', 'sent', 'delivered', 'read']
+
+_local = threading.local()
+
+
+class OutgoingBuffer:
+    """
+    Messages sortants d'un tour de conversation, enregistrés en bulk à la fin.
+
+    Verrouillé : le message d'attente d'un appel NSIA lent est historisé
+    depuis le thread minuteur (voir nsia_api.slow_call_notice).
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.messages = []
+        self.envois = []
+        self._lock = threading.Lock()
+
+    def enqueue(self, payload):
+        """Prépare le message historique et son entrée de boîte d'envoi"""
+        envoi = OutboundMessage(
+            phone=payload.get('phone', ''),
+            device=payload.get('device') or '',
+            payload=payload,
+        )
+        with self._lock:
+            envoi.message_id = self._message(payload, delivery_status='queued').id
+            self.envois.append(envoi)
+        return {
+            'success': True,
+            'queued': True,
+            'message_id': None,
+        }
+
+    def record(self, payload, result):
+        """Historise un envoi direct (boîte d'envoi désactivée)"""
+        with self._lock:
+            self._message(
+                payload,
+                whatsapp_message_id=result.get('message_id') if result.get('success') else None,
+                delivery_status='sent' if result.get('success') else 'failed',
+            )
+
+    def flush(self):
+        """Écrit messages puis envois en deux INSERT groupés"""
+        with self._lock:
+            messages, envois = self.messages, self.envois
+            self.messages, self.envois = [], []
+        if not messages:
+            return
+        with transaction.atomic():
+            WhatsAppMessage.objects.bulk_create(messages)
+            if envois:
+                OutboundMessage.objects.bulk_create(envois)
+        metrics.incr('messages.outgoing', len(messages))
+        # Envois directs : un accusé a pu arriver avant l'historisation
+        envoyes = [m.whatsapp_message_id for m in messages if m.whatsapp_message_id]
+        if envoyes:
+            apply_pending_statuses(envoyes)
+        if envois:
+            metrics.incr('outbox.enqueued', len(envois))
+
+    def _message(self, payload, **fields):
+        if 'list' in payload:
+            message_type = 'list'
+        elif 'buttons' in payload:
+            message_type = 'buttons'
+        else:
+            message_type = 'text'
+
+        message = WhatsAppMessage(
+            id=uuid.uuid4(),
+            session=self.session,
+            direction='outgoing',
+            message_type=message_type,
+            content={k: v for k, v in payload.items() if k not in ('phone', 'device')},
+            status_updated_at=timezone.now(),
+            **fields,
+        )
+        self.messages.append(message)
+        return message
+
+
+@contextmanager
+def capture_outgoing(session, differe=False):
+    """
+    Bufferise les envois du bloc et les enregistre en une fois à la sortie.
+
+    differe=True : l'appelant enregistre lui-même via buffer.flush().
+    """
+    buffer = OutgoingBuffer(session)
+    previous = getattr(_local, 'buffer', None)
+    _local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _local.buffer = previous
+        if not differe:
+            buffer.flush()
+
+
+def current_buffer():
+    """Buffer actif dans le thread courant (None hors d'un tour de conversation)"""
+    return getattr(_local, 'buffer', None)
+
+
+def update_delivery_statuses(updates):
+    """
+    Applique des statuts de livraison Wassenger en masse.
+
+    `updates` : liste de (whatsapp_message_id, statut). Une requête UPDATE
+    est émise par statut distinct, quel que soit le nombre de messages.
+
+    Un accusé peut précéder l'enregistrement de l'identifiant par deliver()
+    (réponse Wassenger encore en cours de traitement) : il est gardé dans
+    PendingDeliveryStatus et appliqué dès que l'identifiant est connu.
+    """
+    updates = [(message_id, statut) for message_id, statut in updates if message_id and statut]
+    if not updates:
+        return 0
+
+    connus = set(
+        WhatsAppMessage.objects
+        .filter(direction='outgoing', whatsapp_message_id__in={m for m, _ in updates})
+        .values_list('whatsapp_message_id', flat=True)
+    )
+    total = _appliquer([(m, s) for m, s in updates if m in connus])
+
+    inconnus = [(m, s) for m, s in updates if m not in connus]
+    if inconnus:
+        PendingDeliveryStatus.objects.bulk_create([
+            PendingDeliveryStatus(whatsapp_message_id=m, status=s) for m, s in inconnus
+        ])
+        metrics.incr('messages.status_pending', len(inconnus))
+        # deliver() a pu enregistrer l'identifiant entre la lecture et l'insertion
+        total += apply_pending_statuses({m for m, _ in inconnus})
+    return total
+
+
+def apply_pending_statuses(message_ids):
+    """Applique les accusés reçus en avance pour ces identifiants Wassenger, puis les oublie"""
+    en_attente = list(
+        PendingDeliveryStatus.objects
+        .filter(whatsapp_message_id__in=message_ids)
+        .values_list('id', 'whatsapp_message_id', 'status')
+    )
+    if not en_attente:
+        return 0
+
+    connus = set(
+        WhatsAppMessage.objects
+        .filter(direction='outgoing', whatsapp_message_id__in={m for _, m, _ in en_attente})
+        .values_list('whatsapp_message_id', flat=True)
+    )
+    applicables = [(pk, m, s) for pk, m, s in en_attente if m in connus]
+    if not applicables:
+        return 0
+
+    total = _appliquer([(m, s) for _, m, s in applicables])
+    PendingDeliveryStatus.objects.filter(pk__in=[pk for pk, _, _ in applicables]).delete()
+    return total
+
+
+def _appliquer(updates):
+    """Un UPDATE par statut distinct ; un statut ne régresse jamais"""
+    par_statut = {}
+    for message_id, statut in updates:
+        par_statut.setdefault(statut, set()).add(message_id)
+
+    now = timezone.now()
+    total = 0
+    for statut, ids in par_statut.items():
+        qs = WhatsAppMessage.objects.filter(direction='outgoing', whatsapp_message_id__in=ids)
+        if statut in STATUTS_LIVRAISON:
+            qs = qs.exclude(delivery_status__in=STATUTS_LIVRAISON[STATUTS_LIVRAISON.index(statut) + 1:])
+        total += qs.update(delivery_status=statut, status_updated_at=now)
+
+    metrics.incr('messages.status_updates', total)
+    return total
@@ -1,9 +1,18 @@
 import requests
 import logging
+from functools import lru_cache
 from django.conf import settings
+from . import http_client
+from .outgoing import current_buffer
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
+def get_whatsapp_service():
+    """Instance partagée par le processus (sans état propre à une conversation)"""
+    return WhatsAppService()
+
+
 class WhatsAppService:
     """Service d'envoi de messages WhatsApp via Wassenger"""
     
@@ -19,7 +28,7 @@ class WhatsAppService:
             "message": text,
             "device": self.device_id
         }
-        return self._send_request(payload)
+        return self._dispatch(payload)
     
     def send_interactive_buttons(self, to_phone, body_text, buttons):
         """
@@ -41,7 +50,7 @@ class WhatsAppService:
                 for btn in buttons[:3]
             ]
         }
-        return self._send_request(payload)
+        return self._dispatch(payload)
     
     def send_interactive_list(self, to_phone, body_text, button_text, sections):
         """
@@ -56,7 +65,40 @@ class WhatsAppService:
                 "sections": sections
             }
         }
-        return self._send_request(payload)
+        return self._dispatch(payload)
+    
+    def send_text_now(self, to_phone, text):
+        """
+        Envoi immédiat, hors boîte d'envoi : pour un message d'attente qui
+        doit partir avant la fin de la transaction du tour en cours.
+        Retourne (payload, résultat).
+        """
+        payload = {
+            "phone": to_phone,
+            "message": text,
+            "device": self.device_id
+        }
+        return payload, self._send_request(payload)
+    
+    def _dispatch(self, payload):
+        """
+        Met le message dans la boîte d'envoi, ou l'envoie directement si elle est désactivée.
+
+        Pendant un tour de conversation, l'envoi est aussi historisé comme
+        WhatsAppMessage sortant (écrit en bulk en fin de traitement).
+        """
+        buffer = current_buffer()
+        
+        if settings.WHATSAPP_OUTBOX_ENABLED:
+            if buffer:
+                return buffer.enqueue(payload)
+            from . import outbox
+            return outbox.enqueue(payload)
+        
+        result = self._send_request(payload)
+        if buffer:
+            buffer.record(payload, result)
+        return result
     
     def _send_request(self, payload):
         """Envoie la requête à l'API Wassenger"""
@@ -66,7 +108,7 @@ class WhatsAppService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(self.api_url, json=payload, headers=headers)
+            response = http_client.post(self.api_url, json=payload, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -82,7 +124,11 @@ class WhatsAppService:
             
         except requests.exceptions.RequestException as e:
             error_msg = str(e)
+            status_code = None
+            retry_after = None
             if hasattr(e, 'response') and e.response is not None:
+                status_code = e.response.status_code
+                retry_after = e.response.headers.get('Retry-After')
                 try:
                     error_msg = f"{e.response.status_code}: {e.response.json()}"
                 except:
@@ -91,5 +137,7 @@ class WhatsAppService:
             logger.error(f"❌ Erreur envoi Wassenger: {error_msg}")
             return {
                 'success': False,
-                'error': error_msg
+                'error': error_msg,
+                'status_code': status_code,
+                'retry_after': retry_after,
             }
\ No newline at end of file
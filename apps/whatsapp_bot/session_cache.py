@@ -0,0 +1,160 @@
+import copy
+import logging
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from core.lru import TTLCache
+from core.shared_cache import cache_partage_actif
+from .metrics import metrics
+from .models import WhatsAppSession
+
+logger = logging.getLogger(__name__)
+
+# Colonnes conservées dans un instantané (ordre des champs concrets du modèle)
+_CHAMPS = [f.attname for f in WhatsAppSession._meta.concrete_fields]
+
+
+@lru_cache(maxsize=None)
+def get_session_cache():
+    """Cache de sessions partagé par le processus"""
+    cache = SessionCache(
+        ttl=settings.SESSION_CACHE_TTL,
+        maxsize=settings.SESSION_CACHE_MAXSIZE,
+        shared=cache_partage_actif('SESSION_CACHE_SHARED'),
+    )
+    metrics.register_gauge('session_cache', cache.stats)
+    return cache
+
+
+class SessionCache:
+    """
+    Cache chaud des sessions WhatsApp.
+
+    - numéro → id de session : le webhook enregistre le message sans
+      relire la session (get_or_create seulement au premier message) ;
+    - id → instantané de la ligne (contexte compris), étiqueté par sa version.
+
+    Un instantané n'est jamais servi sans contrôle : sous le verrou de
+    session, run_locked relit la seule colonne `version` et ne recharge la
+    ligne complète que si elle a changé (autre worker, admin, archivage).
+    Les écritures restent regroupées en un UPDATE conditionnel sur la
+    version en fin de tour (unit-of-work) : rien n'est différé au-delà du
+    commit.
+
+    Niveau 1 : LRU en mémoire ; niveau 2 optionnel : cache Django partagé
+    entre workers gunicorn (SESSION_CACHE_SHARED).
+    """
+
+    def __init__(self, ttl, maxsize, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        self._ids = TTLCache(maxsize, ttl)
+        self._snapshots = TTLCache(maxsize, ttl)
+
+    # ========================================
+    # NUMÉRO → SESSION
+    # ========================================
+
+    def session_id(self, phone):
+        """Id de la session du numéro, ou None s'il faut passer par la base"""
+        session_id = self._read(self._ids, f'id:{phone}')
+        metrics.incr('session_cache.id_hit' if session_id else 'session_cache.id_miss')
+        return session_id
+
+    def remember_id(self, phone, session_id):
+        self._write(self._ids, f'id:{phone}', session_id)
+
+    def forget(self, phone=None, session_id=None):
+        """Oublie une session (supprimée ou réinitialisée hors du chatbot)"""
+        if phone:
+            self._delete(self._ids, f'id:{phone}')
+        if session_id:
+            self._delete(self._snapshots, f'snap:{session_id}')
+
+    # ========================================
+    # INSTANTANÉS
+    # ========================================
+
+    def load(self, session_id):
+        """
+        Charge la session (à appeler sous jobs.verrou_session).
+
+        Instantané à jour : une requête sur la seule colonne version ;
+        sinon la ligne complète est relue.
+        """
+        snapshot = self._read(self._snapshots, f'snap:{session_id}')
+        if snapshot is None:
+            metrics.incr('session_cache.snapshot_miss')
+            return WhatsAppSession.objects.get(pk=session_id)
+
+        version = (
+            WhatsAppSession.objects
+            .filter(pk=session_id)
+            .values_list('version', flat=True)
+            .first()
+        )
+        if version is None:
+            self.forget(session_id=session_id)
+            raise WhatsAppSession.DoesNotExist(f"Session {session_id} introuvable")
+
+        if version == snapshot['version']:
+            metrics.incr('session_cache.snapshot_hit')
+            return WhatsAppSession.from_db('default', _CHAMPS, [copy.deepcopy(snapshot[c]) for c in _CHAMPS])
+
+        metrics.incr('session_cache.snapshot_stale')
+        return WhatsAppSession.objects.get(pk=session_id)
+
+    def remember(self, session):
+        """Conserve l'état de la session après un tour validé (commit effectué, verrou encore tenu)"""
+        self._write(self._snapshots, f'snap:{session.pk}', {c: copy.deepcopy(getattr(session, c)) for c in _CHAMPS})
+        self.remember_id(session.phone_number, session.pk)
+
+    def stats(self):
+        def ratio(prefix):
+            hits = metrics.get_counter(f'session_cache.{prefix}_hit')
+            total = hits + metrics.get_counter(f'session_cache.{prefix}_miss')
+            if prefix == 'snapshot':
+                total += metrics.get_counter('session_cache.snapshot_stale')
+            return round(hits / total, 4) if total else 0
+
+        return {
+            'shared': self.shared,
+            'ids': len(self._ids),
+            'snapshots': len(self._snapshots),
+            'id_hit_ratio': ratio('id'),
+            'snapshot_hit_ratio': ratio('snapshot'),
+            'snapshot_stale': metrics.get_counter('session_cache.snapshot_stale'),
+        }
+
+    # ========================================
+    # INTERNE
+    # ========================================
+
+    def _read(self, local, key):
+        value = local.get(key)
+        if value is not None or not self.shared:
+            return value
+        try:
+            value = shared_cache.get(f'wa-sess:{key}')
+        except Exception as e:
+            logger.warning(f"⚠️ Cache de sessions partagé indisponible: {e}")
+            return None
+        if value is not None:
+            local.set(key, value)
+        return value
+
+    def _write(self, local, key, value):
+        local.set(key, value)
+        if self.shared:
+            try:
+                shared_cache.set(f'wa-sess:{key}', value, timeout=self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Cache de sessions partagé indisponible: {e}")
+
+    def _delete(self, local, key):
+        local.delete(key)
+        if self.shared:
+            try:
+                shared_cache.delete(f'wa-sess:{key}')
+            except Exception:
+                pass
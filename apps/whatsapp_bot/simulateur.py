@@ -0,0 +1,306 @@
+"""
+Calcul des simulations (unitaire et en grille) selon SIMULATEUR_MODE.
+
+Point d'entrée commun au chatbot et à l'API : cache des résultats,
+moteur local / calculateur distant, comparaison en mode shadow.
+"""
+import itertools
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from . import actuariat
+from .metrics import metrics
+from .simulation_cache import get_simulation_cache
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = {
+    'retraite': '/calculateur/retraite/calculer/',
+    'pension_securite': '/calculateur/pensions/calculer/',
+    'pension_confort': '/calculateur/pensions/calculer/',
+    'pension_renfort': '/calculateur/pensions/calculer/',
+    'prevoyance': '/calculateur/prevoyance/calculer/',
+    'etudes': '/calculateur/etudes/calculer/',
+}
+
+# Noms courts (commande chat / API) → paramètres du calculateur
+ALIAS = {
+    'retraite': {'age': 'age', 'prime': 'prime_periodique_commerciale', 'capital': 'capital_deces', 'duree': 'duree'},
+    'pension': {'age': 'age', 'pension': 'montant_mensuel_pension', 'duree': 'duree_couverture'},
+    'prevoyance': {'age': 'age', 'capital': 'capital_deces', 'duree': 'duree'},
+    'etudes': {'age': 'age_parent', 'enfant': 'age_enfant', 'rente': 'montant_rente',
+               'duree': 'duree_paiement', 'service': 'duree_service'},
+}
+
+# Paramètres posés par le chatbot, repris tels quels d'une simulation précédente (non variables)
+PARAMETRES_FIXES = {
+    'retraite': ('periodicite',),
+    'pension': ('type_pension', 'periodicite'),
+}
+
+# Résultat affiché dans le tableau comparatif
+CHAMP_PRINCIPAL = {
+    'retraite': ('capital_garanti', 'Capital garanti'),
+    'pension': ('prime_totale', 'Prime mensuelle'),
+    'prevoyance': ('total_prime_periodique', 'Prime périodique'),
+    'etudes': ('prime_mensuelle', 'Prime mensuelle'),
+}
+
+
+class GrilleError(ValueError):
+    """Grille invalide (produit, paramètre, taille)"""
+
+
+def famille(produit):
+    return 'pension' if produit.startswith('pension') else produit
+
+
+# ========================================
+# CALCUL UNITAIRE
+# ========================================
+
+def calculer(produit, parametres, auth):
+    """
+    Calcule une simulation (cache → moteur local ou API).
+    Retourne (resultat, erreur).
+    """
+    cache = get_simulation_cache()
+    resultat = cache.get(produit, parametres)
+    if resultat is not None:
+        return resultat, None
+
+    resultat, erreur = _calculer_tarif(produit, parametres, auth)
+    if resultat is not None:
+        cache.set(produit, parametres, resultat)
+    return resultat, erreur
+
+
+def mode_effectif(produit):
+    """SIMULATEUR_MODE, sauf 'local' pour un produit que le moteur n'a pas validé : 'shadow'"""
+    mode = settings.SIMULATEUR_MODE
+    if mode == 'local' and produit not in actuariat.produits_valides():
+        metrics.incr('simulateur.local_non_valide')
+        return 'shadow'
+    return mode
+
+
+def _calculer_tarif(produit, parametres, auth):
+    """
+    'local' : moteur local (repli sur l'API si hors domaine) ; 'remote' : API ;
+    'shadow' : API servie, moteur local comparé.
+    """
+    mode = mode_effectif(produit)
+
+    if mode == 'local':
+        try:
+            with metrics.timer('simulateur.local'):
+                return actuariat.calculer(produit, parametres), None
+        except actuariat.ActuariatError as e:
+            metrics.incr('simulateur.local_fallback')
+            logger.warning(f"⚠️ Moteur local indisponible ({produit}), repli sur l'API : {e}")
+
+    with metrics.timer('simulateur.remote'):
+        response = auth.post(
+            f"{settings.API_BASE_URL}/api/v1/simulateur{ENDPOINTS[produit]}",
+            json={'parametres_simulation': parametres},
+        )
+
+    if response.status_code != 200:
+        return None, response.json().get('error', 'Erreur calcul')
+
+    resultat = response.json()
+    if mode == 'shadow':
+        actuariat.shadow(produit, parametres, resultat)
+    return resultat, None
+
+
+# ========================================
+# GRILLE
+# ========================================
+
+def parse_valeurs(texte):
+    """'30,35,40' → [30, 35, 40] ; '30-40:5' → [30, 35, 40] ; '50000' → [50000]"""
+    texte = texte.replace(' ', '')
+    plage = re.fullmatch(r'(\d+)-(\d+)(?::(\d+))?', texte)
+    if plage:
+        debut, fin = int(plage.group(1)), int(plage.group(2))
+        pas = int(plage.group(3) or max((fin - debut) // 4, 1))
+        if fin < debut or pas <= 0:
+            raise GrilleError(f"Plage invalide : {texte}")
+        return list(range(debut, fin + 1, pas))
+    try:
+        return [int(v) for v in texte.split(',') if v]
+    except ValueError:
+        raise GrilleError(f"Valeurs invalides : {texte}")
+
+
+def normaliser(produit, base, variations):
+    """Traduit les alias et valide produit / axes / taille de la grille"""
+    if produit not in ENDPOINTS:
+        raise GrilleError(f"Produit inconnu : {produit}")
+    alias = ALIAS[famille(produit)]
+
+    def nom(cle):
+        return alias.get(cle, cle) if cle in alias or cle in alias.values() else None
+
+    parametres = {}
+    for cle, valeur in base.items():
+        if cle in PARAMETRES_FIXES.get(famille(produit), ()):
+            parametres[cle] = valeur
+            continue
+        if nom(cle) is None:
+            raise GrilleError(f"Paramètre inconnu pour {produit} : {cle}")
+        parametres[nom(cle)] = valeur
+
+    axes = {}
+    for cle, valeurs in variations.items():
+        if nom(cle) is None:
+            raise GrilleError(f"Paramètre inconnu pour {produit} : {cle}")
+        if len(valeurs) == 1:
+            parametres[nom(cle)] = valeurs[0]
+        else:
+            axes[nom(cle)] = list(valeurs)
+
+    if len(axes) > 2:
+        raise GrilleError("Deux paramètres variables au maximum.")
+    taille = 1
+    for valeurs in axes.values():
+        taille *= len(valeurs)
+    if taille > settings.SIMULATEUR_GRILLE_MAX:
+        raise GrilleError(f"Grille trop grande ({taille} cas, maximum {settings.SIMULATEUR_GRILLE_MAX}).")
+
+    manquants = [a for a, p in alias.items() if p not in parametres and p not in axes and a != 'enfant']
+    if manquants:
+        raise GrilleError(f"Paramètre(s) manquant(s) : {', '.join(manquants)}")
+
+    if famille(produit) == 'pension':
+        parametres.setdefault('type_pension', produit)
+        parametres.setdefault('periodicite', 'Mensuelle')
+    elif produit == 'retraite':
+        parametres.setdefault('periodicite', 'Mensuelle')
+    elif produit == 'etudes':
+        parametres.setdefault('age_enfant', 0)
+
+    return parametres, axes
+
+
+def calculer_grille(produit, base, variations, auth):
+    """
+    Calcule toutes les combinaisons de la grille.
+
+    Moteur local : toutes les cases en un seul appel au moteur, sans passer
+    par le cache case par case. Cases restantes (modes 'remote' / 'shadow',
+    hors domaine du moteur) : appels API en parallèle avec un jeton résolu
+    une fois avant de lancer les threads, la concurrence restant sous la
+    taille du cloisonnement NSIA. La grille entière est mise en cache.
+    """
+    parametres, axes = normaliser(produit, base, variations)
+    noms = list(axes)
+    cache = get_simulation_cache()
+    cle_cache = f"grille:{produit}"
+    grille = cache.get(cle_cache, {'base': parametres, 'axes': axes})
+    if grille is not None:
+        return grille
+
+    cases = [
+        {**parametres, **dict(zip(noms, combinaison))}
+        for combinaison in itertools.product(*axes.values())
+    ]
+
+    with metrics.timer('simulateur.grille'):
+        resultats = [None] * len(cases)
+        if mode_effectif(produit) == 'local':
+            with metrics.timer('simulateur.local'):
+                resultats = [(r, None) if r else None for r in actuariat.calculer_lot(produit, cases)]
+
+        restants = [i for i, r in enumerate(resultats) if r is None]
+        if restants:
+            # Renouvellement éventuel du jeton ici, dans le thread du tour : les
+            # threads du pool ne modifient jamais le contexte de session
+            jeton = auth.frozen()
+            with ThreadPoolExecutor(max_workers=_concurrence_grille(len(restants))) as pool:
+                calcules = pool.map(lambda i: _calculer_case(produit, cases[i], jeton), restants)
+                for i, resultat in zip(restants, calcules):
+                    resultats[i] = resultat
+
+    champ, libelle = CHAMP_PRINCIPAL[famille(produit)]
+    lignes = []
+    erreurs = 0
+    for case, (resultat, erreur) in zip(cases, resultats):
+        res = (resultat or {}).get('resultats_simulation', {})
+        erreurs += resultat is None
+        lignes.append({
+            'valeurs': {n: case[n] for n in noms},
+            'resultats': res,
+            'valeur': res.get(champ),
+            'erreur': erreur,
+        })
+
+    grille = {
+        'produit': produit,
+        'parametres': parametres,
+        'axes': axes,
+        'champ': champ,
+        'libelle': libelle,
+        'lignes': lignes,
+    }
+    metrics.incr('simulateur.grille_cases', len(cases))
+    # Une grille incomplète (erreur API) n'est pas mise en cache
+    if not erreurs:
+        cache.set(cle_cache, {'base': parametres, 'axes': axes}, grille)
+    return grille
+
+
+def _calculer_case(produit, parametres, auth):
+    """Case calculée dans un thread du pool : ses connexions base (mode shadow) sont fermées ensuite"""
+    try:
+        return calculer(produit, parametres, auth)
+    finally:
+        connections.close_all()
+
+
+def _concurrence_grille(cases):
+    """Appels parallèles d'une grille : au plus la moitié des places du cloisonnement NSIA"""
+    return max(1, min(cases, settings.SIMULATEUR_GRILLE_CONCURRENCY, settings.NSIA_BULKHEAD_SIZE // 2))
+
+
+def _court(valeur):
+    if valeur is None:
+        return '—'
+    valeur = float(valeur)
+    if abs(valeur) >= 1_000_000:
+        return f"{valeur / 1_000_000:.1f}M"
+    if abs(valeur) >= 10_000:
+        return f"{valeur / 1000:.0f}k"
+    return f"{valeur:,.0f}"
+
+
+def formater_grille(grille):
+    """Tableau comparatif compact (texte WhatsApp)"""
+    axes = list(grille['axes'].items())
+    titre = f"📊 GRILLE {grille['produit'].upper()}\n{grille['libelle']} (FCFA)"
+    fixes = ', '.join(
+        f"{k}={v}" for k, v in grille['parametres'].items()
+        if k not in grille['axes'] and k not in ('periodicite', 'type_pension')
+    )
+    if fixes:
+        titre += f"\nBase : {fixes}"
+    lignes = []
+
+    if not axes:
+        lignes.append(_court(grille['lignes'][0]['valeur']))
+    elif len(axes) == 1:
+        nom, _ = axes[0]
+        for ligne in grille['lignes']:
+            lignes.append(f"{nom} {ligne['valeurs'][nom]:>6} : {_court(ligne['valeur'])}")
+    else:
+        (nom_l, valeurs_l), (nom_c, valeurs_c) = axes
+        par_case = {(l['valeurs'][nom_l], l['valeurs'][nom_c]): l['valeur'] for l in grille['lignes']}
+        lignes.append(f"{nom_l} \\ {nom_c}")
+        lignes.append(' '.join([f"{'':>6}"] + [f"{v:>7}" for v in valeurs_c]))
+        for vl in valeurs_l:
+            lignes.append(' '.join([f"{vl:>6}"] + [f"{_court(par_case[(vl, vc)]):>7}" for vc in valeurs_c]))
+
+    return f"{titre}\n\n```\n" + '\n'.join(lignes) + "\n```"
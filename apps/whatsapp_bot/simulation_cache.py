@@ -0,0 +1,75 @@
+import copy
+import json
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from django.conf import settings
+from core.lru import TTLCache
+from .metrics import metrics
+
+
+@lru_cache(maxsize=None)
+def get_simulation_cache():
+    """Cache des résultats du calculateur partagé par le processus"""
+    cache = SimulationCache(
+        maxsize=settings.SIMULATION_CACHE_MAXSIZE,
+        ttl=settings.SIMULATION_CACHE_TTL,
+        tarif_version=settings.SIMULATEUR_TARIF_VERSION,
+    )
+    metrics.register_gauge('simulation_cache', cache.stats)
+    return cache
+
+
+def _canonical_value(value):
+    """'50000', 50000.0 et 50000 donnent la même clé"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float, str)):
+        try:
+            number = Decimal(str(value).strip().replace(' ', ''))
+        except InvalidOperation:
+            return str(value).strip()
+        if number.is_finite():
+            return int(number) if number == number.to_integral_value() else float(number)
+        return str(value).strip()
+    if isinstance(value, dict):
+        return {k: _canonical_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(v) for v in value]
+    return str(value)
+
+
+def canonical_key(produit, parametres):
+    """Clé stable (produit, paramètres normalisés) indépendante de l'ordre et du typage"""
+    return json.dumps([produit, _canonical_value(parametres)], sort_keys=True, separators=(',', ':'))
+
+
+class SimulationCache:
+    """
+    Mémoïsation des calculs tarifaires.
+
+    Les résultats ne dépendent que du produit, des paramètres et du tarif
+    en vigueur : la version de tarif fait partie de la clé, un changement
+    de SIMULATEUR_TARIF_VERSION invalide donc toutes les entrées.
+    """
+
+    def __init__(self, maxsize, ttl, tarif_version):
+        self.tarif_version = tarif_version
+        self._cache = TTLCache(maxsize, ttl)
+
+    def get(self, produit, parametres):
+        resultat = self._cache.get(self._key(produit, parametres))
+        metrics.incr('simulation_cache.hit' if resultat is not None else 'simulation_cache.miss')
+        # Copie : l'appelant peut enrichir le résultat sans altérer le cache
+        return copy.deepcopy(resultat)
+
+    def set(self, produit, parametres, resultat):
+        self._cache.set(self._key(produit, parametres), copy.deepcopy(resultat))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {**self._cache.stats(), 'tarif_version': self.tarif_version}
+
+    def _key(self, produit, parametres):
+        return f"{self.tarif_version}|{canonical_key(produit, parametres)}"
@@ -0,0 +1,74 @@
+"""
+Routage IA spéculatif du menu principal.
+
+Le tour déterministe ("Option invalide…") est validé sans attendre
+Gemini ; la détection tourne ensuite dans un pool avec un délai ferme
+(INTENT_AI_DEADLINE). Une intention sûre obtenue à temps est appliquée
+sous le verrou de session (jobs.verrou_session), à condition que la session n'ait pas bougé
+depuis (même version, toujours au menu). Sinon le résultat est ignoré.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from django.conf import settings
+from django.db import close_old_connections
+from . import intents, jobs
+from .metrics import metrics
+from .session_cache import get_session_cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _get_pool():
+    return ThreadPoolExecutor(max_workers=settings.INTENT_SPECULATION_WORKERS, thread_name_prefix='intent-spec')
+
+
+def lancer(session_id, version, texte):
+    """Planifie la détection Gemini pour un message resté sans intention"""
+    metrics.incr('intents.speculation.launched')
+    _get_pool().submit(_speculer, session_id, version, texte, time.monotonic())
+
+
+def _speculer(session_id, version, texte, debut):
+    close_old_connections()
+    try:
+        budget = settings.INTENT_AI_DEADLINE - (time.monotonic() - debut)
+        if budget <= 0:
+            metrics.incr('intents.speculation.late')
+            return
+
+        resultat = intents.par_gemini(texte, timeout=budget)
+        if time.monotonic() - debut > settings.INTENT_AI_DEADLINE:
+            metrics.incr('intents.speculation.late')
+            return
+        if not intents.confiant(resultat):
+            metrics.incr('intents.speculation.dropped')
+            return
+
+        if appliquer(session_id, version, texte, resultat):
+            metrics.observe('intents.speculation', (time.monotonic() - debut) * 1000)
+    except Exception as e:
+        logger.error(f"❌ Routage IA spéculatif en erreur ({session_id}): {e}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def appliquer(session_id, version, texte, resultat):
+    """Entre dans le flux de l'intention si la session est restée au menu, à la même version"""
+    from .handlers import ConversationHandler
+
+    sessions = get_session_cache()
+    with jobs.verrou_session(session_id):
+        session = sessions.load(session_id)
+        if session.version != version or session.current_state != 'MENU_PRINCIPAL':
+            # L'agent a continué entre-temps : sa réponse prime sur la spéculation
+            metrics.incr('intents.speculation.stale')
+            return False
+
+        handler = ConversationHandler(session, texte)
+        handler.handle(lambda: handler.router_intention(resultat))
+        sessions.remember(session)
+    metrics.incr('intents.speculation.applied')
+    return True
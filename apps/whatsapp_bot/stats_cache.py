@@ -0,0 +1,106 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from django.conf import settings
+from core.lru import TTLCache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_stats_cache():
+    """Cache des statistiques agents partagé par le processus"""
+    cache = AgentStatsCache(
+        ttl=settings.AGENT_STATS_CACHE_TTL,
+        stale_ttl=settings.AGENT_STATS_STALE_TTL,
+        maxsize=settings.AGENT_CACHE_MAXSIZE,
+    )
+    metrics.register_gauge('agent_stats_cache', cache.stats)
+    return cache
+
+
+class AgentStatsCache:
+    """
+    Statistiques / commissions par agent avec stale-while-revalidate.
+
+    - âge < ttl : valeur servie telle quelle ;
+    - ttl ≤ âge < ttl + stale_ttl : valeur servie immédiatement, rafraîchie
+      en arrière-plan (un seul rafraîchissement en cours par agent) ;
+    - au-delà, ou absente : appel synchrone à l'API.
+    """
+
+    def __init__(self, ttl, stale_ttl, maxsize=5000):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize, ttl + stale_ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='agent-stats')
+
+    def get(self, agent_id, auth):
+        """Retourne les stats de l'agent (dict) ou None si l'API est indisponible"""
+        entry = self._cache.peek(agent_id)
+        if entry is not None:
+            data, age = entry
+            if age < self.ttl and not data.get('partiel'):
+                metrics.incr('agent_stats.hit')
+            else:
+                metrics.incr('agent_stats.stale')
+                self._refresh_async(agent_id, auth)
+            return data
+
+        metrics.incr('agent_stats.miss')
+        return self._fetch(agent_id, auth)
+
+    def seed(self, agent_id, data):
+        """Amorce le cache avec les statistiques partielles reçues au login"""
+        if agent_id and self._cache.peek(agent_id) is None:
+            self._cache.set(agent_id, {**data, 'partiel': True})
+
+    def invalidate(self, agent_id):
+        self._cache.delete(agent_id)
+
+    def stats(self):
+        with self._lock:
+            refreshing = len(self._refreshing)
+        return {**self._cache.stats(), 'refreshing': refreshing}
+
+    # ========================================
+    # INTERNE
+    # ========================================
+
+    def _fetch(self, agent_id, auth):
+        with metrics.timer('agent_stats.fetch'):
+            response = auth.get(f"{settings.API_BASE_URL}/api/v1/agents/{agent_id}/stats/")
+        if response.status_code != 200:
+            logger.warning(f"⚠️ Stats agent {agent_id} : HTTP {response.status_code}")
+            return None
+
+        data = response.json()['data']
+        self._cache.set(agent_id, data)
+        return data
+
+    def _refresh_async(self, agent_id, auth):
+        with self._lock:
+            if agent_id in self._refreshing:
+                return
+            self._refreshing.add(agent_id)
+        try:
+            # Jeton figé : la session n'est pas modifiée depuis le thread de fond
+            frozen = auth.frozen()
+        except Exception:
+            with self._lock:
+                self._refreshing.discard(agent_id)
+            raise
+        self._pool.submit(self._refresh, agent_id, frozen)
+
+    def _refresh(self, agent_id, auth):
+        try:
+            self._fetch(agent_id, auth)
+        except Exception as e:
+            # La valeur périmée reste servie jusqu'à expiration complète
+            logger.warning(f"⚠️ Rafraîchissement stats agent {agent_id} échoué: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(agent_id)
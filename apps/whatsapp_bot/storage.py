@@ -0,0 +1,45 @@
+import json
+import zlib
+from django.conf import settings
+
+
+def compact_content(text, msg_data):
+    """Ne garde du message Wassenger que les champs utilisés par le bot"""
+    list_reply = msg_data.get('listReply') or msg_data.get('list_reply')
+    button_reply = msg_data.get('selectedButtonId') or msg_data.get('buttonReply')
+    if isinstance(button_reply, dict):
+        button_reply = button_reply.get('id')
+
+    content = {
+        'text': text,
+        'type': msg_data.get('type'),
+        'list_reply_id': list_reply.get('id') if isinstance(list_reply, dict) else None,
+        'button_id': button_reply or None,
+        'timestamp': msg_data.get('timestamp'),
+    }
+    return {k: v for k, v in content.items() if v not in (None, '')}
+
+
+def compress_payload(data):
+    """Sérialise et compresse un payload JSON (zlib)"""
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def decompress_payload(blob):
+    """Inverse de compress_payload"""
+    if not blob:
+        return None
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+def incoming_storage(text, msg_data, data):
+    """
+    Retourne (content, raw_payload) pour un message entrant selon
+    WHATSAPP_MESSAGE_STORAGE ('compact' ou 'full') et
+    WHATSAPP_STORE_RAW_PAYLOAD.
+    """
+    if settings.WHATSAPP_MESSAGE_STORAGE == 'full':
+        return {'text': text, 'raw': data}, None
+
+    raw = compress_payload(data) if settings.WHATSAPP_STORE_RAW_PAYLOAD else None
+    return compact_content(text, msg_data), raw
@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import tempfile
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from apps.whatsapp_bot import actuariat, simulateur
+from apps.whatsapp_bot.models import SimulationShadow
+
+RETRAITE = {'age': 35, 'prime_periodique_commerciale': 50000, 'capital_deces': 1000000, 'periodicite': 'Mensuelle'}
+
+
+class ReferenceCalculateurTests(SimpleTestCase):
+    """Moteur local comparé aux réponses enregistrées du calculateur NSIA (SIMULATEUR_REFERENCE)"""
+
+    def test_moteur_conforme_aux_reponses_enregistrees(self):
+        cas = actuariat.charger_reference(settings.SIMULATEUR_REFERENCE)
+        if not cas:
+            self.skipTest(
+                f"Aucune réponse du calculateur enregistrée pour le tarif {settings.SIMULATEUR_TARIF_VERSION} "
+                f"(mode shadow puis export_simulateur_reference)"
+            )
+        rapport = actuariat.verifier(cas, settings.SIMULATEUR_SHADOW_TOLERANCE)
+        self.assertEqual({p: s['divergences'] for p, s in rapport.items() if s['divergences']}, {})
+
+
+def _reponse(produit, parametres, facteur=1.0):
+    """Réponse au format du calculateur, construite ici à partir du moteur local (× facteur)"""
+    resultats = actuariat.calculer(produit, parametres)['resultats_simulation']
+    return {'resultats_simulation': {
+        k: v * facteur if isinstance(v, (int, float)) else v for k, v in resultats.items()
+    }}
+
+
+@override_settings(SIMULATEUR_MODE='local', SIMULATEUR_REFERENCE_MIN_CAS=3)
+class ValidationModeLocalTests(SimpleTestCase):
+    """Le mode local n'est servi que pour les produits validés contre des réponses enregistrées"""
+
+    def setUp(self):
+        actuariat.produits_valides.cache_clear()
+        self.addCleanup(actuariat.produits_valides.cache_clear)
+
+    def _reference(self, cas):
+        fd, chemin = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump({'cas': cas}, fh)
+        self.addCleanup(os.remove, chemin)
+        reglage = override_settings(SIMULATEUR_REFERENCE=chemin)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+
+    def _cas(self, produit='retraite', facteur=1.0, durees=(10, 15, 20), tarif=None):
+        return [{
+            'produit': produit,
+            'tarif_version': tarif or settings.SIMULATEUR_TARIF_VERSION,
+            'requete': {'parametres_simulation': {**RETRAITE, 'duree': duree}},
+            'reponse': _reponse(produit, {**RETRAITE, 'duree': duree}, facteur),
+        } for duree in durees]
+
+    def test_sans_reference_local_refuse(self):
+        self._reference([])
+        with self.assertLogs('apps.whatsapp_bot.actuariat', 'WARNING'):
+            self.assertEqual(simulateur.mode_effectif('retraite'), 'shadow')
+
+    def test_reponses_conformes_valident_le_produit(self):
+        self._reference(self._cas())
+        with self.assertLogs('apps.whatsapp_bot.actuariat', 'WARNING'):
+            self.assertEqual(actuariat.produits_valides(), frozenset({'retraite'}))
+        self.assertEqual(simulateur.mode_effectif('retraite'), 'local')
+        self.assertEqual(simulateur.mode_effectif('prevoyance'), 'shadow')
+
+    def test_une_divergence_invalide_le_produit(self):
+        self._reference(self._cas() + self._cas(facteur=1.1, durees=(25,)))
+        with self.assertLogs('apps.whatsapp_bot.actuariat', 'WARNING'):
+            self.assertEqual(simulateur.mode_effectif('retraite'), 'shadow')
+
+    def test_trop_peu_de_cas(self):
+        self._reference(self._cas(durees=(10, 15)))
+        with self.assertLogs('apps.whatsapp_bot.actuariat', 'WARNING'):
+            self.assertNotIn('retraite', actuariat.produits_valides())
+
+    def test_autre_tarif_ignore(self):
+        self._reference(self._cas(tarif='ancien'))
+        with self.assertLogs('apps.whatsapp_bot.actuariat', 'WARNING'):
+            self.assertEqual(actuariat.produits_valides(), frozenset())
+
+    @override_settings(SIMULATEUR_MODE='remote')
+    def test_autres_modes_inchanges(self):
+        self.assertEqual(simulateur.mode_effectif('retraite'), 'remote')
+
+
+@override_settings(SIMULATEUR_SHADOW_TOLERANCE=0.01)
+class ShadowTests(TestCase):
+    """Paires distant / local enregistrées en base"""
+
+    def test_divergence_enregistree(self):
+        parametres = {**RETRAITE, 'duree': 15}
+        with self.assertLogs('apps.whatsapp_bot.actuariat', 'WARNING'):
+            actuariat.shadow('retraite', parametres, _reponse('retraite', parametres, facteur=1.1))
+
+        paire = SimulationShadow.objects.get()
+        self.assertTrue(paire.divergent)
+        self.assertAlmostEqual(paire.ecart_max, 1 / 11, places=2)
+        self.assertEqual(paire.requete, {'parametres_simulation': parametres})
+
+    def test_hors_domaine_enregistre_sans_calcul_local(self):
+        parametres = {**RETRAITE, 'age': 105, 'duree': 15}
+        actuariat.shadow('retraite', parametres, {'resultats_simulation': {'capital_garanti': 1}})
+
+        paire = SimulationShadow.objects.get()
+        self.assertIsNone(paire.local)
+        self.assertFalse(paire.divergent)
+
+    def test_export_puis_verification(self):
+        for duree in (10, 15, 15):
+            parametres = {**RETRAITE, 'duree': duree}
+            actuariat.shadow('retraite', parametres, _reponse('retraite', parametres))
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        chemin = os.path.join(dossier.name, 'calculateur_nsia.json')
+        call_command('export_simulateur_reference', chemin, stdout=io.StringIO())
+
+        cas = actuariat.charger_reference(chemin)
+        self.assertEqual(len(cas), 2)  # requêtes distinctes
+        rapport = actuariat.verifier(cas, 0.01)
+        self.assertEqual((rapport['retraite']['ok'], rapport['retraite']['divergences']), (2, []))
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from apps.borne_auth.directory import get_agent_directory
+from apps.borne_auth.models import Agent
+from apps.whatsapp_bot.models import ConversationJob, WhatsAppMessage, WhatsAppSession
+
+
+class ChangelistRequetesTests(TestCase):
+    """Coût constant des listes admin, annuaire d'agents froid"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Table 'agents' non gérée par Django : créée pour la durée des tests
+        with connection.schema_editor() as editor:
+            editor.create_model(Agent)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            editor.delete_model(Agent)
+
+    def setUp(self):
+        get_agent_directory.cache_clear()
+        self.addCleanup(get_agent_directory.cache_clear)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.n = 0
+
+    def _ajouter(self, nombre):
+        for _ in range(nombre):
+            self.n += 1
+            agent = Agent.objects.create(
+                nom='NGOMA', prenom='Jean', telephone=f'06000{self.n:04d}', matricule=f'AG-{self.n:03d}',
+            )
+            session = WhatsAppSession.objects.create(phone_number=f'+24206000{self.n:04d}', agent=agent)
+            message = WhatsAppMessage.objects.create(
+                session=session, direction='incoming', message_type='text', content={'text': 'menu'},
+            )
+            ConversationJob.objects.create(session=session, message=message, text='menu')
+
+    def _requetes(self, url):
+        get_agent_directory.cache_clear()
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(requetes)
+
+    def test_listes_independantes_du_nombre_d_agents(self):
+        for modele in ('whatsappsession', 'whatsappmessage', 'conversationjob'):
+            with self.subTest(modele=modele):
+                url = f'/admin/whatsapp_bot/{modele}/'
+                self._ajouter(1)
+                une_ligne = self._requetes(url)
+
+                self._ajouter(5)
+                get_agent_directory.cache_clear()
+                with self.assertNumQueries(une_ligne):
+                    reponse = self.client.get(url)
+                self.assertContains(reponse, 'AG-006' if modele != 'conversationjob' else '+242060000006')
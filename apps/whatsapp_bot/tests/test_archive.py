@@ -0,0 +1,49 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+from apps.whatsapp_bot.models import ArchivedMessage, WhatsAppMessage, WhatsAppSession
+
+
+class ArchiveMessagesTests(TestCase):
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000010')
+        self.ancien = self._message('ancien', days=120)
+        self.recent = self._message('recent', days=1)
+
+    def _message(self, texte, days):
+        message = WhatsAppMessage.objects.create(
+            session=self.session, direction='incoming', message_type='chat', content={'text': texte},
+        )
+        WhatsAppMessage.objects.filter(pk=message.pk).update(timestamp=timezone.now() - timedelta(days=days))
+        message.refresh_from_db()
+        return message
+
+    def _archiver(self):
+        call_command('archive_whatsapp_data', days=90, pause=0, stdout=StringIO())
+
+    def test_messages_anciens_deplaces_dans_l_archive(self):
+        self._archiver()
+        self.assertEqual(list(WhatsAppMessage.objects.values_list('pk', flat=True)), [self.recent.pk])
+        archive = ArchivedMessage.objects.get()
+        self.assertEqual(
+            (archive.pk, archive.session_id, archive.content, archive.timestamp),
+            (self.ancien.pk, self.session.pk, {'text': 'ancien'}, self.ancien.timestamp),
+        )
+        self.assertEqual(archive.mois, self.ancien.timestamp.strftime('%Y-%m'))
+
+    def test_aucune_suppression_si_l_archive_echoue(self):
+        with mock.patch.object(ArchivedMessage.objects, 'bulk_create', side_effect=DatabaseError('disque plein')):
+            with self.assertRaises(DatabaseError):
+                self._archiver()
+        self.assertEqual(WhatsAppMessage.objects.count(), 2)
+        self.assertFalse(ArchivedMessage.objects.exists())
+
+    def test_dry_run(self):
+        call_command('archive_whatsapp_data', days=90, pause=0, dry_run=True, stdout=StringIO())
+        self.assertEqual(WhatsAppMessage.objects.count(), 2)
+        self.assertFalse(ArchivedMessage.objects.exists())
@@ -0,0 +1,70 @@
+from django.test import SimpleTestCase
+from apps.whatsapp_bot.entites import completer, depuis_ia, extraire, forts
+
+
+class ExtraireTests(SimpleTestCase):
+    """Grammaire locale des messages libres (souscription PASS et simulateur)"""
+
+    def test_souscription_en_un_message(self):
+        self.assertEqual(extraire('Batela mensuel Moukouri Jean 061234567 12/03/1985'), {
+            'produit_pass': 'BATELA',
+            'recurrence': 'mensuel',
+            'nom': 'MOUKOURI',
+            'prenom': 'Jean',
+            'telephone': '061234567',
+            'date_naissance': '1985-03-12',
+        })
+
+    def test_indicatif_prenom_compose_et_date_invalide(self):
+        entites = extraire('Kimia unique Ngoma jean-pierre +242 06 123 45 67 31/02/1990')
+        self.assertEqual(entites['telephone'], '061234567')
+        self.assertEqual(entites['prenom'], 'Jean-Pierre')
+        self.assertNotIn('date_naissance', entites)
+
+    def test_simulation_retraite(self):
+        self.assertEqual(extraire('simulation retraite 35 ans prime 50 000 capital 2 millions sur 15 ans'), {
+            'produit_simulateur': 'retraite',
+            'age': 35,
+            'prime_mensuelle': 50000,
+            'capital_deces': 2000000,
+            'duree': 15,
+        })
+
+    def test_pension_montant_en_k(self):
+        entites = extraire('pension confort 100k pour 10 ans age 45')
+        self.assertEqual(entites['produit_simulateur'], 'pension_confort')
+        self.assertEqual((entites['pension_mensuelle'], entites['duree'], entites['age']), (100000, 10, 45))
+
+    def test_accents_et_decimales(self):
+        entites = extraire('Prévoyance âge 40 capital 1,5 M durée de 12 ans')
+        self.assertEqual(entites, {'produit_simulateur': 'prevoyance', 'age': 40, 'capital_deces': 1500000, 'duree': 12})
+
+    def test_etudes_durees_distinctes(self):
+        entites = extraire('etudes parent 38 ans enfant de 5 ans rente 600000 études sur 5 ans pendant 12 ans')
+        self.assertEqual(
+            {k: entites[k] for k in ('age', 'age_enfant', 'duree_service', 'duree', 'rente_annuelle')},
+            {'age': 38, 'age_enfant': 5, 'duree_service': 5, 'duree': 12, 'rente_annuelle': 600000},
+        )
+
+    def test_phrase_sans_entite(self):
+        self.assertEqual(extraire('je veux faire une simulation'), {})
+
+
+class SecoursIaTests(SimpleTestCase):
+
+    def test_entites_gemini(self):
+        self.assertEqual(
+            depuis_ia({'ia_produit': 'Pension Sécurité', 'ia_client': 'moukouri jean paul', 'ia_montant': 50000}),
+            {'produit_simulateur': 'pension_securite', 'nom': 'MOUKOURI', 'prenom': 'Jean Paul', 'montant': 50000.0},
+        )
+
+    def test_la_grammaire_prime_sauf_pour_le_nom(self):
+        grammaire = {'produit_pass': 'BATELA', 'nom': 'MENSUELLEMENT', 'prenom': 'X'}
+        secours = {'produit_pass': 'KIMIA', 'nom': 'MOUKOURI', 'prenom': 'Jean', 'montant': 1000.0}
+        self.assertEqual(completer(grammaire, secours), {
+            'produit_pass': 'BATELA', 'nom': 'MOUKOURI', 'prenom': 'Jean', 'montant': 1000.0,
+        })
+
+    def test_un_nom_seul_ne_saute_pas_d_etape(self):
+        self.assertFalse(forts({'nom': 'MOUKOURI', 'prenom': 'Jean'}))
+        self.assertTrue(forts({'nom': 'MOUKOURI', 'telephone': '061234567'}))
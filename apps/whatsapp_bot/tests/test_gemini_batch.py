@@ -0,0 +1,80 @@
+import threading
+import time
+from django.test import SimpleTestCase
+from apps.whatsapp_bot.gemini_batch import GeminiBatcher
+
+
+class ClientGemini:
+    """Faux client : enregistre les lots, peut bloquer ou échouer"""
+
+    def __init__(self, erreur=None):
+        self.lots = []
+        self.erreur = erreur
+        self.libere = threading.Event()
+        self.libere.set()
+
+    def __call__(self, textes):
+        self.lots.append(textes)
+        self.libere.wait(5)
+        if self.erreur:
+            raise self.erreur
+        return [{'intent': texte.upper()} for texte in textes]
+
+
+class GeminiBatcherTests(SimpleTestCase):
+    """Micro-lots de détections d'intention, fenêtres courtes"""
+
+    def _batcher(self, client, window_ms=50, max_items=10):
+        batcher = GeminiBatcher(client, window_ms=window_ms, max_items=max_items)
+        self.addCleanup(batcher._pool.shutdown)
+        return batcher
+
+    def test_lot_envoye_a_la_fin_de_la_fenetre(self):
+        client = ClientGemini()
+        batcher = self._batcher(client)
+        a, b = batcher.soumettre('a'), batcher.soumettre('b')
+
+        self.assertEqual((a.result(1), b.result(1)), ({'intent': 'A'}, {'intent': 'B'}))
+        self.assertEqual(client.lots, [['a', 'b']])
+
+    def test_lot_plein_envoye_sans_attendre_la_fenetre(self):
+        client = ClientGemini()
+        batcher = self._batcher(client, window_ms=10_000, max_items=2)
+        debut = time.monotonic()
+        futures = [batcher.soumettre(t) for t in ('a', 'b', 'c', 'd')]
+
+        self.assertEqual([f.result(1)['intent'] for f in futures], ['A', 'B', 'C', 'D'])
+        self.assertLess(time.monotonic() - debut, 1)
+        self.assertEqual(client.lots, [['a', 'b'], ['c', 'd']])
+
+    def test_appelant_parti_avant_l_envoi_retire_du_lot(self):
+        client = ClientGemini()
+        batcher = self._batcher(client, window_ms=200)
+        with self.assertLogs('apps.whatsapp_bot.gemini_batch', 'WARNING'):
+            self.assertIsNone(batcher.attendre('a', timeout=0.01))
+        self.assertEqual(batcher.soumettre('b').result(1), {'intent': 'B'})
+        self.assertEqual(client.lots, [['b']])
+
+    def test_appelant_parti_pendant_l_appel(self):
+        client = ClientGemini()
+        client.libere.clear()
+        batcher = self._batcher(client, window_ms=1)
+        with self.assertLogs('apps.whatsapp_bot.gemini_batch', 'WARNING'):
+            self.assertIsNone(batcher.attendre('a', timeout=0.1))
+
+        # L'appel en vol se termine normalement ; les appelants suivants sont servis
+        client.libere.set()
+        self.assertEqual(batcher.attendre('b', timeout=1), {'intent': 'B'})
+        self.assertEqual(client.lots, [['a'], ['b']])
+
+    def test_erreur_transmise_a_tous_les_appelants(self):
+        client = ClientGemini(erreur=RuntimeError('quota'))
+        batcher = self._batcher(client)
+        futures = [batcher.soumettre(t) for t in ('a', 'b', 'c')]
+
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, 'quota'):
+                future.result(1)
+        self.assertEqual(len(client.lots), 1)
+        with self.assertLogs('apps.whatsapp_bot.gemini_batch', 'ERROR'):
+            self.assertIsNone(batcher.attendre('d', timeout=1))
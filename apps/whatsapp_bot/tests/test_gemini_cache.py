@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase, TestCase
+from apps.whatsapp_bot.gemini_cache import GeminiCache, _generaliser, _instancier, gabarit
+from apps.whatsapp_bot.models import GeminiCacheEntry
+
+
+class GabaritTests(SimpleTestCase):
+
+    def test_normalisation_et_nombres(self):
+        self.assertEqual(
+            gabarit('Je veux souscrire BATELA à 50 000 F !'),
+            ('je veux souscrire batela a # f', [50000]),
+        )
+
+    def test_formats_de_montant(self):
+        self.assertEqual(gabarit('50.000 ou 1,5 ou 75000')[1], [50000, 1.5, 75000])
+
+
+class GeneralisationTests(SimpleTestCase):
+    """Montant Gemini ↔ référence au n-ième nombre du message"""
+
+    def test_montant_du_message_generalise(self):
+        reponse = {'intent': 'souscription', 'amount': 75000}
+        self.assertEqual(_generaliser(reponse, [10, 75000]), {'intent': 'souscription', 'amount': '#1'})
+        self.assertEqual(reponse['amount'], 75000)  # copie, l'original est intact
+
+    def test_montant_texte(self):
+        self.assertEqual(_generaliser({'amount': '50 000'}, [50000])['amount'], '#0')
+
+    def test_montant_absent_du_message_non_cachable(self):
+        self.assertIsNone(_generaliser({'amount': 100000}, [50000]))
+
+    def test_sans_montant(self):
+        self.assertEqual(_generaliser({'intent': 'menu', 'amount': None}, []), {'intent': 'menu', 'amount': None})
+
+    def test_instanciation(self):
+        generique = {'intent': 'souscription', 'amount': '#1'}
+        self.assertEqual(_instancier(generique, [3, 90000])['amount'], 90000)
+        self.assertEqual(generique['amount'], '#1')
+
+    def test_instanciation_impossible(self):
+        self.assertIsNone(_instancier({'amount': '#1'}, [90000]))
+
+    def test_aller_retour(self):
+        for nombres in ([50000], [2, 50000], [1.5]):
+            reponse = {'intent': 'x', 'amount': nombres[-1]}
+            self.assertEqual(_instancier(_generaliser(reponse, nombres), nombres), reponse)
+
+
+class GeminiCacheTests(TestCase):
+
+    def test_meme_gabarit_autre_montant(self):
+        cache = GeminiCache(ttl=60, maxsize=10)
+        cache.set('Batela 50000', 'v1', {'intent': 'souscription', 'amount': 50000}, tokens=120)
+
+        self.assertEqual(cache.get('batela 75 000', 'v1'), {'intent': 'souscription', 'amount': 75000})
+        self.assertIsNone(cache.get('batela 75000', 'v2'))
+        self.assertIsNone(cache.get('samba 75000', 'v1'))
+
+    def test_reponse_non_cachable(self):
+        cache = GeminiCache(ttl=60, maxsize=10)
+        cache.set('batela', 'v1', {'intent': 'souscription', 'amount': 50000}, tokens=120)
+        self.assertIsNone(cache.get('batela', 'v1'))
+
+    def test_persistance_entre_processus(self):
+        GeminiCache(ttl=60, maxsize=10, persist=True).set('batela 50000', 'v1', {'amount': 50000}, tokens=80)
+        self.assertEqual(GeminiCacheEntry.objects.get().tokens, 80)
+
+        # Nouveau processus : cache mémoire vide, entrée relue en base
+        self.assertEqual(GeminiCache(ttl=60, maxsize=10, persist=True).get('batela 60000', 'v1'), {'amount': 60000})
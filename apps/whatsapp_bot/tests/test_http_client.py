@@ -0,0 +1,37 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from django.test import SimpleTestCase
+from apps.whatsapp_bot import http_client
+
+
+class _Serveur(BaseHTTPRequestHandler):
+    cookies_recus = []
+
+    def do_GET(self):
+        self.cookies_recus.append(self.headers.get('Cookie'))
+        self.send_response(200)
+        self.send_header('Set-Cookie', 'sessionid=agent-a; Path=/')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionPartageeTests(SimpleTestCase):
+
+    def setUp(self):
+        _Serveur.cookies_recus = []
+        self.serveur = HTTPServer(('127.0.0.1', 0), _Serveur)
+        threading.Thread(target=self.serveur.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.serveur.server_port}/"
+
+    def tearDown(self):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+    def test_aucun_cookie_partage_entre_agents(self):
+        http_client.get(self.url, headers={'Authorization': 'Bearer agent-a'})
+        http_client.get(self.url, headers={'Authorization': 'Bearer agent-b'})
+        self.assertEqual(_Serveur.cookies_recus, [None, None])
+        self.assertEqual(len(http_client.get_session().cookies), 0)
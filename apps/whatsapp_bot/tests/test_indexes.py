@@ -0,0 +1,34 @@
+import uuid
+from datetime import timedelta
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from apps.whatsapp_bot.models import WhatsAppMessage, WhatsAppSession
+
+
+class PlansRequetesTests(TestCase):
+    """Chemins d'accès courants servis par un index, sans tri temporaire (SQLite)"""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Plans vérifiés sur SQLite ; voir benchmark_whatsapp_queries pour PostgreSQL")
+
+    def test_acces_indexes(self):
+        requetes = {
+            'sessions_actives': WhatsAppSession.objects.filter(is_active=True).order_by('-last_activity')[:20],
+            'admin_sessions': WhatsAppSession.objects.order_by('-last_activity')[:100],
+            'historique_session': WhatsAppMessage.objects.filter(session_id=uuid.uuid4()).order_by('-timestamp')[:50],
+            'admin_messages': WhatsAppMessage.objects.order_by('-timestamp')[:100],
+            'archivage_keyset': WhatsAppMessage.objects.filter(
+                timestamp__lt=timezone.now() - timedelta(days=90),
+            ).order_by('timestamp', 'id')[:1000],
+        }
+        for nom, queryset in requetes.items():
+            with self.subTest(nom):
+                plan = queryset.explain()
+                self.assertIn('USING INDEX wa_', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_historique_par_session_et_date(self):
+        plan = WhatsAppMessage.objects.filter(session_id=uuid.uuid4()).order_by('-timestamp')[:50].explain()
+        self.assertIn('wa_msg_session_ts_idx', plan)
@@ -0,0 +1,82 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from apps.whatsapp_bot import intents
+from apps.whatsapp_bot.intents import ClassifieurIntentions
+
+EXEMPLES = [
+    ('je veux souscrire un pass', 'SUBSCRIBE_PASS'),
+    ('inscrire un nouveau client', 'SUBSCRIBE_PASS'),
+    ('adhesion batela', 'SUBSCRIBE_PASS'),
+    ('mes commissions du mois', 'CHECK_COMMISSIONS'),
+    ('combien j ai gagne', 'CHECK_COMMISSIONS'),
+    ('voir mon solde', 'CHECK_COMMISSIONS'),
+    ('faire une simulation retraite', 'RUN_SIMULATION'),
+    ('calculer un devis', 'RUN_SIMULATION'),
+    ('simuler une pension', 'RUN_SIMULATION'),
+]
+
+
+class ReglesTests(SimpleTestCase):
+
+    def test_identifiants_et_mots_cles(self):
+        self.assertEqual(intents.par_regles('menu_2'), 'CHECK_COMMISSIONS')
+        self.assertEqual(intents.par_regles(intents.normaliser('Je veux SOUSCRIRE !')), 'SUBSCRIBE_PASS')
+        self.assertEqual(intents.par_regles(intents.normaliser('Un devis études')), 'RUN_SIMULATION')
+
+    def test_ambigu_ou_inconnu(self):
+        self.assertIsNone(intents.par_regles('simuler mes commissions'))
+        self.assertIsNone(intents.par_regles('bonjour'))
+
+
+class ClassifieurTests(SimpleTestCase):
+
+    def test_entrainement_et_prediction(self):
+        modele = ClassifieurIntentions.entrainer(EXEMPLES, epochs=40)
+        self.assertEqual(modele.predire('je souhaite souscrire')[0], 'SUBSCRIBE_PASS')
+        self.assertEqual(modele.predire('mes commissions')[0], 'CHECK_COMMISSIONS')
+        self.assertAlmostEqual(sum(modele.probabilites('simulation').values()), 1.0)
+
+    def test_serialisation(self):
+        modele = ClassifieurIntentions.entrainer(EXEMPLES, epochs=5)
+        relu = ClassifieurIntentions.from_dict(modele.to_dict(seuil=0))
+        for texte in ('souscrire', 'solde', 'devis'):
+            self.assertEqual(relu.predire(texte)[0], modele.predire(texte)[0])
+
+
+@override_settings(INTENT_LOG='', INTENT_LOCAL_THRESHOLD=0.8)
+class DetecterTests(SimpleTestCase):
+    """Règles → classifieur local → Gemini, dans cet ordre"""
+
+    def _modele(self, intent, confiance):
+        return mock.patch.object(intents, 'get_classifieur', return_value=mock.Mock(
+            predire=mock.Mock(return_value=(intent, confiance))
+        ))
+
+    def test_regle_avant_tout(self):
+        with self._modele('UNKNOWN', 0.99) as classifieur, mock.patch.object(intents, 'par_gemini') as gemini:
+            resultat = intents.detecter('commissions')
+        self.assertEqual((resultat['intent'], resultat['niveau']), ('CHECK_COMMISSIONS', 'regle'))
+        classifieur.assert_not_called()
+        gemini.assert_not_called()
+
+    def test_local_confiant_sans_gemini(self):
+        with self._modele('RUN_SIMULATION', 0.9), mock.patch.object(intents, 'par_gemini') as gemini:
+            resultat = intents.detecter('je voudrais voir ce que ça donne pour ma retraite')
+        self.assertEqual((resultat['intent'], resultat['niveau']), ('RUN_SIMULATION', 'local'))
+        gemini.assert_not_called()
+
+    def test_local_hesitant_gemini_consulte(self):
+        reponse = {'intent': 'SUBSCRIBE_PASS', 'confidence': 0.95, 'niveau': 'gemini'}
+        with self._modele('RUN_SIMULATION', 0.5), mock.patch.object(intents, 'par_gemini', return_value=reponse):
+            self.assertEqual(intents.detecter('bonjour je viens pour mon cousin')['niveau'], 'gemini')
+
+    def test_gemini_indisponible_avis_local(self):
+        with self._modele('RUN_SIMULATION', 0.5), mock.patch.object(intents, 'par_gemini', return_value=None):
+            resultat = intents.detecter('bonjour je viens pour mon cousin')
+        self.assertEqual((resultat['niveau'], resultat['confidence']), ('local', 0.5))
+        self.assertFalse(intents.confiant({**resultat, 'intent': 'UNKNOWN'}))
+
+    def test_sans_modele_ni_gemini(self):
+        with mock.patch.object(intents, 'get_classifieur', return_value=None):
+            resultat = intents.detecter('bonjour', gemini=False)
+        self.assertEqual((resultat['intent'], resultat['niveau']), ('UNKNOWN', 'aucun'))
@@ -0,0 +1,182 @@
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.whatsapp_bot import jobs, outbox
+from apps.whatsapp_bot.handlers import ConversationHandler
+from apps.whatsapp_bot.models import ConversationJob, OutboundMessage, WhatsAppMessage, WhatsAppSession
+
+
+class ClaimTests(TestCase):
+    """Réservation des jobs : ordre d'arrivée par session, sessions en parallèle"""
+
+    def setUp(self):
+        self.a = WhatsAppSession.objects.create(phone_number='+242060000001')
+        self.b = WhatsAppSession.objects.create(phone_number='+242060000002')
+
+    def test_un_seul_job_par_session_dans_l_ordre(self):
+        a1 = jobs.enqueue(self.a.pk, None, 'a1')
+        a2 = jobs.enqueue(self.a.pk, None, 'a2')
+        b1 = jobs.enqueue(self.b.pk, None, 'b1')
+
+        reserves = jobs.claim(10)
+        self.assertEqual([j.pk for j in reserves], [a1.pk, b1.pk])
+        self.assertTrue(all(j.status == 'running' and j.attempts == 1 for j in reserves))
+
+        # a2 attend la fin de a1, même si a1 est encore en cours
+        self.assertEqual(jobs.claim(10), [])
+
+        ConversationJob.objects.filter(pk=a1.pk).update(status='done')
+        self.assertEqual([j.pk for j in jobs.claim(10)], [a2.pk])
+
+    def test_limite_respectee(self):
+        for session in (self.a, self.b):
+            jobs.enqueue(session.pk, None, 'x')
+        self.assertEqual(len(jobs.claim(1)), 1)
+        self.assertEqual(jobs.claim(0), [])
+
+    def test_job_replanifie_non_eligible_avant_l_heure(self):
+        job = jobs.enqueue(self.a.pk, None, 'x')
+        ConversationJob.objects.filter(pk=job.pk).update(available_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(jobs.claim(10), [])
+
+    def test_job_replanifie_bloque_les_suivants_de_sa_session(self):
+        a1 = jobs.enqueue(self.a.pk, None, 'a1')
+        jobs.enqueue(self.a.pk, None, 'a2')
+        ConversationJob.objects.filter(pk=a1.pk).update(available_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(jobs.claim(10), [])
+
+    @override_settings(WHATSAPP_JOB_STALE_AFTER=60)
+    def test_requeue_stale(self):
+        job = jobs.enqueue(self.a.pk, None, 'x')
+        ConversationJob.objects.filter(pk=job.pk).update(
+            status='running', started_at=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual([j.pk for j in jobs.claim(10)], [job.pk])
+
+    @override_settings(WHATSAPP_JOB_STALE_AFTER=60)
+    def test_tour_long_avec_signe_de_vie_non_rejoue(self):
+        jobs.enqueue(self.a.pk, None, 'x')
+        job, = jobs.claim(1)
+        ConversationJob.objects.filter(pk=job.pk).update(
+            started_at=timezone.now() - timedelta(minutes=5),
+            heartbeat_at=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertEqual(jobs.heartbeat([job.pk]), 1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        self.assertEqual(ConversationJob.objects.get(pk=job.pk).status, 'running')
+
+    @override_settings(WHATSAPP_JOB_STALE_AFTER=60, WHATSAPP_OUTBOX_STALE_AFTER=600)
+    def test_boite_d_envoi_a_son_propre_delai(self):
+        message = OutboundMessage.objects.create(phone='+242060000001', payload={}, status='sending',
+                                                 started_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(outbox.requeue_stale(), 0)
+        self.assertEqual(OutboundMessage.objects.get(pk=message.pk).status, 'sending')
+
+
+@override_settings(WHATSAPP_JOB_MAX_ATTEMPTS=2, WHATSAPP_JOB_RETRY_BACKOFF=5)
+class ExecuteTests(TestCase):
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000003')
+        jobs.enqueue(self.session.pk, None, 'x')
+
+    def test_succes(self):
+        job, = jobs.claim(1)
+        with mock.patch.object(jobs, 'run_locked', return_value=3):
+            self.assertTrue(jobs.execute(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lock_wait_ms), ('done', 3))
+
+    def test_erreur_replanifiee_puis_abandonnee(self):
+        with mock.patch.object(jobs, 'run_locked', side_effect=RuntimeError('boom')):
+            job, = jobs.claim(1)
+            self.assertFalse(jobs.execute(job))
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'pending')
+            self.assertGreater(job.available_at, timezone.now())
+
+            ConversationJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+            job, = jobs.claim(1)
+            jobs.execute(job)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.last_error), ('failed', 2, 'boom'))
+
+
+class VerrouSessionTests(TestCase):
+
+    @override_settings(WHATSAPP_SESSION_LOCK_TIMEOUT=50)
+    def test_deuxieme_tour_attend_puis_abandonne(self):
+        session_id = uuid.uuid4()
+        resultat = []
+
+        def concurrent():
+            try:
+                with jobs.verrou_session(session_id):
+                    resultat.append('obtenu')
+            except jobs.SessionLockTimeout:
+                resultat.append('timeout')
+
+        with jobs.verrou_session(session_id):
+            fil = threading.Thread(target=concurrent)
+            fil.start()
+            fil.join()
+        self.assertEqual(resultat, ['timeout'])
+
+        with jobs.verrou_session(session_id):
+            pass
+
+    def test_sessions_differentes_independantes(self):
+        with jobs.verrou_session(uuid.uuid4()), jobs.verrou_session(uuid.uuid4()):
+            pass
+
+    def test_cle_advisory_lock_stable(self):
+        session_id = uuid.uuid4()
+        self.assertEqual(jobs._cle_verrou(session_id), jobs._cle_verrou(str(session_id)))
+
+
+class RunLockedTests(TestCase):
+    """Le tour tourne hors transaction ; ses écritures sont validées ensemble à la fin"""
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000004', current_state='MENU_PRINCIPAL')
+
+    def _tour(self, handler):
+        handler.session.current_state = 'COMMISSIONS_MENU'
+        handler.session.save()
+        handler.wa_service.send_text_message(handler.session.phone_number, 'réponse')
+
+    def test_ecritures_du_tour(self):
+        with mock.patch.object(ConversationHandler, '_dispatch', lambda h: self._tour(h)):
+            jobs.run_locked(self.session.pk, 'x')
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.current_state, self.session.version), ('COMMISSIONS_MENU', 1))
+        self.assertEqual(OutboundMessage.objects.filter(phone='+242060000004').count(), 1)
+
+    def test_rien_n_est_ecrit_si_le_tour_leve(self):
+        def tour(handler):
+            self._tour(handler)
+            raise RuntimeError('API NSIA')
+
+        with mock.patch.object(ConversationHandler, '_dispatch', tour):
+            with self.assertRaises(RuntimeError):
+                jobs.run_locked(self.session.pk, 'x')
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.current_state, self.session.version), ('MENU_PRINCIPAL', 0))
+        self.assertFalse(OutboundMessage.objects.exists())
+        self.assertFalse(WhatsAppMessage.objects.exists())
+
+    def test_actions_differees_apres_commit(self):
+        lancees = []
+
+        def tour(handler):
+            self._tour(handler)
+            handler._apres_commit.append(lambda: lancees.append(handler.session.version))
+
+        with mock.patch.object(ConversationHandler, '_dispatch', tour):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.run_locked(self.session.pk, 'x')
+        self.assertEqual(lancees, [1])
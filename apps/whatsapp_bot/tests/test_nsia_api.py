@@ -0,0 +1,265 @@
+import base64
+import json
+import threading
+import time
+from unittest import mock
+import requests
+from django.test import SimpleTestCase, override_settings
+from apps.whatsapp_bot import nsia_api
+from apps.whatsapp_bot.handlers import ConversationHandler
+from apps.whatsapp_bot.models import WhatsAppSession
+from apps.whatsapp_bot.nsia_api import CircuitBreaker, ServiceIndisponibleError, endpoint_key
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """États closed / open / half-open avec une horloge simulée"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patch = mock.patch('apps.whatsapp_bot.nsia_api.time', mock.Mock(monotonic=lambda: self.now))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30, max_concurrent=5, max_wait=0)
+
+    def _echec(self):
+        self.breaker.release(False, self.breaker.acquire())
+
+    def _ouvrir(self):
+        self._echec()
+        self._echec()
+        self.assertEqual(self.breaker.state, 'open')
+
+    def test_ouverture_apres_le_seuil(self):
+        self._echec()
+        self.assertEqual(self.breaker.state, 'closed')
+        self._echec()
+        self.assertEqual(self.breaker.state, 'open')
+
+        with self.assertRaises(ServiceIndisponibleError):
+            self.breaker.acquire()
+        self.assertEqual(self.breaker.snapshot()['rejected'], 1)
+
+    def test_succes_remet_le_compteur_a_zero(self):
+        self._echec()
+        self.breaker.release(True, self.breaker.acquire())
+        self._echec()
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_un_seul_essai_en_half_open(self):
+        self._ouvrir()
+        self.now += 30
+
+        essai = self.breaker.acquire()
+        self.assertIsNotNone(essai)
+        self.assertEqual(self.breaker.state, 'half_open')
+        with self.assertRaises(ServiceIndisponibleError):
+            self.breaker.acquire()
+
+        self.breaker.release(True, essai)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertIsNone(self.breaker.acquire())
+
+    def test_essai_en_echec_rouvre(self):
+        self._ouvrir()
+        self.now += 30
+
+        self.breaker.release(False, self.breaker.acquire())
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(ServiceIndisponibleError):
+            self.breaker.acquire()
+
+    def test_appel_anterieur_ne_libere_pas_l_essai(self):
+        slots = self.breaker._slots
+        essais = []
+
+        def attente(timeout):
+            # Pendant l'attente d'une place : ouverture, délai écoulé, départ de l'essai
+            self.breaker._slots = slots
+            self._ouvrir()
+            self.now += 30
+            essais.append(self.breaker.acquire())
+            return False
+
+        self.breaker._slots = mock.Mock(acquire=attente)
+        with self.assertRaises(ServiceIndisponibleError):
+            self.breaker.acquire()
+
+        # Le rejet de l'appel antérieur ne libère pas l'essai toujours en vol
+        self.assertIsNotNone(essais[0])
+        with self.assertRaises(ServiceIndisponibleError):
+            self.breaker.acquire()
+        self.breaker.release(True, essais[0])
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_cloisonnement(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30, max_concurrent=1, max_wait=0)
+        breaker.acquire()
+        with self.assertRaises(ServiceIndisponibleError):
+            breaker.acquire()
+        self.assertEqual(breaker.snapshot()['in_flight'], 1)
+
+        breaker.release(True)
+        breaker.acquire()
+
+
+class EndpointKeyTests(SimpleTestCase):
+
+    def test_identifiants_normalises(self):
+        self.assertEqual(
+            endpoint_key('https://api.example/api/v1/agents/42/stats/?x=1'),
+            '/api/v1/agents/{id}/stats/',
+        )
+
+
+@override_settings(NSIA_SLOW_CALL_THRESHOLD=0.01)
+class SlowCallNoticeTests(SimpleTestCase):
+    """Message d'attente envoyé par le thread minuteur pendant un appel lent"""
+
+    def setUp(self):
+        nsia_api._breakers.clear()
+        self.addCleanup(nsia_api._breakers.clear)
+
+    def _appel_lent(self, *args, **kwargs):
+        time.sleep(0.05)
+        return mock.Mock(status_code=200)
+
+    def test_appel_rendu_apres_l_envoi_du_message(self):
+        envois = []
+
+        def annoncer():
+            time.sleep(0.1)  # envoi Wassenger plus long que la fin de l'appel NSIA
+            envois.append(threading.current_thread())
+
+        with mock.patch.object(nsia_api.http_client, 'request', self._appel_lent):
+            with nsia_api.slow_call_notice(annoncer):
+                nsia_api.get('https://api.example/api/v1/simulations/')
+                self.assertEqual(len(envois), 1)
+                nsia_api.get('https://api.example/api/v1/simulations/')
+
+        # Une seule annonce par tour, depuis le thread minuteur
+        self.assertEqual(len(envois), 1)
+        self.assertIsNot(envois[0], threading.current_thread())
+
+    @override_settings(NSIA_COLD_START_TIMEOUT=60, HTTP_CONNECT_TIMEOUT=5, HTTP_READ_TIMEOUT=15)
+    def test_delai_long_jusqu_au_message_seulement(self):
+        delais = []
+
+        def appel(*args, timeout=None, **kwargs):
+            delais.append(timeout)
+            return self._appel_lent()
+
+        with mock.patch.object(nsia_api.http_client, 'request', appel):
+            with nsia_api.slow_call_notice(mock.Mock()):
+                nsia_api.get('https://api.example/api/v1/simulations/')
+                nsia_api.get('https://api.example/api/v1/agents/7/stats/')
+
+        # Le second appel du tour ne bloque pas le cloisonnement plus que HTTP_READ_TIMEOUT
+        self.assertEqual(delais, [(5, 60), None])
+
+    def test_appel_rapide_sans_message(self):
+        annoncer = mock.Mock()
+        with mock.patch.object(nsia_api.http_client, 'request', return_value=mock.Mock(status_code=200)):
+            with nsia_api.slow_call_notice(annoncer):
+                nsia_api.get('https://api.example/api/v1/simulations/')
+        annoncer.assert_not_called()
+
+
+def _jwt(exp):
+    charge = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode()).decode().rstrip('=')
+    return f"e30.{charge}.signature"
+
+
+class TokenManagerTests(SimpleTestCase):
+    """Renouvellement proactif, une seule fois pour tous les threads qui attendent"""
+
+    def setUp(self):
+        self.manager = nsia_api.TokenManager(margin=120)
+
+    def _session(self, exp, refresh='r1'):
+        return mock.Mock(phone_number='+242060000001', context={'access_token': _jwt(exp), 'refresh_token': refresh})
+
+    def _reponse(self, access, refresh='r2'):
+        return mock.Mock(status_code=200, json=lambda: {'access': access, 'refresh': refresh})
+
+    def test_jeton_valide_sans_appel(self):
+        session = self._session(time.time() + 3600)
+        with mock.patch.object(nsia_api, 'post') as post:
+            self.assertEqual(self.manager.access_token(session), session.context['access_token'])
+        post.assert_not_called()
+
+    def test_renouvele_avant_l_echeance(self):
+        session = self._session(time.time() + 60)
+        nouveau = _jwt(time.time() + 3600)
+        with mock.patch.object(nsia_api, 'post', return_value=self._reponse(nouveau)):
+            self.assertEqual(self.manager.access_token(session), nouveau)
+        self.assertEqual(session.context['refresh_token'], 'r2')
+        self.assertAlmostEqual(session.context['token_expires_at'], nsia_api.jwt_expiry(nouveau))
+
+    def test_un_seul_renouvellement_concurrent(self):
+        sessions = [self._session(time.time() - 10) for _ in range(5)]
+        nouveau = _jwt(time.time() + 3600)
+
+        def renouveler(*args, **kwargs):
+            time.sleep(0.05)
+            return self._reponse(nouveau)
+
+        with mock.patch.object(nsia_api, 'post', side_effect=renouveler) as post:
+            threads = [threading.Thread(target=self.manager.access_token, args=(s,)) for s in sessions]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        post.assert_called_once()
+        self.assertTrue(all(s.context['access_token'] == nouveau for s in sessions))
+
+    def test_jeton_rejete_force_un_nouveau_renouvellement(self):
+        session = self._session(time.time() - 10)
+        premier, second = _jwt(time.time() + 3600), _jwt(time.time() + 7200)
+        with mock.patch.object(nsia_api, 'post', side_effect=[self._reponse(premier, 'r1'), self._reponse(second)]):
+            self.assertEqual(self.manager.access_token(session), premier)
+            # 401 sur `premier` : le résultat partagé ne doit pas être resservi
+            self.assertEqual(self.manager.access_token(session, force=True), second)
+
+    def test_refus_du_renouvellement(self):
+        session = self._session(time.time() - 10)
+        with mock.patch.object(nsia_api, 'post', return_value=mock.Mock(status_code=401)):
+            with self.assertRaises(nsia_api.TokenExpiredError), self.assertLogs('apps.whatsapp_bot.nsia_api', 'WARNING'):
+                self.manager.access_token(session)
+
+    def test_verrou_obtenu_conserve_malgre_les_autres_jetons(self):
+        verrou = self.manager._lock_for('r1')  # obtenu, pas encore acquis
+        for i in range(1500):
+            with self.manager._lock_for(f'autre-{i}'):
+                pass
+        self.assertIs(self.manager._lock_for('r1'), verrou)
+        # Les verrous que plus personne n'attend sont libérés
+        self.assertEqual(len(self.manager._locks), 1)
+
+    def test_sans_refresh_token(self):
+        session = self._session(time.time() - 10, refresh=None)
+        with self.assertRaises(nsia_api.TokenExpiredError):
+            self.manager.access_token(session)
+
+
+class ConnexionApiTests(SimpleTestCase):
+    """Erreurs réseau du login : enveloppées par nsia_api, distinguées par leur cause"""
+
+    def setUp(self):
+        nsia_api._breakers.clear()
+        self.addCleanup(nsia_api._breakers.clear)
+        self.handler = ConversationHandler(WhatsAppSession(phone_number='+242060000001'), 'AG-001:secret')
+        self.handler.wa_service = mock.Mock()
+
+    def _login(self, erreur):
+        with mock.patch.object(nsia_api.http_client, 'request', side_effect=erreur):
+            self.handler._connexion_api('AG-001', 'secret')
+        return self.handler.wa_service.send_text_message.call_args.args[1]
+
+    def test_timeout(self):
+        with self.assertLogs('apps.whatsapp_bot.handlers', 'ERROR'):
+            self.assertIn('trop de temps', self._login(requests.exceptions.ReadTimeout('lent')))
+
+    def test_connexion_impossible(self):
+        with self.assertLogs('apps.whatsapp_bot.handlers', 'WARNING'):
+            self.assertIn('momentanément indisponible', self._login(requests.exceptions.ConnectionError('refus')))
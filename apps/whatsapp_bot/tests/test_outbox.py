@@ -0,0 +1,31 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from apps.whatsapp_bot.outbox import TokenBucket
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Horloge simulée : monotonic() avance de la durée de chaque sleep()"""
+
+    def setUp(self):
+        self.now = 1000.0
+        horloge = mock.Mock(monotonic=lambda: self.now, sleep=self._dormir)
+        patch = mock.patch('apps.whatsapp_bot.outbox.time', horloge)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _dormir(self, secondes):
+        self.now += secondes
+
+    def test_rafale_puis_debit(self):
+        bucket = TokenBucket(rate=4, capacity=2)
+        self.assertEqual([bucket.acquire(), bucket.acquire()], [0.0, 0.0])
+        self.assertEqual(bucket.acquire(), 0.25)
+        self.assertEqual(bucket.acquire(), 0.25)
+
+    def test_recharge_plafonnee(self):
+        bucket = TokenBucket(rate=4, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+        self.now += 60
+        self.assertEqual([bucket.acquire(), bucket.acquire()], [0.0, 0.0])
+        self.assertGreater(bucket.acquire(), 0)
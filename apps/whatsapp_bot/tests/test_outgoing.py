@@ -0,0 +1,79 @@
+from unittest import mock
+from django.test import TestCase
+from apps.whatsapp_bot import outbox
+from apps.whatsapp_bot.models import OutboundMessage, PendingDeliveryStatus, WhatsAppMessage, WhatsAppSession
+from apps.whatsapp_bot.outgoing import capture_outgoing, update_delivery_statuses
+
+
+class OutgoingBufferTests(TestCase):
+    """Messages sortants d'un tour : deux INSERT groupés, ordre d'envoi conservé"""
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000040')
+
+    def test_ordre_par_numero(self):
+        with capture_outgoing(self.session) as buffer:
+            for texte, phone in (('a1', 'A'), ('b1', 'B'), ('a2', 'A'), ('b2', 'B'), ('a3', 'A')):
+                buffer.enqueue({'phone': phone, 'message': texte})
+            self.assertFalse(WhatsAppMessage.objects.exists())  # rien avant la fin du tour
+
+        for phone, attendus in (('A', ['a1', 'a2', 'a3']), ('B', ['b1', 'b2'])):
+            envois = OutboundMessage.objects.filter(phone=phone).order_by('id')
+            self.assertEqual([e.payload['message'] for e in envois], attendus)
+            self.assertEqual([e.message.content['message'] for e in envois], attendus)
+        self.assertEqual(set(WhatsAppMessage.objects.values_list('delivery_status', flat=True)), {'queued'})
+
+    def test_tour_sans_message(self):
+        with self.assertNumQueries(0):
+            with capture_outgoing(self.session):
+                pass
+
+
+class StatutsLivraisonTests(TestCase):
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000041')
+
+    def _message(self, whatsapp_message_id=None, delivery_status='sent'):
+        return WhatsAppMessage.objects.create(
+            session=self.session, direction='outgoing', message_type='text', content={},
+            whatsapp_message_id=whatsapp_message_id, delivery_status=delivery_status,
+        )
+
+    def _statut(self, message):
+        return WhatsAppMessage.objects.get(pk=message.pk).delivery_status
+
+    def test_statut_ne_regresse_jamais(self):
+        message = self._message('wamid-1')
+        self.assertEqual(update_delivery_statuses([('wamid-1', 'read')]), 1)
+        self.assertEqual(update_delivery_statuses([('wamid-1', 'delivered')]), 0)
+        self.assertEqual(self._statut(message), 'read')
+
+    def test_une_requete_par_statut(self):
+        messages = [self._message(f'wamid-{i}') for i in range(4)]
+        with self.assertNumQueries(3):  # lecture des identifiants connus + 2 UPDATE
+            update_delivery_statuses([(f'wamid-{i}', 'delivered' if i % 2 else 'read') for i in range(4)])
+        self.assertEqual([self._statut(m) for m in messages], ['read', 'delivered', 'read', 'delivered'])
+
+    def test_accuse_avant_l_identifiant_applique_apres_l_envoi(self):
+        message = self._message(delivery_status='queued')
+        envoi = OutboundMessage.objects.create(phone='+242060000041', payload={}, message=message, attempts=1)
+
+        # Accusé Wassenger reçu pendant que deliver() traite encore la réponse
+        self.assertEqual(update_delivery_statuses([('wamid-9', 'delivered')]), 0)
+        self.assertTrue(PendingDeliveryStatus.objects.filter(whatsapp_message_id='wamid-9').exists())
+
+        service = mock.Mock(**{'_send_request.return_value': {'success': True, 'message_id': 'wamid-9'}})
+        with mock.patch.object(outbox, 'get_whatsapp_service', return_value=service):
+            self.assertTrue(outbox.deliver(envoi))
+
+        self.assertEqual(self._statut(message), 'delivered')
+        self.assertFalse(PendingDeliveryStatus.objects.exists())
+
+    def test_accuse_avant_l_historisation_d_un_envoi_direct(self):
+        update_delivery_statuses([('wamid-7', 'read')])
+        with capture_outgoing(self.session) as buffer:
+            buffer.record({'phone': '+242060000041', 'message': 'x'}, {'success': True, 'message_id': 'wamid-7'})
+
+        self.assertEqual(WhatsAppMessage.objects.get(whatsapp_message_id='wamid-7').delivery_status, 'read')
+        self.assertFalse(PendingDeliveryStatus.objects.exists())
@@ -0,0 +1,122 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from apps.whatsapp_bot.handlers import ConversationHandler
+from apps.whatsapp_bot.models import SessionConflictError, WhatsAppSession
+from apps.whatsapp_bot.session_cache import SessionCache
+
+
+class UnitOfWorkTests(TestCase):
+    """Écritures regroupées et concurrence optimiste sur la version"""
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000001')
+
+    def test_un_seul_update_des_colonnes_modifiees(self):
+        with CaptureQueriesContext(connection) as requetes:
+            with self.session.unit_of_work():
+                self.session.update_context('produit', 'retraite')
+                self.session.update_context('etape', 2)
+                self.session.current_state = 'SIMULATION'
+                self.session.save()
+
+        updates = [q['sql'] for q in requetes.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"is_active"', updates[0])
+        self.assertEqual(self.session.version, 1)
+
+        relue = WhatsAppSession.objects.get(pk=self.session.pk)
+        self.assertEqual(relue.context, {'produit': 'retraite', 'etape': 2})
+        self.assertEqual(relue.version, 1)
+
+    def test_ecriture_externe_detectee(self):
+        WhatsAppSession.objects.get(pk=self.session.pk).save()  # admin, archivage…
+
+        with self.assertRaises(SessionConflictError):
+            with self.session.unit_of_work():
+                self.session.update_context('etape', 1)
+
+        self.assertEqual(WhatsAppSession.objects.get(pk=self.session.pk).context, {})
+
+    def test_differe_rien_n_est_ecrit_si_le_tour_echoue(self):
+        with self.assertRaises(RuntimeError):
+            with self.session.unit_of_work(differe=True):
+                self.session.update_context('etape', 1)
+                raise RuntimeError
+
+        self.session.flush()
+        self.assertEqual(WhatsAppSession.objects.get(pk=self.session.pk).version, 0)
+
+    def test_differe_ecrit_au_flush(self):
+        with self.session.unit_of_work(differe=True):
+            self.session.update_context('etape', 1)
+        self.assertEqual(WhatsAppSession.objects.get(pk=self.session.pk).version, 0)
+
+        self.session.flush()
+        relue = WhatsAppSession.objects.get(pk=self.session.pk)
+        self.assertEqual((relue.version, relue.context), (1, {'etape': 1}))
+
+
+class TourUnSeulUpdateTests(TestCase):
+    """Un message entrant = au plus un UPDATE de session, quel que soit le parcours"""
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000002', current_state='PASS_COLLECTE_NOM')
+
+    def _updates_session(self, tour):
+        handler = ConversationHandler(self.session, 'Moukouri')
+        handler.wa_service = mock.Mock()
+        with mock.patch.object(ConversationHandler, '_dispatch', lambda h: tour(h.session)):
+            with CaptureQueriesContext(connection) as requetes:
+                handler.handle()
+        return [q['sql'] for q in requetes.captured_queries
+                if q['sql'].startswith('UPDATE "whatsapp_sessions"')]
+
+    def test_plusieurs_mises_a_jour_du_contexte(self):
+        def tour(session):
+            session.update_context('nom', 'MOUKOURI')
+            session.update_context('prenom', 'Jean')
+            session.reset_context()
+            session.update_context('produit', 'BATELA')
+            session.current_state = 'PASS_COLLECTE_PRENOM'
+            session.save()
+
+        self.assertEqual(len(self._updates_session(tour)), 1)
+        relue = WhatsAppSession.objects.get(pk=self.session.pk)
+        self.assertEqual((relue.current_state, relue.context), ('PASS_COLLECTE_PRENOM', {'produit': 'BATELA'}))
+
+    def test_tour_sans_modification(self):
+        self.assertEqual(self._updates_session(lambda session: session.get_context('nom')), [])
+
+
+class SessionCacheTests(TestCase):
+    """Instantanés validés par la colonne version"""
+
+    def setUp(self):
+        self.cache = SessionCache(ttl=60, maxsize=10)
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000001', context={'etape': 1})
+        self.cache.remember(self.session)
+
+    def test_instantane_a_jour_une_seule_requete(self):
+        with self.assertNumQueries(1):
+            session = self.cache.load(self.session.pk)
+        self.assertEqual(session.context, {'etape': 1})
+
+        # Copie indépendante : le tour ne modifie pas l'instantané
+        session.context['etape'] = 9
+        self.assertEqual(self.cache.load(self.session.pk).context, {'etape': 1})
+
+    def test_instantane_perime_relu(self):
+        WhatsAppSession.objects.filter(pk=self.session.pk).update(context={'etape': 5}, version=3)
+
+        with self.assertNumQueries(2):
+            session = self.cache.load(self.session.pk)
+        self.assertEqual((session.version, session.context), (3, {'etape': 5}))
+
+    def test_session_supprimee(self):
+        WhatsAppSession.objects.filter(pk=self.session.pk).delete()
+
+        with self.assertRaises(WhatsAppSession.DoesNotExist):
+            self.cache.load(self.session.pk)
+        self.assertIsNone(self.cache._snapshots.get(f'snap:{self.session.pk}'))
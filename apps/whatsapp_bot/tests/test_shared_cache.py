@@ -0,0 +1,82 @@
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from apps.borne_auth import directory
+from apps.borne_auth.directory import AgentDirectory, get_agent_directory
+from apps.whatsapp_bot.dedup import get_dedup_filter
+from apps.whatsapp_bot.session_cache import get_session_cache
+from core.shared_cache import cache_partage_actif, verifier_caches_partages
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DATABASE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'zoe_cache'}}
+
+
+class CachePartageTests(SimpleTestCase):
+    """Les modes *_SHARED sont refusés tant que le cache Django est propre au processus"""
+
+    def setUp(self):
+        for factory in (get_agent_directory, get_dedup_filter, get_session_cache):
+            factory.cache_clear()
+            self.addCleanup(factory.cache_clear)
+
+    @override_settings(CACHES=LOCMEM, AGENT_CACHE_SHARED=True)
+    def test_locmem_refuse_avec_avertissement(self):
+        with self.assertLogs('core.shared_cache', 'WARNING'):
+            self.assertFalse(cache_partage_actif('AGENT_CACHE_SHARED'))
+        with self.assertLogs('core.shared_cache', 'WARNING'):
+            self.assertFalse(get_agent_directory().shared)
+
+    @override_settings(CACHES=LOCMEM, WHATSAPP_DEDUP_SHARED=True)
+    def test_dedup_locmem_reste_local(self):
+        with self.assertLogs('core.shared_cache', 'WARNING'):
+            self.assertFalse(get_dedup_filter().shared)
+
+    @override_settings(CACHES=DATABASE, WHATSAPP_DEDUP_SHARED=True)
+    def test_dedup_backend_partage(self):
+        self.assertTrue(get_dedup_filter().shared)
+
+    @override_settings(CACHES=LOCMEM, SESSION_CACHE_SHARED=True)
+    def test_sessions_locmem_restent_locales(self):
+        with self.assertLogs('core.shared_cache', 'WARNING'):
+            self.assertFalse(get_session_cache().shared)
+
+    @override_settings(CACHES=DATABASE, AGENT_CACHE_SHARED=True)
+    def test_backend_partage_accepte(self):
+        self.assertTrue(cache_partage_actif('AGENT_CACHE_SHARED'))
+        self.assertTrue(get_agent_directory().shared)
+
+    @override_settings(CACHES=LOCMEM, AGENT_CACHE_SHARED=False)
+    def test_mode_non_demande_sans_avertissement(self):
+        with self.assertNoLogs('core.shared_cache', 'WARNING'):
+            self.assertFalse(cache_partage_actif('AGENT_CACHE_SHARED'))
+
+    @override_settings(CACHES=LOCMEM, AGENT_CACHE_SHARED=True, WHATSAPP_DEDUP_SHARED=True,
+                       SESSION_CACHE_SHARED=True)
+    def test_controle_de_demarrage(self):
+        with self.assertLogs('core.shared_cache', 'WARNING'):
+            self.assertEqual(
+                verifier_caches_partages(),
+                ['AGENT_CACHE_SHARED', 'WHATSAPP_DEDUP_SHARED', 'SESSION_CACHE_SHARED'],
+            )
+
+
+class AnnuairePartageIndisponibleTests(SimpleTestCase):
+    """Une panne du cache partagé dégrade l'annuaire au niveau local, sans lever"""
+
+    def setUp(self):
+        panne = mock.Mock(**{f'{m}.side_effect': ConnectionError('redis down') for m in ('get', 'set', 'delete')})
+        patch = mock.patch.object(directory, 'shared_cache', panne)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.annuaire = AgentDirectory(maxsize=10, ttl=60, shared=True)
+
+    def test_invalidation(self):
+        self.annuaire._local.set('id:7', 'agent')
+        with self.assertLogs('apps.borne_auth.directory', 'WARNING'):
+            self.annuaire.invalidate(agent_id=7, matricule='AG-007', telephone='061234567')
+        self.assertIsNone(self.annuaire._local.get('id:7'))
+
+    def test_lecture_ecriture(self):
+        agent = mock.Mock(pk=7, matricule='AG-007', telephone='061234567')
+        with self.assertLogs('apps.borne_auth.directory', 'WARNING'):
+            self.assertIs(self.annuaire._lookup('id:7', lambda: agent), agent)
+        self.assertIs(self.annuaire._local.get('mat:AG-007'), agent)
@@ -0,0 +1,99 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from apps.whatsapp_bot import simulateur
+from apps.whatsapp_bot.handlers import ConversationHandler
+from apps.whatsapp_bot.models import WhatsAppSession
+from apps.whatsapp_bot.simulation_cache import get_simulation_cache
+
+# Données collectées par le formulaire du simulateur (tous produits confondus)
+DONNEES = {
+    'nom': 'Mabiala', 'prenom': 'Grace', 'telephone': '060000001',
+    'age': 35, 'prime_mensuelle': 50000, 'capital_deces': 1000000, 'duree': 15,
+    'pension_mensuelle': 100000, 'duree_couverture': 10,
+    'age_parent': 35, 'age_enfant': 3, 'rente_annuelle': 600000, 'duree_paiement': 12, 'duree_service': 5,
+}
+
+
+@override_settings(SIMULATEUR_MODE='remote')
+class GrilleApresSimulationTests(TestCase):
+    """'grille duree=…' reprend les paramètres de la dernière simulation, quel que soit le produit"""
+
+    def setUp(self):
+        get_simulation_cache.cache_clear()
+        self.addCleanup(get_simulation_cache.cache_clear)
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000001')
+        patch = mock.patch.object(
+            simulateur, 'calculer',
+            side_effect=lambda produit, parametres, auth: ({'resultats_simulation': {'prime_totale': 1}}, None),
+        )
+        self.calculer = patch.start()
+        self.addCleanup(patch.stop)
+
+    def _handler(self, texte):
+        handler = ConversationHandler(self.session, texte)
+        handler.wa_service = mock.Mock()
+        handler.auth = mock.Mock(**{'post.return_value.status_code': 500})
+        handler.afficher_resultats_simulation = mock.Mock()
+        return handler
+
+    def test_grille_apres_chaque_produit(self):
+        for produit in ('retraite', 'pension_securite', 'pension_confort', 'pension_renfort', 'prevoyance', 'etudes'):
+            with self.subTest(produit=produit):
+                self.session.context = {'simulateur_produit': produit, 'simulateur_data': dict(DONNEES)}
+                self._handler('').calculer_simulation()
+                self.assertEqual(self.session.get_context('grille_base')['produit'], produit)
+
+                handler = self._handler('grille duree=10,15,20')
+                handler.handle_grille()
+
+                texte = handler.wa_service.send_text_message.call_args.args[1]
+                self.assertIn(f"GRILLE {produit.upper()}", texte)
+                self.assertNotIn('❌', texte)
+
+    def test_parametres_fixes_conserves(self):
+        parametres, axes = simulateur.normaliser(
+            'pension_confort',
+            {'type_pension': 'pension_confort', 'periodicite': 'Mensuelle', 'age': 35,
+             'montant_mensuel_pension': 100000, 'duree_couverture': 10},
+            {'duree': [10, 15]},
+        )
+        self.assertEqual(parametres['type_pension'], 'pension_confort')
+        self.assertEqual(axes, {'duree_couverture': [10, 15]})
+
+    def test_parametre_fixe_d_un_autre_produit_refuse(self):
+        with self.assertRaises(simulateur.GrilleError):
+            simulateur.normaliser('prevoyance', {'periodicite': 'Mensuelle'}, {'age': [30, 40]})
+
+
+class CalculerGrilleTests(TestCase):
+    BASE = {'age': 35, 'prime': 50000, 'capital': 1000000}
+
+    def setUp(self):
+        get_simulation_cache.cache_clear()
+        self.addCleanup(get_simulation_cache.cache_clear)
+
+    @override_settings(SIMULATEUR_MODE='local')
+    @mock.patch.object(simulateur.actuariat, 'produits_valides', return_value=frozenset({'retraite'}))
+    def test_local_un_seul_appel_au_moteur(self, _):
+        with mock.patch.object(simulateur, 'calculer') as calculer, \
+                mock.patch.object(simulateur.actuariat, 'calculer_lot', wraps=simulateur.actuariat.calculer_lot) as lot:
+            grille = simulateur.calculer_grille('retraite', self.BASE, {'duree': [10, 15, 20]}, None)
+
+        lot.assert_called_once()
+        calculer.assert_not_called()
+        self.assertTrue(all(ligne['valeur'] for ligne in grille['lignes']))
+
+    @override_settings(SIMULATEUR_MODE='remote')
+    def test_distant_jeton_resolu_une_fois(self):
+        auth = mock.Mock()
+        with mock.patch.object(simulateur, 'calculer', return_value=({'resultats_simulation': {}}, None)) as calculer:
+            simulateur.calculer_grille('retraite', self.BASE, {'duree': [10, 15], 'age': [30, 40]}, auth)
+
+        auth.frozen.assert_called_once_with()
+        self.assertEqual(calculer.call_count, 4)
+        self.assertTrue(all(c.args[2] is auth.frozen.return_value for c in calculer.call_args_list))
+
+    @override_settings(SIMULATEUR_GRILLE_CONCURRENCY=8, NSIA_BULKHEAD_SIZE=6)
+    def test_concurrence_sous_le_cloisonnement(self):
+        self.assertEqual(simulateur._concurrence_grille(25), 3)
+        self.assertEqual(simulateur._concurrence_grille(2), 2)
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+from apps.whatsapp_bot.simulation_cache import SimulationCache, canonical_key
+
+
+class SimulationCacheTests(SimpleTestCase):
+
+    def test_cle_canonique(self):
+        self.assertEqual(
+            canonical_key('retraite', {'age': '35', 'prime': 50000.0, 'periodicite': ' Mensuelle'}),
+            canonical_key('retraite', {'periodicite': 'Mensuelle', 'prime': '50 000', 'age': 35}),
+        )
+        self.assertNotEqual(canonical_key('retraite', {'age': 35}), canonical_key('retraite', {'age': 35.5}))
+        self.assertNotEqual(canonical_key('retraite', {'age': 35}), canonical_key('prevoyance', {'age': 35}))
+
+    def test_copies_independantes(self):
+        cache = SimulationCache(maxsize=10, ttl=60, tarif_version='2025-01')
+        resultat = {'resultats_simulation': {'capital_garanti': 1}}
+        cache.set('retraite', {'age': 35}, resultat)
+        resultat['resultats_simulation']['capital_garanti'] = 2
+
+        lu = cache.get('retraite', {'age': '35'})
+        lu['numero'] = 'SIM-1'
+        self.assertEqual(cache.get('retraite', {'age': 35}), {'resultats_simulation': {'capital_garanti': 1}})
+
+    def test_version_de_tarif_dans_la_cle(self):
+        ancien = SimulationCache(maxsize=10, ttl=60, tarif_version='2025-01')
+        nouveau = SimulationCache(maxsize=10, ttl=60, tarif_version='2025-02')
+        self.assertNotEqual(ancien._key('retraite', {'age': 35}), nouveau._key('retraite', {'age': 35}))
@@ -0,0 +1,78 @@
+import time
+from unittest import mock
+from django.test import TestCase, override_settings
+from apps.whatsapp_bot import intents, speculation
+from apps.whatsapp_bot.handlers import ConversationHandler
+from apps.whatsapp_bot.models import WhatsAppSession
+
+COMMISSIONS = {'intent': 'CHECK_COMMISSIONS', 'confidence': 0.95, 'niveau': 'gemini'}
+
+
+def _router(handler, resultat):
+    handler.session.current_state = 'COMMISSIONS_MENU'
+    return True
+
+
+class AppliquerTests(TestCase):
+    """Le résultat spéculatif n'est appliqué que sur une session inchangée"""
+
+    def setUp(self):
+        self.session = WhatsAppSession.objects.create(phone_number='+242060000030', current_state='MENU_PRINCIPAL')
+        patch = mock.patch.object(ConversationHandler, 'router_intention', autospec=True, side_effect=_router)
+        self.router = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_session_inchangee_intention_appliquee(self):
+        self.assertTrue(speculation.appliquer(self.session.pk, self.session.version, 'mes gains', COMMISSIONS))
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.current_state, self.session.version), ('COMMISSIONS_MENU', 1))
+
+    def test_nouvelle_version_resultat_ignore(self):
+        version = self.session.version
+        self.session.save()  # l'agent a envoyé un autre message entre-temps
+
+        self.assertFalse(speculation.appliquer(self.session.pk, version, 'mes gains', COMMISSIONS))
+        self.router.assert_not_called()
+
+    def test_etat_change_resultat_ignore(self):
+        WhatsAppSession.objects.filter(pk=self.session.pk).update(current_state='PASS_CHOIX_PRODUIT')
+
+        self.assertFalse(speculation.appliquer(self.session.pk, self.session.version, 'mes gains', COMMISSIONS))
+        self.router.assert_not_called()
+        self.assertEqual(WhatsAppSession.objects.get(pk=self.session.pk).current_state, 'PASS_CHOIX_PRODUIT')
+
+
+@override_settings(INTENT_AI_DEADLINE=0.05, INTENT_MIN_CONFIDENCE=0.7)
+class DelaiTests(TestCase):
+    """Passé INTENT_AI_DEADLINE, le tour déterministe déjà envoyé reste la réponse"""
+
+    def setUp(self):
+        patch = mock.patch.object(speculation, 'appliquer', return_value=True)
+        self.appliquer = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_reponse_a_temps_appliquee(self):
+        with mock.patch.object(intents, 'par_gemini', return_value=COMMISSIONS) as par_gemini:
+            speculation._speculer('sid', 3, 'mes gains', time.monotonic())
+        self.assertLessEqual(par_gemini.call_args.kwargs['timeout'], 0.05)
+        self.appliquer.assert_called_once_with('sid', 3, 'mes gains', COMMISSIONS)
+
+    def test_reponse_tardive_ignoree(self):
+        def lent(texte, timeout):
+            time.sleep(0.1)
+            return COMMISSIONS
+
+        with mock.patch.object(intents, 'par_gemini', side_effect=lent):
+            speculation._speculer('sid', 3, 'mes gains', time.monotonic())
+        self.appliquer.assert_not_called()
+
+    def test_budget_epuise_avant_le_depart(self):
+        with mock.patch.object(intents, 'par_gemini') as par_gemini:
+            speculation._speculer('sid', 3, 'mes gains', time.monotonic() - 1)
+        par_gemini.assert_not_called()
+        self.appliquer.assert_not_called()
+
+    def test_intention_peu_sure_ignoree(self):
+        with mock.patch.object(intents, 'par_gemini', return_value={**COMMISSIONS, 'confidence': 0.3}):
+            speculation._speculer('sid', 3, 'mes gains', time.monotonic())
+        self.appliquer.assert_not_called()
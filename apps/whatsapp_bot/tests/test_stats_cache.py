@@ -0,0 +1,59 @@
+import threading
+from unittest import mock
+from django.test import SimpleTestCase
+from apps.whatsapp_bot.stats_cache import AgentStatsCache
+
+
+class AgentStatsCacheTests(SimpleTestCase):
+    """Stale-while-revalidate avec une horloge simulée"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patch = mock.patch('core.lru.time', mock.Mock(monotonic=lambda: self.now))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = AgentStatsCache(ttl=60, stale_ttl=600)
+        self.addCleanup(self.cache._pool.shutdown)
+        self.auth = mock.Mock()
+        self.auth.frozen.return_value = self.auth
+        self.auth.get.return_value = mock.Mock(status_code=200, json=lambda: {'data': {'commissions': 1}})
+
+    def test_frais_puis_sert_depuis_le_cache(self):
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 1})
+        self.now += 59
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 1})
+        self.assertEqual(self.auth.get.call_count, 1)
+
+    def test_perime_servi_et_rafraichi_une_seule_fois(self):
+        self.cache.get(7, self.auth)
+        self.now += 120
+
+        libere = threading.Event()
+        nouveau = mock.Mock(status_code=200, json=lambda: {'data': {'commissions': 2}})
+        self.auth.get.side_effect = lambda *a, **k: libere.wait(5) and nouveau
+
+        # Valeur périmée servie sans attendre ; un seul rafraîchissement en vol
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 1})
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 1})
+        libere.set()
+        self.cache._pool.shutdown(wait=True)
+
+        self.assertEqual(self.auth.get.call_count, 2)
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 2})
+
+    def test_expire_appel_synchrone(self):
+        self.cache.get(7, self.auth)
+        self.now += 661
+        self.auth.get.return_value = mock.Mock(status_code=200, json=lambda: {'data': {'commissions': 3}})
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 3})
+
+    def test_amorce_partielle_rafraichie(self):
+        self.cache.seed(7, {'commissions': 0})
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 0, 'partiel': True})
+        self.cache._pool.shutdown(wait=True)
+        self.assertEqual(self.cache.get(7, self.auth), {'commissions': 1})
+
+    def test_api_en_erreur(self):
+        self.auth.get.return_value = mock.Mock(status_code=503)
+        with self.assertLogs('apps.whatsapp_bot.stats_cache', 'WARNING'):
+            self.assertIsNone(self.cache.get(7, self.auth))
@@ -0,0 +1,71 @@
+import io
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from apps.whatsapp_bot.models import WhatsAppMessage, WhatsAppSession
+from apps.whatsapp_bot.storage import compact_content, compress_payload, decompress_payload, incoming_storage
+
+WEBHOOK = {
+    'event': 'message:in:new',
+    'data': {
+        'id': 'wamid-1',
+        'type': 'list',
+        'body': 'Souscrire PASS',
+        'fromNumber': '+242060000050',
+        'timestamp': 1760000000,
+        'listReply': {'id': 'menu_1', 'title': 'Souscrire PASS'},
+        'meta': {'notifyName': 'Jean', 'isGroup': False},
+    },
+}
+
+
+class CompactageTests(SimpleTestCase):
+
+    def test_champs_utiles_seulement(self):
+        self.assertEqual(compact_content('Souscrire PASS', WEBHOOK['data']), {
+            'text': 'Souscrire PASS', 'type': 'list', 'list_reply_id': 'menu_1', 'timestamp': 1760000000,
+        })
+
+    def test_payload_brut_aller_retour(self):
+        self.assertEqual(decompress_payload(compress_payload(WEBHOOK)), WEBHOOK)
+        self.assertIsNone(decompress_payload(None))
+
+    @override_settings(WHATSAPP_MESSAGE_STORAGE='compact', WHATSAPP_STORE_RAW_PAYLOAD=True)
+    def test_stockage_entrant(self):
+        content, raw = incoming_storage('Souscrire PASS', WEBHOOK['data'], WEBHOOK)
+        self.assertNotIn('raw', content)
+        self.assertEqual(decompress_payload(raw), WEBHOOK)
+
+
+class CompactWhatsappMessagesTests(TestCase):
+    """Reprise des messages stockés en mode 'full'"""
+
+    def setUp(self):
+        session = WhatsAppSession.objects.create(phone_number='+242060000050')
+        self.message = WhatsAppMessage.objects.create(
+            session=session, direction='incoming', message_type='list',
+            content={'text': 'Souscrire PASS', 'raw': WEBHOOK},
+        )
+
+    def _compacter(self, *args):
+        call_command('compact_whatsapp_messages', *args, stdout=io.StringIO())
+        return WhatsAppMessage.objects.get(pk=self.message.pk)
+
+    def test_aller_retour(self):
+        message = self._compacter('--keep-raw')
+        self.assertEqual(message.content, compact_content('Souscrire PASS', WEBHOOK['data']))
+        self.assertEqual(decompress_payload(message.raw_payload), WEBHOOK)
+
+    def test_relance_idempotente(self):
+        premier = self._compacter('--keep-raw')
+        sortie = io.StringIO()
+        call_command('compact_whatsapp_messages', '--keep-raw', stdout=sortie)
+
+        second = WhatsAppMessage.objects.get(pk=self.message.pk)
+        self.assertIn('0 message(s) compacté(s)', sortie.getvalue())
+        self.assertEqual((second.content, bytes(second.raw_payload)), (premier.content, bytes(premier.raw_payload)))
+
+    def test_sans_payload_brut(self):
+        self.assertIsNone(self._compacter().raw_payload)
+
+    def test_dry_run(self):
+        self.assertEqual(self._compacter('--dry-run').content, {'text': 'Souscrire PASS', 'raw': WEBHOOK})
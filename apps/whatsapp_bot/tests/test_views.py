@@ -0,0 +1,72 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from apps.borne_auth.directory import get_agent_directory
+from apps.whatsapp_bot import simulateur
+from apps.whatsapp_bot.models import WhatsAppSession
+from apps.whatsapp_bot.simulation_cache import get_simulation_cache
+
+
+class MetricsViewTests(TestCase):
+    url = '/api/whatsapp/metrics/'
+
+    def test_anonyme_refuse(self):
+        self.assertIn(self.client.get(self.url).status_code, (401, 403))
+
+    @override_settings(WHATSAPP_METRICS_TOKEN='secret')
+    def test_jeton(self):
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertIn(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer autre').status_code, (401, 403))
+
+    @override_settings(WHATSAPP_METRICS_TOKEN='')
+    def test_jeton_vide_jamais_accepte(self):
+        self.assertIn(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ').status_code, (401, 403))
+
+    def test_staff(self):
+        User.objects.create_user('ops', password='x', is_staff=True)
+        self.client.login(username='ops', password='x')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class SessionsActivesTests(TestCase):
+    url = '/api/whatsapp/sessions/'
+
+    def setUp(self):
+        WhatsAppSession.objects.create(phone_number='+242060000020')
+        WhatsAppSession.objects.create(phone_number='+242060000021', agent_id=7)
+
+    def _numeros(self, **params):
+        return [s['phone_number'] for s in self.client.get(self.url, params).json()['sessions']]
+
+    def test_matricule_inconnu_ne_renvoie_rien(self):
+        with mock.patch.object(get_agent_directory(), 'get_by_matricule', return_value=None):
+            self.assertEqual(self._numeros(agent='AG-INCONNU'), [])
+
+    def test_matricule_connu(self):
+        with mock.patch.object(get_agent_directory(), 'get_by_matricule', return_value=mock.Mock(pk=7)), \
+                mock.patch.object(get_agent_directory(), 'get_many', return_value={}):
+            self.assertEqual(self._numeros(agent='AG-2025-007'), ['+242060000021'])
+
+
+class SimulationGrilleTests(TestCase):
+    url = '/api/whatsapp/simulations/grille/'
+    corps = {'produit': 'retraite', 'parametres': {'age': 35, 'prime': 50000, 'capital': 1000000},
+             'variations': {'duree': '10-20:5'}}
+
+    def test_anonyme_refuse(self):
+        with mock.patch.object(simulateur, 'calculer_grille') as calculer_grille:
+            reponse = self.client.post(self.url, self.corps, content_type='application/json')
+        self.assertIn(reponse.status_code, (401, 403))
+        calculer_grille.assert_not_called()
+
+    @override_settings(SIMULATEUR_MODE='local')
+    @mock.patch.object(simulateur.actuariat, 'produits_valides', return_value=frozenset({'retraite'}))
+    def test_utilisateur_authentifie(self, _):
+        get_simulation_cache.cache_clear()
+        self.addCleanup(get_simulation_cache.cache_clear)
+        User.objects.create_user('commercial', password='x')
+        self.client.login(username='commercial', password='x')
+
+        reponse = self.client.post(self.url, self.corps, content_type='application/json')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.json()['lignes']), 3)
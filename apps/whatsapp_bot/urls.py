@@ -8,4 +8,6 @@ urlpatterns = [
     path('webhook/', views.whatsapp_webhook, name='webhook'),
     path('reset-session/', views.reset_session, name='reset_session'),
     path('sessions/', views.sessions_actives, name='sessions_actives'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('simulations/grille/', views.simulation_grille, name='simulation_grille'),
 ]
\ No newline at end of file
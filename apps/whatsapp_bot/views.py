@@ -3,16 +3,40 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.db import transaction, IntegrityError
+from django.db.models import Q
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, BasePermission, IsAuthenticated
+import base64
+import hmac
 import json
 import hashlib
 import logging
+import uuid
+from datetime import datetime
+from apps.borne_auth.directory import get_agent_directory
 from .models import WhatsAppSession, WhatsAppMessage
-from .handlers import ConversationHandler
+from .dedup import get_dedup_filter
+from .metrics import metrics
+from .nsia_api import ServiceIndisponibleError, StaticAuth
+from .session_cache import get_session_cache
+from . import jobs, outbox, simulateur
+from .outgoing import update_delivery_statuses
+from .storage import incoming_storage
 
 logger = logging.getLogger(__name__)
 
+
+class IsStaffOrMetricsToken(BasePermission):
+    """Compte staff (admin Django) ou jeton WHATSAPP_METRICS_TOKEN en Bearer"""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        attendu = settings.WHATSAPP_METRICS_TOKEN
+        auth = request.headers.get('Authorization', '')
+        return bool(attendu) and auth.startswith('Bearer ') and hmac.compare_digest(auth[7:], attendu)
+
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def whatsapp_webhook(request):
@@ -43,6 +67,10 @@ def whatsapp_webhook(request):
             event = data.get('event')
             msg_data = data.get('data', {})
 
+            # Statuts de livraison des messages sortants (un objet ou une liste)
+            if event and event.startswith('message:out:'):
+                return _handle_delivery_status(event, msg_data)
+
             # On ne traite que les nouveaux messages entrants
             if event != 'message:in:new':
                 return JsonResponse({'status': 'ignored', 'event': event})
@@ -80,29 +108,43 @@ def whatsapp_webhook(request):
                 raw = f"{phone_number}:{text}:{msg_data.get('timestamp', '')}"
                 message_id = f"gen_{hashlib.sha256(raw.encode()).hexdigest()[:20]}"
 
+            # Doublon connu (relivraison Wassenger) : écarté avant tout accès base
+            dedup = get_dedup_filter()
+            if not dedup.claim(message_id):
+                logger.info(f"⏭️ Message {message_id} déjà reçu (filtre), on ignore.")
+                return JsonResponse({'status': 'ok', 'detail': 'already processed'})
+
+            content, raw_payload = incoming_storage(text, msg_data, data)
+
             # Idempotence atomique : créer le message dans une transaction.
             # La contrainte unique sur whatsapp_message_id empêche les doublons.
+            sessions = get_session_cache()
+            session_id = sessions.session_id(phone_number)
             try:
-                with transaction.atomic():
-                    session, created = WhatsAppSession.objects.get_or_create(
-                        phone_number=phone_number,
-                        defaults={'is_active': True}
-                    )
-
-                    WhatsAppMessage.objects.create(
-                        session=session,
-                        whatsapp_message_id=message_id,
-                        direction='incoming',
-                        message_type=message_type or 'chat',
-                        content={'text': text, 'raw': data}
-                    )
+                try:
+                    session_id = _store_incoming(session_id, phone_number, message_id, message_type, content, raw_payload, text)
+                except IntegrityError:
+                    if session_id is None:
+                        raise
+                    # Id en cache d'une session supprimée depuis : on repasse par la base
+                    sessions.forget(phone=phone_number, session_id=session_id)
+                    session_id = _store_incoming(None, phone_number, message_id, message_type, content, raw_payload, text)
             except IntegrityError:
+                metrics.incr('webhook.duplicates_db')
                 logger.info(f"⏭️ Message {message_id} déjà traité, on ignore.")
                 return JsonResponse({'status': 'ok', 'detail': 'already processed'})
+            except Exception:
+                # Rien n'a été enregistré : la relivraison doit pouvoir passer
+                dedup.release(message_id)
+                raise
+            sessions.remember_id(phone_number, session_id)
+
+            if settings.WHATSAPP_ASYNC_HANDLER:
+                # Accusé de réception immédiat, le worker traitera le message
+                return JsonResponse({'status': 'queued'})
 
-            # Traiter avec le handler
-            handler = ConversationHandler(session, text)
-            handler.handle()
+            # Traitement inline (sous verrou de session)
+            jobs.run_locked(session_id, text)
 
             return JsonResponse({'status': 'ok'})
 
@@ -111,6 +153,53 @@ def whatsapp_webhook(request):
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
+def _store_incoming(session_id, phone_number, message_id, message_type, content, raw_payload, text):
+    """
+    Enregistre le message entrant (et son job) ; retourne l'id de session.
+
+    Avec un id en cache, aucune lecture de la session : la réactivation
+    d'une session archivée est faite par le handler, sous verrou.
+    """
+    with transaction.atomic():
+        if session_id is None:
+            session, _ = WhatsAppSession.objects.get_or_create(
+                phone_number=phone_number,
+                defaults={'is_active': True}
+            )
+            session_id = session.pk
+
+        message = WhatsAppMessage.objects.create(
+            session_id=session_id,
+            whatsapp_message_id=message_id,
+            direction='incoming',
+            message_type=message_type or 'chat',
+            content=content,
+            raw_payload=raw_payload,
+        )
+
+        # Le job est créé dans la même transaction que le message :
+        # un message enregistré est forcément mis en file.
+        if settings.WHATSAPP_ASYNC_HANDLER:
+            jobs.enqueue(session_id, message, text)
+    return session_id
+
+
+def _handle_delivery_status(event, msg_data):
+    """Met à jour en masse le statut de livraison des messages sortants"""
+    items = msg_data if isinstance(msg_data, list) else [msg_data]
+    suffixe = event.rsplit(':', 1)[-1]
+
+    updates = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        statut = 'failed' if suffixe == 'failed' else (item.get('ack') or item.get('status'))
+        updates.append((item.get('id'), statut))
+
+    count = update_delivery_statuses(updates)
+    return JsonResponse({'status': 'ok', 'updated': count})
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def reset_session(request):
@@ -154,27 +243,137 @@ def reset_session(request):
         }, status=500)
 
 
+def _encode_cursor(session):
+    raw = f"{session.last_activity.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    last_activity, session_id = raw.split('|', 1)
+    return datetime.fromisoformat(last_activity), uuid.UUID(session_id)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def sessions_actives(request):
     """
-    Liste des sessions WhatsApp actives
+    Liste paginée des sessions WhatsApp actives (plus récentes d'abord)
     
-    GET /api/whatsapp/sessions/
+    GET /api/whatsapp/sessions/?state=MENU_PRINCIPAL&agent=AG-2025-001&limit=20&cursor=...
+    
+    - state : filtre sur current_state
+    - agent : id ou matricule de l'agent
+    - cursor : valeur next_cursor de la page précédente
     """
-    sessions = WhatsAppSession.objects.filter(is_active=True).order_by('-last_activity')[:20]
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'error': 'limit invalide'}, status=400)
+    
+    directory = get_agent_directory()
+    sessions = (
+        WhatsAppSession.objects.filter(is_active=True)
+        .only('id', 'phone_number', 'current_state', 'last_activity', 'agent_id')
+        .order_by('-last_activity', '-id')
+    )
+    
+    state = request.GET.get('state')
+    if state:
+        sessions = sessions.filter(current_state=state)
+    
+    agent = request.GET.get('agent')
+    if agent:
+        if not agent.isdigit():
+            found = directory.get_by_matricule(agent)
+            # Matricule inconnu : aucune session (et non les sessions sans agent)
+            agent = found.pk if found else None
+        sessions = sessions.filter(agent_id=agent) if agent is not None else sessions.none()
+    
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            last_activity, session_id = _decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({'error': 'cursor invalide'}, status=400)
+        sessions = sessions.filter(
+            Q(last_activity__lt=last_activity) | Q(last_activity=last_activity, id__lt=session_id)
+        )
+    
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    page = list(sessions[:limit + 1])
+    has_next = len(page) > limit
+    page = page[:limit]
+    
+    # Noms des agents via l'annuaire en cache (pas de jointure sur la table partagée)
+    agents = directory.get_many(s.agent_id for s in page)
     
     data = [
         {
             'phone_number': s.phone_number,
-            'agent': s.agent.nom_complet if s.agent else None,
+            'agent': agents[s.agent_id].nom_complet if s.agent_id in agents else None,
             'current_state': s.current_state,
             'last_activity': s.last_activity.isoformat()
         }
-        for s in sessions
+        for s in page
     ]
     
     return JsonResponse({
         'total': len(data),
-        'sessions': data
-    })
\ No newline at end of file
+        'sessions': data,
+        'next_cursor': _encode_cursor(page[-1]) if has_next else None,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsStaffOrMetricsToken])
+def metrics_view(request):
+    """
+    Métriques du chatbot (file de traitement + compteurs du processus)
+
+    GET /api/whatsapp/metrics/
+    Authorization: Bearer <WHATSAPP_METRICS_TOKEN>  (ou session admin staff)
+    """
+    return JsonResponse({
+        'queue': jobs.queue_stats(),
+        'outbox': outbox.outbox_stats(),
+        'process': metrics.snapshot(),
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def simulation_grille(request):
+    """
+    Calcule une grille de simulations (jusqu'à deux paramètres variables)
+    
+    POST /api/whatsapp/simulations/grille/
+    Utilisateur Django authentifié (session) ;
+    Authorization: Bearer <jeton agent>  (transmis au calculateur distant)
+    {
+        "produit": "retraite",
+        "parametres": {"prime": 50000, "capital": 1000000},
+        "variations": {"age": [30, 35, 40], "duree": "10-20:5"}
+    }
+    """
+    produit = request.data.get('produit')
+    if not produit:
+        return JsonResponse({'error': 'produit requis'}, status=400)
+    
+    auth = request.headers.get('Authorization', '')
+    token = auth[7:] if auth.startswith('Bearer ') else None
+    
+    try:
+        variations = {
+            cle: simulateur.parse_valeurs(str(valeurs)) if not isinstance(valeurs, list) else valeurs
+            for cle, valeurs in (request.data.get('variations') or {}).items()
+        }
+        grille = simulateur.calculer_grille(
+            produit, request.data.get('parametres') or {}, variations, StaticAuth(token)
+        )
+    except simulateur.GrilleError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except ServiceIndisponibleError as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    
+    return JsonResponse({**grille, 'tableau': simulateur.formater_grille(grille)})
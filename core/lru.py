@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache LRU borné avec expiration (thread-safe, en mémoire du processus).
+
+    Chaque entrée garde sa date d'écriture : peek() permet aux appelants
+    de distinguer une valeur fraîche d'une valeur périmée.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self.peek(key)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def peek(self, key):
+        """Retourne (valeur, âge en secondes) ou None si absente/expirée"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2], now - entry[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now, now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """Écrit seulement si la clé est absente ou expirée ; retourne True si écrite"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._data[key] = (now, now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0,
+        }
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import dj_database_url
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -99,6 +99,25 @@ WASSENGER_DEVICE_ID = config('WASSENGER_DEVICE_ID', '')
 # Gemini AI
 GEMINI_API_KEY = config('GEMINI_API_KEY', default=None)
 
+# Détection d'intention au menu : règles → modèle local → Gemini (manage.py train_intents)
+INTENT_MODEL_PATH = config('INTENT_MODEL_PATH', default='')  # JSON produit par train_intents
+INTENT_LOG = config('INTENT_LOG', default='')  # JSONL des exemples étiquetés (règles / Gemini)
+INTENT_LOCAL_THRESHOLD = config('INTENT_LOCAL_THRESHOLD', default=0.85, cast=float)  # en dessous : Gemini
+INTENT_MIN_CONFIDENCE = config('INTENT_MIN_CONFIDENCE', default=0.7, cast=float)  # en dessous : menu
+INTENT_AI_DEADLINE = config('INTENT_AI_DEADLINE', default=4.0, cast=float)  # secondes : routage Gemini spéculatif
+INTENT_SPECULATION_WORKERS = config('INTENT_SPECULATION_WORKERS', default=4, cast=int)
+
+# Cache des réponses Gemini par message normalisé (nombres remplacés par #)
+GEMINI_CACHE_TTL = config('GEMINI_CACHE_TTL', default=7 * 86400, cast=int)  # secondes
+GEMINI_CACHE_MAXSIZE = config('GEMINI_CACHE_MAXSIZE', default=10000, cast=int)
+GEMINI_CACHE_PERSIST = config('GEMINI_CACHE_PERSIST', default=False, cast=bool)  # table whatsapp_gemini_cache
+
+# Regroupement des détections d'intention concurrentes en une requête Gemini
+GEMINI_BATCH_ENABLED = config('GEMINI_BATCH_ENABLED', default=False, cast=bool)
+GEMINI_BATCH_WINDOW_MS = config('GEMINI_BATCH_WINDOW_MS', default=50, cast=int)  # attente max avant envoi du lot
+GEMINI_BATCH_MAX = config('GEMINI_BATCH_MAX', default=16, cast=int)  # messages par requête
+GEMINI_BATCH_TIMEOUT = config('GEMINI_BATCH_TIMEOUT', default=12, cast=float)  # attente max d'un appelant (secondes)
+
 # WhatsApp Tokens
 WHATSAPP_VERIFY_TOKEN = config('WHATSAPP_VERIFY_TOKEN', 'nsia_whatsapp_2025')
 
@@ -108,3 +127,113 @@ CSRF_TRUSTED_ORIGINS = config('CSRF_TRUSTED_ORIGINS', default='https://*.onrende
 
 # Chiffrement
 FIELD_ENCRYPTION_KEY = config('FIELD_ENCRYPTION_KEY', default='dK_qYv7n9m5z8x2c1v3b4n5m6k7l8j9h_g6f5d4s3a2q1=')
+
+# File de traitement asynchrone des messages entrants
+# (False = traitement inline dans le webhook, utile en développement)
+WHATSAPP_ASYNC_HANDLER = config('WHATSAPP_ASYNC_HANDLER', default=True, cast=bool)
+WHATSAPP_WORKER_CONCURRENCY = config('WHATSAPP_WORKER_CONCURRENCY', default=4, cast=int)
+WHATSAPP_WORKER_POLL_INTERVAL = config('WHATSAPP_WORKER_POLL_INTERVAL', default=0.5, cast=float)
+WHATSAPP_JOB_MAX_ATTEMPTS = config('WHATSAPP_JOB_MAX_ATTEMPTS', default=3, cast=int)
+WHATSAPP_JOB_RETRY_BACKOFF = config('WHATSAPP_JOB_RETRY_BACKOFF', default=5, cast=int)  # secondes, doublé à chaque essai
+WHATSAPP_JOB_HEARTBEAT = config('WHATSAPP_JOB_HEARTBEAT', default=30, cast=int)  # secondes entre deux signes de vie d'un job en cours
+WHATSAPP_JOB_STALE_AFTER = config('WHATSAPP_JOB_STALE_AFTER', default=300, cast=int)  # job 'running' sans signe de vie = abandonné
+WHATSAPP_SESSION_LOCK_TIMEOUT = config('WHATSAPP_SESSION_LOCK_TIMEOUT', default=5000, cast=int)  # ms, attente du verrou de session
+# Jeton d'accès à /api/whatsapp/metrics/ (Authorization: Bearer ...) ; vide = staff uniquement
+WHATSAPP_METRICS_TOKEN = config('WHATSAPP_METRICS_TOKEN', default='')
+
+# Client HTTP partagé (Wassenger, API NSIA, Gemini)
+HTTP_POOL_CONNECTIONS = config('HTTP_POOL_CONNECTIONS', default=10, cast=int)  # hôtes gardés en pool
+HTTP_POOL_MAXSIZE = config('HTTP_POOL_MAXSIZE', default=10, cast=int)  # connexions keep-alive par hôte
+HTTP_CONNECT_TIMEOUT = config('HTTP_CONNECT_TIMEOUT', default=5, cast=float)
+HTTP_READ_TIMEOUT = config('HTTP_READ_TIMEOUT', default=15, cast=float)
+
+# Boîte d'envoi Wassenger (dispatcher: python manage.py run_whatsapp_dispatcher)
+WHATSAPP_OUTBOX_ENABLED = config('WHATSAPP_OUTBOX_ENABLED', default=True, cast=bool)
+WHATSAPP_DISPATCHER_CONCURRENCY = config('WHATSAPP_DISPATCHER_CONCURRENCY', default=4, cast=int)
+WHATSAPP_OUTBOX_MAX_ATTEMPTS = config('WHATSAPP_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+WHATSAPP_OUTBOX_RETRY_BACKOFF = config('WHATSAPP_OUTBOX_RETRY_BACKOFF', default=2, cast=int)  # secondes, doublé à chaque essai
+# Un envoi = attente du débit + un appel Wassenger borné par HTTP_CONNECT/READ_TIMEOUT
+WHATSAPP_OUTBOX_STALE_AFTER = config('WHATSAPP_OUTBOX_STALE_AFTER', default=120, cast=int)  # envoi 'sending' abandonné
+WASSENGER_RATE_LIMIT = config('WASSENGER_RATE_LIMIT', default=5, cast=float)  # messages/seconde par device
+WASSENGER_RATE_BURST = config('WASSENGER_RATE_BURST', default=10, cast=int)
+
+# Stockage des messages entrants : 'compact' (champs utiles uniquement) ou 'full' (payload brut en JSON)
+WHATSAPP_MESSAGE_STORAGE = config('WHATSAPP_MESSAGE_STORAGE', default='compact')
+WHATSAPP_STORE_RAW_PAYLOAD = config('WHATSAPP_STORE_RAW_PAYLOAD', default=False, cast=bool)  # payload brut compressé (zlib)
+
+# Rétention / archivage (python manage.py archive_whatsapp_data)
+WHATSAPP_MESSAGE_RETENTION_DAYS = config('WHATSAPP_MESSAGE_RETENTION_DAYS', default=90, cast=int)
+WHATSAPP_RAW_PAYLOAD_RETENTION_DAYS = config('WHATSAPP_RAW_PAYLOAD_RETENTION_DAYS', default=7, cast=int)
+WHATSAPP_SESSION_IDLE_DAYS = config('WHATSAPP_SESSION_IDLE_DAYS', default=30, cast=int)
+
+# Cache Django (LocMem par défaut ; ex. CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+# et CACHE_LOCATION=zoe_cache après `manage.py createcachetable` pour un cache partagé entre workers).
+# Les réglages *_SHARED sont ignorés (avec avertissement au démarrage) tant que le cache est LocMem.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='zoe'),
+    }
+}
+
+# Filtre anti-doublons du webhook (relivraisons Wassenger) devant la contrainte unique
+WHATSAPP_DEDUP_WINDOW = config('WHATSAPP_DEDUP_WINDOW', default=3600, cast=int)  # secondes
+WHATSAPP_DEDUP_MAXSIZE = config('WHATSAPP_DEDUP_MAXSIZE', default=50000, cast=int)
+WHATSAPP_DEDUP_SHARED = config('WHATSAPP_DEDUP_SHARED', default=False, cast=bool)  # via le cache Django
+
+# Cache chaud des sessions (numéro → session, instantanés validés par version sous verrou)
+SESSION_CACHE_TTL = config('SESSION_CACHE_TTL', default=1800, cast=int)  # secondes
+SESSION_CACHE_MAXSIZE = config('SESSION_CACHE_MAXSIZE', default=10000, cast=int)
+SESSION_CACHE_SHARED = config('SESSION_CACHE_SHARED', default=False, cast=bool)  # niveau 2 : cache Django
+
+# Annuaire des agents (cache de la table partagée 'agents')
+AGENT_CACHE_TTL = config('AGENT_CACHE_TTL', default=300, cast=int)  # secondes
+AGENT_CACHE_MAXSIZE = config('AGENT_CACHE_MAXSIZE', default=5000, cast=int)
+AGENT_CACHE_SHARED = config('AGENT_CACHE_SHARED', default=False, cast=bool)  # niveau 2 : cache Django
+# Protection de l'API NSIA : disjoncteur + appels simultanés bornés, par endpoint
+NSIA_BREAKER_FAILURES = config('NSIA_BREAKER_FAILURES', default=5, cast=int)  # échecs consécutifs avant ouverture
+NSIA_BREAKER_RESET_TIMEOUT = config('NSIA_BREAKER_RESET_TIMEOUT', default=30, cast=int)  # secondes avant essai
+NSIA_BULKHEAD_SIZE = config('NSIA_BULKHEAD_SIZE', default=8, cast=int)
+NSIA_BULKHEAD_WAIT = config('NSIA_BULKHEAD_WAIT', default=0.5, cast=float)  # attente max d'une place (secondes)
+
+# API NSIA hébergée sur Render (offre gratuite) : démarrage à froid
+NSIA_SLOW_CALL_THRESHOLD = config('NSIA_SLOW_CALL_THRESHOLD', default=3.0, cast=float)  # secondes avant '⏳ Un instant…'
+NSIA_COLD_START_TIMEOUT = config('NSIA_COLD_START_TIMEOUT', default=60, cast=int)  # délai de lecture pendant un tour
+NSIA_WARMUP_URL = config('NSIA_WARMUP_URL', default=f"{API_BASE_URL}/")
+NSIA_WARMUP_INTERVAL = config('NSIA_WARMUP_INTERVAL', default=600, cast=int)  # secondes (mode --loop)
+NSIA_WARMUP_HOURS = config('NSIA_WARMUP_HOURS', default='6-20')  # heures locales (TIME_ZONE)
+NSIA_WARMUP_DAYS = config('NSIA_WARMUP_DAYS', default='0-5')  # 0 = lundi
+
+# Jetons API NSIA : renouvellement via le refresh token avant expiration
+NSIA_TOKEN_REFRESH_PATH = config('NSIA_TOKEN_REFRESH_PATH', default='/api/v1/auth/token/refresh/')
+NSIA_TOKEN_REFRESH_MARGIN = config('NSIA_TOKEN_REFRESH_MARGIN', default=120, cast=int)  # secondes avant expiration
+NSIA_TOKEN_DEFAULT_TTL = config('NSIA_TOKEN_DEFAULT_TTL', default=86400, cast=int)  # si ni 'exp' ni expires_in
+
+# Cache des statistiques / commissions agents (stale-while-revalidate)
+AGENT_STATS_CACHE_TTL = config('AGENT_STATS_CACHE_TTL', default=120, cast=int)  # fraîcheur (secondes)
+AGENT_STATS_STALE_TTL = config('AGENT_STATS_STALE_TTL', default=3600, cast=int)  # servi périmé pendant le rafraîchissement
+# Cache des résultats du simulateur (à incrémenter à chaque changement de tarif)
+SIMULATEUR_TARIF_VERSION = config('SIMULATEUR_TARIF_VERSION', default='2025-01')
+SIMULATION_CACHE_TTL = config('SIMULATION_CACHE_TTL', default=86400, cast=int)
+SIMULATION_CACHE_MAXSIZE = config('SIMULATION_CACHE_MAXSIZE', default=10000, cast=int)
+# Moteur tarifaire du simulateur : remote (API NSIA), local, ou shadow (API servie + comparaison locale).
+# 'local' ne s'applique qu'aux produits validés contre SIMULATEUR_REFERENCE (sinon : shadow).
+SIMULATEUR_MODE = config('SIMULATEUR_MODE', default='remote')
+SIMULATEUR_TAUX_TECHNIQUE = config('SIMULATEUR_TAUX_TECHNIQUE', default=0.035, cast=float)
+SIMULATEUR_TABLE_MORTALITE = config('SIMULATEUR_TABLE_MORTALITE', default='')  # CSV age,lx ou age,qx
+# Table théorique non calibrée, utilisée sans SIMULATEUR_TABLE_MORTALITE
+SIMULATEUR_GOMPERTZ_MAKEHAM = config('SIMULATEUR_GOMPERTZ_MAKEHAM', default='0.0007,0.00005,1.095', cast=Csv(float))
+SIMULATEUR_CHARGEMENT_GESTION = config('SIMULATEUR_CHARGEMENT_GESTION', default=0.05, cast=float)
+SIMULATEUR_CHARGEMENT_EPARGNE = config('SIMULATEUR_CHARGEMENT_EPARGNE', default=0.03, cast=float)
+SIMULATEUR_FRAIS_ACCESSOIRES = config('SIMULATEUR_FRAIS_ACCESSOIRES', default=1000, cast=float)
+# Réponses enregistrées du calculateur (export_simulateur_reference) validant le mode local
+SIMULATEUR_REFERENCE = config(
+    'SIMULATEUR_REFERENCE', default=str(BASE_DIR / 'apps' / 'whatsapp_bot' / 'referentiel' / 'calculateur_nsia.json')
+)
+SIMULATEUR_REFERENCE_MIN_CAS = config('SIMULATEUR_REFERENCE_MIN_CAS', default=5, cast=int)  # par produit
+SIMULATEUR_SHADOW_TOLERANCE = config('SIMULATEUR_SHADOW_TOLERANCE', default=0.01, cast=float)  # écart relatif
+# Grille de simulations (commande 'grille' / API)
+SIMULATEUR_GRILLE_MAX = config('SIMULATEUR_GRILLE_MAX', default=25, cast=int)  # cases par grille
+SIMULATEUR_GRILLE_CONCURRENCY = config('SIMULATEUR_GRILLE_CONCURRENCY', default=4, cast=int)  # appels API parallèles (≤ NSIA_BULKHEAD_SIZE // 2)
+# Connexion par mot de passe seul quand le numéro WhatsApp correspond au téléphone d'un agent
+WHATSAPP_PHONE_AUTO_LOGIN = config('WHATSAPP_PHONE_AUTO_LOGIN', default=False, cast=bool)
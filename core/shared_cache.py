@@ -0,0 +1,43 @@
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Backends dont le contenu reste propre au processus (ou n'est pas stocké du tout)
+_BACKENDS_LOCAUX = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Réglages *_SHARED qui s'appuient sur le cache Django par défaut
+REGLAGES_PARTAGES = (
+    'AGENT_CACHE_SHARED',
+    'WHATSAPP_DEDUP_SHARED',
+    'SESSION_CACHE_SHARED',
+)
+
+
+def cache_partage_actif(reglage):
+    """
+    Indique si le mode partagé demandé par `reglage` peut réellement être utilisé.
+
+    Un cache LocMem (ou Dummy) n'est pas vu par les autres workers : le mode
+    partagé y serait silencieusement inopérant. Il est alors refusé avec un
+    avertissement et le composant retombe sur son seul cache local.
+    """
+    if not getattr(settings, reglage, False):
+        return False
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in _BACKENDS_LOCAUX:
+        logger.warning(
+            f"⚠️ {reglage} ignoré : le cache Django ({backend}) est propre au processus, "
+            f"configurez CACHE_BACKEND avec un backend partagé (DatabaseCache, Redis…)"
+        )
+        return False
+    return True
+
+
+def verifier_caches_partages():
+    """Contrôle de démarrage : signale chaque *_SHARED inopérant avec le cache configuré"""
+    return [reglage for reglage in REGLAGES_PARTAGES if getattr(settings, reglage, False)
+            and not cache_partage_actif(reglage)]